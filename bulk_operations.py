@@ -0,0 +1,512 @@
+"""
+Helpers for bulk operations: reading input files and batching RPC calls.
+"""
+import csv
+import hashlib
+import itertools
+import json
+import os
+import time
+import xmlrpc.client
+from config import BULK_CONFIG
+from connection import track_writes
+from request_scheduler import PRIORITY_BULK, request_priority
+
+def iter_file_records(path):
+    """
+    Stream records from a CSV or JSON Lines file.
+
+    The format is chosen from the file extension (.csv, or .jsonl/.ndjson).
+    Empty CSV cells are dropped so they do not overwrite values in Odoo.
+
+    Args:
+        path (str): Path to the input file
+
+    Yields:
+        tuple: (row number, record dict), row numbers starting at 1
+    """
+    extension = os.path.splitext(path)[1].lower()
+
+    with open(path, newline='', encoding='utf-8') as handle:
+        if extension == '.csv':
+            for row_number, row in enumerate(csv.DictReader(handle), start=1):
+                yield row_number, {key.strip(): value.strip() for key, value in row.items()
+                                   if key and value is not None and value.strip() != ''}
+        elif extension in ('.jsonl', '.ndjson'):
+            row_number = 0
+            for line in handle:
+                if not line.strip():
+                    continue
+                row_number += 1
+                yield row_number, json.loads(line)
+        else:
+            raise ValueError(f"Unsupported file type '{extension}'. Use .csv or .jsonl")
+
+def chunked(iterable, size):
+    """
+    Split an iterable into lists of at most size items.
+
+    Args:
+        iterable: Any iterable
+        size (int): Maximum number of items per chunk
+
+    Yields:
+        list: The next chunk of items
+    """
+    chunk = []
+    for item in iterable:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+def _fault_message(fault):
+    """Return the last line of an Odoo fault, which holds the actual error."""
+    lines = [line for line in str(fault.faultString).strip().splitlines() if line.strip()]
+    return lines[-1] if lines else str(fault)
+
+def create_records(models, config, uid, model, vals_list):
+    """
+    Create several records with a single multi-record create call.
+    
+    If the server rejects the batch (one invalid row, or an Odoo version older
+    than 12 that only accepts a single dictionary), the records are created one
+    by one so every row gets its own result.
+    
+    Args:
+        models (ModelConnection): Connection for model operations
+        config (dict): Configuration dictionary with Odoo connection parameters
+        uid (int): User ID for authentication
+        model (str): Model name
+        vals_list (list): List of value dictionaries
+        
+    Returns:
+        list: (record ID or None, error message or None) per value dictionary
+    """
+    if not vals_list:
+        return []
+    
+    try:
+        ids = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            model, 'create',
+            [vals_list]
+        )
+        if isinstance(ids, list):
+            return [(record_id, None) for record_id in ids]
+        # A server that only took the first dictionary returns a single ID
+        results = [(ids, None)]
+        remaining = vals_list[1:]
+    except xmlrpc.client.Fault as e:
+        if len(vals_list) == 1:
+            return [(None, _fault_message(e))]
+        results = []
+        remaining = vals_list
+    
+    for vals in remaining:
+        try:
+            record_id = models.execute_kw(
+                config['db_name'], uid, config['password'],
+                model, 'create',
+                [vals]
+            )
+            results.append((record_id, None))
+        except xmlrpc.client.Fault as e:
+            results.append((None, _fault_message(e)))
+    return results
+
+def write_grouped(models, config, uid, model, updates):
+    """
+    Write values to many records, one write call per distinct set of values.
+    
+    Records that receive identical values share a single write. If a grouped
+    write is rejected, its records are written one by one to find the bad rows.
+    
+    Args:
+        models (ModelConnection): Connection for model operations
+        config (dict): Configuration dictionary with Odoo connection parameters
+        uid (int): User ID for authentication
+        model (str): Model name
+        updates (dict): Mapping of record ID to the values to write
+        
+    Returns:
+        dict: Mapping of record ID to an error message (None on success)
+    """
+    groups = {}
+    for record_id, vals in updates.items():
+        signature = json.dumps(vals, sort_keys=True, default=str)
+        groups.setdefault(signature, (vals, []))[1].append(record_id)
+    
+    errors = {}
+    for vals, record_ids in groups.values():
+        try:
+            models.execute_kw(
+                config['db_name'], uid, config['password'],
+                model, 'write',
+                [record_ids, vals]
+            )
+            errors.update({record_id: None for record_id in record_ids})
+        except xmlrpc.client.Fault as e:
+            if len(record_ids) == 1:
+                errors[record_ids[0]] = _fault_message(e)
+                continue
+            for record_id in record_ids:
+                try:
+                    models.execute_kw(
+                        config['db_name'], uid, config['password'],
+                        model, 'write',
+                        [[record_id], vals]
+                    )
+                    errors[record_id] = None
+                except xmlrpc.client.Fault as e2:
+                    errors[record_id] = _fault_message(e2)
+    return errors
+
+class JobCheckpoint:
+    """
+    Append-only checkpoint file for a resumable bulk job.
+    
+    Every committed chunk appends one JSON line holding the number of input
+    rows done so far and the IDs Odoo assigned in that chunk. Appending keeps
+    the cost per chunk constant even for very large jobs, and a line cut short
+    by a crash is simply ignored when the file is read back.
+    
+    Args:
+        job_name (str): Kind of job, e.g. 'product_import'
+        source_path (str): Input file the job reads
+        checkpoint_dir (str): Directory for checkpoint files
+    """
+    
+    def __init__(self, job_name, source_path, checkpoint_dir=None):
+        checkpoint_dir = checkpoint_dir or BULK_CONFIG['checkpoint_dir']
+        source_path = os.path.abspath(source_path)
+        digest = hashlib.sha1(f"{job_name}:{source_path}".encode('utf-8')).hexdigest()[:12]
+        base_name = os.path.splitext(os.path.basename(source_path))[0]
+        
+        self.job_name = job_name
+        self.source_path = source_path
+        self.path = os.path.join(checkpoint_dir, f"{job_name}_{base_name}_{digest}.jsonl")
+        self.fingerprint = self._source_fingerprint()
+        self.rows_done = 0
+        self.chunks_done = 0
+        self.completed = False
+        self.summary = {}
+        self.chunk_size = None
+        self.stale = False
+        self._load()
+    
+    def _source_fingerprint(self):
+        """Size and modification time of the input, to notice when it is replaced."""
+        stat = os.stat(self.source_path)
+        return [stat.st_size, int(stat.st_mtime)]
+    
+    def _load(self):
+        """Read back the state of the last committed chunk, if any."""
+        if not os.path.exists(self.path):
+            return
+        
+        with open(self.path, encoding='utf-8') as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break  # Partial line written during a crash
+                if entry.get('type') == 'header':
+                    self.stale = entry.get('fingerprint') != self.fingerprint
+                elif entry.get('type') == 'chunk':
+                    self.rows_done = entry['rows_done']
+                    self.chunks_done = entry['chunk'] + 1
+                    self.summary = entry.get('summary', {})
+                    self.chunk_size = entry.get('chunk_size')
+                elif entry.get('type') == 'completed':
+                    self.completed = True
+    
+    @property
+    def exists(self):
+        """True if an earlier run of this job left a checkpoint behind."""
+        return os.path.exists(self.path)
+    
+    def ids(self):
+        """
+        Collect the server-assigned IDs recorded by all committed chunks.
+        
+        Returns:
+            dict: Mapping of record key (e.g. default_code) to Odoo ID
+        """
+        ids = {}
+        if not self.exists:
+            return ids
+        with open(self.path, encoding='utf-8') as handle:
+            for line in handle:
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    break
+                ids.update(entry.get('ids', {}))
+        return ids
+    
+    def reset(self):
+        """Forget previous progress and start the job from the first row."""
+        if self.exists:
+            os.remove(self.path)
+        self.rows_done = 0
+        self.chunks_done = 0
+        self.completed = False
+        self.summary = {}
+        self.chunk_size = None
+        self.stale = False
+    
+    def _append(self, entry):
+        """Append one entry and make sure it reached the disk."""
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        new_file = not self.exists
+        with open(self.path, 'a', encoding='utf-8') as handle:
+            if new_file:
+                handle.write(json.dumps({'type': 'header', 'job': self.job_name, 'source': self.source_path,
+                                         'fingerprint': self.fingerprint}) + "\n")
+            handle.write(json.dumps(entry, default=str) + "\n")
+            handle.flush()
+            os.fsync(handle.fileno())
+    
+    def commit_chunk(self, row_count, ids, summary, chunk_size=None):
+        """
+        Record a chunk that Odoo has accepted.
+        
+        Args:
+            row_count (int): Number of input rows in the chunk
+            ids (dict): Keys and IDs of the records written by the chunk
+            summary (dict): Running totals to show when resuming
+            chunk_size (int): Chunk size to continue with after a resume
+        """
+        self.rows_done += row_count
+        self._append({'type': 'chunk', 'chunk': self.chunks_done, 'rows_done': self.rows_done,
+                      'ids': ids, 'summary': summary, 'chunk_size': chunk_size})
+        self.chunks_done += 1
+        self.summary = dict(summary)
+        self.chunk_size = chunk_size
+    
+    def mark_completed(self):
+        """Record that every row of the input has been processed."""
+        self._append({'type': 'completed', 'rows_done': self.rows_done})
+        self.completed = True
+
+class AdaptiveBatchSizer:
+    """
+    Tune the chunk size of a bulk job from observed latency and errors.
+    
+    The size grows while throughput (records per second) keeps up with the
+    best seen so far and calls stay under the target duration. A clear drop in
+    throughput or a slow call shrinks it and a failed call halves it, so the
+    job settles on the largest chunk the server handles comfortably.
+    
+    Args:
+        initial (int): Starting chunk size
+        minimum (int): Smallest chunk size
+        maximum (int): Largest chunk size
+        target_seconds (float): Calls slower than this shrink the chunk
+    """
+    
+    def __init__(self, initial=None, minimum=None, maximum=None, target_seconds=None):
+        self.minimum = minimum or BULK_CONFIG['min_chunk_size']
+        self.maximum = maximum or BULK_CONFIG['max_chunk_size']
+        self.target_seconds = target_seconds or BULK_CONFIG['target_chunk_seconds']
+        self.size = max(self.minimum, min(self.maximum, initial or BULK_CONFIG['chunk_size']))
+        self.best_throughput = 0.0
+        self.chunks = 0
+        self.records = 0
+        self.seconds = 0.0
+        self.failures = 0
+        self.smallest = self.size
+        self.largest = self.size
+    
+    def record_success(self, records, seconds):
+        """
+        Record a chunk that succeeded and pick the next chunk size.
+        
+        Args:
+            records (int): Number of records in the chunk
+            seconds (float): Wall time of the chunk
+        """
+        self.chunks += 1
+        self.records += records
+        self.seconds += seconds
+        
+        throughput = records / seconds if seconds > 0 else float('inf')
+        
+        if seconds > self.target_seconds:
+            self._resize(int(self.size * 0.75))
+        elif records < self.size:
+            pass  # A short final chunk says nothing about larger ones
+        elif throughput >= self.best_throughput * 0.9:
+            self.best_throughput = max(self.best_throughput, throughput)
+            self._resize(int(self.size * 1.5) + 1)
+        elif throughput < self.best_throughput * 0.7:
+            # Throughput clearly dropped at this size: step back and let the
+            # reference decay so a noisy best does not pin the size down
+            self.best_throughput *= 0.9
+            self._resize(int(self.size / 1.25))
+    
+    def record_failure(self):
+        """Record a chunk that failed and halve the chunk size."""
+        self.failures += 1
+        self._resize(self.size // 2)
+    
+    def _resize(self, size):
+        """Apply a new size within the configured limits."""
+        self.size = max(self.minimum, min(self.maximum, size))
+        self.smallest = min(self.smallest, self.size)
+        self.largest = max(self.largest, self.size)
+    
+    def stats(self):
+        """
+        Summarise the run for reporting.
+        
+        Returns:
+            dict: Chunk count, final and extreme chunk sizes, latency and failures
+        """
+        return {
+            'chunks': self.chunks,
+            'chunk_size': self.size,
+            'smallest_chunk_size': self.smallest,
+            'largest_chunk_size': self.largest,
+            'ms_per_record': round(self.seconds * 1000 / self.records, 2) if self.records else None,
+            'failed_chunks': self.failures,
+        }
+    
+    def describe(self):
+        """One-line description of the run statistics."""
+        stats = self.stats()
+        latency = f"{stats['ms_per_record']} ms/record" if stats['ms_per_record'] is not None else "no records sent"
+        return (f"Run stats: {stats['chunks']} chunks, chunk size {stats['chunk_size']} "
+                f"(range {stats['smallest_chunk_size']}-{stats['largest_chunk_size']}), {latency}, "
+                f"{stats['failed_chunks']} failed chunks")
+
+def is_retryable_error(error, idempotent=True):
+    """
+    Decide whether a failed chunk may be sent again.
+    
+    Odoo faults are answers from the server and are never retried here.
+    Throttling responses and refused connections mean the server did not run
+    the call, so they are always safe. Timeouts and dropped connections leave
+    it unknown whether the call ran, so they are only retried for idempotent
+    jobs such as the product upsert.
+    
+    Args:
+        error (Exception): The error raised by the chunk
+        idempotent (bool): True if sending the chunk twice is harmless
+        
+    Returns:
+        bool: True if the chunk should be retried with a smaller size
+    """
+    if isinstance(error, xmlrpc.client.Fault):
+        return False
+    if isinstance(error, xmlrpc.client.ProtocolError):
+        return error.errcode in (429, 502, 503, 504) and (idempotent or error.errcode in (429, 503))
+    if isinstance(error, ConnectionRefusedError):
+        return True
+    return idempotent and isinstance(error, OSError)
+
+class ChunkNeedsReview(Exception):
+    """
+    A non-idempotent chunk failed after Odoo may have applied some of its writes.
+    
+    Sending the chunk again could apply those writes twice, so the job stops
+    with the checkpoint before the chunk and its rows are reported for review.
+    
+    Args:
+        rows (list): Input records of the chunk
+        error (Exception): The error raised by the chunk
+    """
+    
+    def __init__(self, rows, error):
+        super().__init__(f"Chunk of {len(rows)} rows failed after some of its writes were sent: {str(error)}")
+        self.rows = rows
+        self.error = error
+
+def run_checkpointed_job(checkpoint, records, process_chunk, sizer=None, on_result=None, on_chunk=None,
+                         idempotent=True):
+    """
+    Run a bulk job chunk by chunk, committing progress to a checkpoint.
+    
+    Rows already committed by an earlier run are skipped, so a job that died
+    on a timeout or a throttled request continues where it stopped instead of
+    sending everything again. Requests go out on the bulk priority lane, so
+    interactive requests are served first. Chunk sizes come from an AdaptiveBatchSizer;
+    a chunk that fails with a retryable error is split and sent again, and
+    once it fails at the minimum size the error is raised with the checkpoint
+    still pointing at the last chunk Odoo accepted. A chunk of a non-idempotent
+    job is only sent again if none of its writes reached Odoo; otherwise
+    ChunkNeedsReview is raised.
+    
+    Args:
+        checkpoint (JobCheckpoint): Checkpoint of the job
+        records (iterable): All input records, from the first row
+        process_chunk (callable): Function taking a list of records and
+            returning a list of result dicts with 'status', 'key' and 'id'
+        sizer (AdaptiveBatchSizer): Chunk size tuner (a default one if omitted)
+        on_result (callable): Optional callback for each result dict
+        on_chunk (callable): Optional callback without arguments after each committed chunk
+        idempotent (bool): True if re-sending a chunk after a timeout is harmless
+        
+    Returns:
+        dict: Number of rows per status, including rows done by earlier runs
+        
+    Raises:
+        ChunkNeedsReview: If a chunk of a non-idempotent job failed after
+            some of its writes were sent
+    """
+    summary = dict(checkpoint.summary)
+    sizer = sizer or AdaptiveBatchSizer(initial=checkpoint.chunk_size)
+    
+    if checkpoint.rows_done:
+        print(f"Resuming {checkpoint.job_name} after row {checkpoint.rows_done} "
+              f"({checkpoint.chunks_done} chunks already committed)")
+    
+    remaining = iter(itertools.islice(records, checkpoint.rows_done, None))
+    pending = []  # Records taken from the input but not committed yet
+    
+    with request_priority(PRIORITY_BULK):
+        _run_chunks(checkpoint, remaining, pending, process_chunk, sizer, summary, on_result, on_chunk, idempotent)
+    
+    checkpoint.mark_completed()
+    print(sizer.describe())
+    return summary
+
+def _run_chunks(checkpoint, remaining, pending, process_chunk, sizer, summary, on_result, on_chunk, idempotent):
+    """Send chunks until the input is exhausted; see run_checkpointed_job."""
+    while True:
+        if len(pending) < sizer.size:
+            pending.extend(itertools.islice(remaining, sizer.size - len(pending)))
+        if not pending:
+            break
+        
+        chunk = pending[:sizer.size]
+        started = time.monotonic()
+        try:
+            with track_writes() as writes:
+                results = process_chunk(chunk)
+        except Exception as e:
+            if writes.sent and not idempotent:
+                raise ChunkNeedsReview(chunk, e) from e
+            # A chunk that only read so far is safe to send again whatever the job
+            if sizer.size <= sizer.minimum or not is_retryable_error(e, idempotent or not writes.sent):
+                raise
+            sizer.record_failure()
+            print(f"Chunk of {len(chunk)} rows failed ({str(e)}); retrying with {sizer.size} rows")
+            continue
+        sizer.record_success(len(chunk), time.monotonic() - started)
+        del pending[:len(chunk)]
+        
+        ids = {}
+        for result in results:
+            summary[result['status']] = summary.get(result['status'], 0) + 1
+            if result.get('key') and result.get('id'):
+                ids[result['key']] = result['id']
+            if on_result:
+                on_result(result)
+        
+        checkpoint.commit_chunk(len(chunk), ids, summary, sizer.size)
+        if on_chunk:
+            on_chunk()
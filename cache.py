@@ -0,0 +1,146 @@
+"""
+In-process cache for master data read from Odoo.
+
+Entries are keyed by Odoo instance (url and database) plus a name, and expire
+after a time-to-live so long sessions eventually see changes made elsewhere.
+Values read with shared=True are also kept in the host-wide store of
+shared_cache.py, so other processes can use them without reading them again.
+"""
+import contextlib
+import threading
+import time
+from config import CACHE_CONFIG
+from shared_cache import expire_shared, load_shared
+
+_entries = {}
+_lock = threading.Lock()
+_local = threading.local()
+_shared_keys = set()
+
+def _cache_key(config, key):
+    """Build the full cache key for an Odoo instance."""
+    return (config['url'], config['db_name'], key)
+
+def get_cached(config, key, loader, ttl=None, shared=False, validator=None):
+    """
+    Return a cached value, calling the loader when it is missing or expired.
+
+    Args:
+        config (dict): Configuration dictionary with Odoo connection parameters
+        key (str): Name of the cached value, e.g. 'product.category'
+        loader (callable): Function without arguments that loads the value
+        ttl (float): Time-to-live in seconds (defaults to CACHE_CONFIG['default_ttl'])
+        shared (bool): Also keep the value in the store shared by all
+            processes on this host (plain data only)
+        validator (callable): Function without arguments returning a
+            fingerprint of the data in Odoo, so an expired shared value is
+            only reloaded when it changed (see shared_cache.model_validator)
+
+    Returns:
+        object: The cached or freshly loaded value
+    """
+    ttl = CACHE_CONFIG['default_ttl'] if ttl is None else ttl
+    refresh_age = getattr(_local, 'refresh_age', None)
+    if refresh_age is not None and ttl != float('inf'):
+        ttl = min(ttl, refresh_age)
+    full_key = _cache_key(config, key)
+
+    with _lock:
+        entry = _entries.get(full_key)
+        if entry and time.monotonic() - entry[0] < ttl:
+            return entry[1]
+
+    if shared:
+        _shared_keys.add(key)
+        value, age = load_shared(config, key, loader, ttl, validator)
+    else:
+        value, age = loader(), 0.0
+
+    with _lock:
+        _entries[full_key] = (time.monotonic() - age, value)
+    return value
+
+@contextlib.contextmanager
+def refresh_ahead(age):
+    """
+    Reload values older than age seconds when they are read inside the block.
+
+    Only the calling thread is affected: other threads keep getting the
+    current value until the reload replaces it. Values cached without expiry
+    are left alone.
+
+    Args:
+        age (float): Age in seconds from which values are reloaded
+    """
+    previous = getattr(_local, 'refresh_age', None)
+    _local.refresh_age = age
+    try:
+        yield
+    finally:
+        _local.refresh_age = previous
+
+def set_cached(config, key, value):
+    """Store a value in the cache, replacing any existing entry."""
+    with _lock:
+        _entries[_cache_key(config, key)] = (time.monotonic(), value)
+
+def invalidate(config, key=None):
+    """
+    Drop cached values for an Odoo instance.
+
+    Args:
+        config (dict): Configuration dictionary with Odoo connection parameters
+        key (str): Name of the value to drop, or None to drop all values
+    """
+    if key is None or key in _shared_keys:
+        expire_shared(config, key)
+    with _lock:
+        if key is not None:
+            _entries.pop(_cache_key(config, key), None)
+            return
+        for full_key in [k for k in _entries if k[:2] == (config['url'], config['db_name'])]:
+            del _entries[full_key]
+
+def get_cached_many(config, namespace, keys, loader, ttl=None):
+    """
+    Return cached values for several keys, loading only the missing ones.
+
+    Args:
+        config (dict): Configuration dictionary with Odoo connection parameters
+        namespace (str): Name of the group of values, e.g. 'availability'
+        keys (list): Keys to return, e.g. product IDs
+        loader (callable): Function taking a list of missing keys and
+            returning a dict with a value for each of them
+        ttl (float): Time-to-live in seconds (defaults to CACHE_CONFIG['default_ttl'])
+
+    Returns:
+        dict: Mapping of key to value
+    """
+    ttl = CACHE_CONFIG['default_ttl'] if ttl is None else ttl
+    now = time.monotonic()
+    result = {}
+    missing = []
+
+    with _lock:
+        for key in keys:
+            entry = _entries.get(_cache_key(config, (namespace, key)))
+            if entry and now - entry[0] < ttl:
+                result[key] = entry[1]
+            else:
+                missing.append(key)
+
+    if missing:
+        loaded = loader(missing)
+        now = time.monotonic()
+        with _lock:
+            for key, value in loaded.items():
+                _entries[_cache_key(config, (namespace, key))] = (now, value)
+        result.update(loaded)
+
+    return result
+
+def invalidate_many(config, namespace, keys):
+    """Drop cached values of a namespace for the given keys."""
+    with _lock:
+        for key in keys:
+            _entries.pop(_cache_key(config, (namespace, key)), None)
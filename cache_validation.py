@@ -0,0 +1,205 @@
+"""
+Validation of cached model data with one small request.
+
+A cached slice of a model (the records matching a domain) is checked with a
+fingerprint: the number of matching records and their newest write_date,
+read together with one read_group call. When the fingerprint is unchanged
+the cached records are used as they are. When it changed only the records
+written since the newest write_date seen are read again, and the matching
+IDs are only searched when the count shows records were removed, so a
+listing that changed by one record costs a couple of small requests
+instead of a full reload.
+"""
+import threading
+import time
+import xmlrpc.client
+from cache import get_cached, set_cached
+from config import CACHE_CONFIG, REPORT_CONFIG
+from connection import get_model_connection, iter_search_read
+from shared_cache import read_shared, store_shared
+
+def _probe_with_read_group(uid, config, models, model, domain):
+    groups = models.execute_kw(
+        config['db_name'], uid, config['password'],
+        model, 'read_group',
+        [domain, ['write_date:max'], []],
+        {'lazy': False}
+    )
+    group = groups[0] if groups else {}
+    return [group.get('__count', 0), group.get('write_date') or None]
+
+def _probe_with_search(uid, config, models, model, domain):
+    count = models.execute_kw(
+        config['db_name'], uid, config['password'],
+        model, 'search_count',
+        [domain]
+    )
+    newest = models.execute_kw(
+        config['db_name'], uid, config['password'],
+        model, 'search_read',
+        [domain],
+        {'fields': ['write_date'], 'order': 'write_date desc', 'limit': 1}
+    )
+    return [count, newest[0]['write_date'] if newest else None]
+
+def probe_model(uid, config, model, domain=None):
+    """
+    Read the fingerprint of the records of a model matching a domain.
+
+    Uses one read_group request with a write_date:max aggregate. Servers that
+    reject it (Odoo before 12) are remembered and probed with search_count
+    plus a one-record search_read instead.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        model (str): Model name, e.g. 'stock.warehouse'
+        domain (list): Search domain (defaults to all records)
+
+    Returns:
+        list: [record count, newest write_date or None]
+    """
+    models = get_model_connection(config['url'])
+    domain = domain or []
+    if get_cached(config, 'read_group.max_probe', lambda: True, ttl=float('inf')):
+        try:
+            return _probe_with_read_group(uid, config, models, model, domain)
+        except xmlrpc.client.Fault:
+            set_cached(config, 'read_group.max_probe', False)
+    return _probe_with_search(uid, config, models, model, domain)
+
+class ModelSlice:
+    """
+    Cached records of a model matching a domain, kept current by fingerprint.
+
+    Args:
+        model (str): Model name
+        domain (list): Search domain of the slice
+        fields (list): Fields to read (write_date is always added)
+        records (list): Records already read, e.g. from the shared cache
+    """
+
+    def __init__(self, model, domain, fields, records=()):
+        self.model = model
+        self.domain = list(domain)
+        self.fields = list(dict.fromkeys(list(fields) + ['id', 'write_date']))
+        self.records = {}
+        self.fingerprint = None
+        self.last_write_date = None
+        self.checked_at = 0.0
+        self.loaded_at = 0.0
+        self.version = 0  # Increased whenever the records change, for data derived from them
+        self.lock = threading.Lock()
+        self._apply(records)
+
+    def _apply(self, records):
+        for record in records:
+            self.records[record['id']] = record
+            if record.get('write_date') and (not self.last_write_date or record['write_date'] > self.last_write_date):
+                self.last_write_date = record['write_date']
+
+    def _read(self, uid, config, models, domain):
+        records = []
+        for page in iter_search_read(models, config, uid, self.model, domain, self.fields,
+                                     page_size=REPORT_CONFIG['page_size']):
+            records.extend(page)
+        return records
+
+    def sync(self, uid, config):
+        """
+        Bring the records up to date with Odoo.
+
+        Probes the fingerprint and, if it changed, reads the records written
+        since the newest write_date seen and drops records no longer matching.
+        Slices older than CACHE_CONFIG['slice_max_age'] are read in full
+        again, for changes that do not touch write_date.
+
+        Args:
+            uid (int): User ID for authentication
+            config (dict): Configuration dictionary with Odoo connection parameters
+
+        Returns:
+            bool: True if records changed
+        """
+        models = get_model_connection(config['url'])
+        with self.lock:
+            now = time.monotonic()
+            fingerprint = probe_model(uid, config, self.model, self.domain)
+            self.checked_at = now
+
+            if not self.loaded_at or now - self.loaded_at >= CACHE_CONFIG['slice_max_age']:
+                records = self._read(uid, config, models, self.domain)
+                changed = {record['id']: record for record in records} != self.records
+                self.records = {}
+                self.last_write_date = None
+                self._apply(records)
+                self.fingerprint = fingerprint
+                self.loaded_at = now
+                self.version += changed
+                return changed
+
+            if fingerprint == self.fingerprint:
+                return False
+
+            # write_date has one-second precision, so also re-read records from the last second seen
+            since = [['write_date', '>=', self.last_write_date]] if self.last_write_date else []
+            before = dict(self.records)
+            self._apply(self._read(uid, config, models, self.domain + since))
+
+            if len(self.records) != fingerprint[0]:
+                ids = set(models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    self.model, 'search',
+                    [self.domain]
+                ))
+                for record_id in [record_id for record_id in self.records if record_id not in ids]:
+                    del self.records[record_id]
+                # Records that started matching the domain without being written
+                missing = [record_id for record_id in ids if record_id not in self.records]
+                if missing:
+                    self._apply(self._read(uid, config, models, [['id', 'in', missing]]))
+
+            self.fingerprint = fingerprint
+            changed = self.records != before
+            self.version += changed
+            return changed
+
+    def as_list(self, key=None):
+        """Return the records, sorted by key (by ID if not given)."""
+        return sorted(self.records.values(), key=key or (lambda record: record['id']))
+
+def get_model_slice(uid, config, key, model, domain=None, fields=None):
+    """
+    Return the cached slice of a model, validated with one small request.
+
+    The slice starts from the shared cache when another process has read it
+    and is probed at most every CACHE_CONFIG['validate_interval'] seconds;
+    changes are read as a delta and published to the shared cache.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        key (str): Name of the slice, e.g. 'stock.warehouse'
+        model (str): Model name
+        domain (list): Search domain of the slice (defaults to all records)
+        fields (list): Fields to read
+
+    Returns:
+        ModelSlice: The current slice
+    """
+    domain = domain or []
+    fields = fields or ['id']
+
+    def build():
+        # Start from the shared copy, if any; the first sync then only reads the changes
+        records, age = read_shared(config, key)
+        model_slice = ModelSlice(model, domain, fields, records or ())
+        if records is not None:
+            model_slice.loaded_at = time.monotonic() - age
+        return model_slice
+
+    model_slice = get_cached(config, f"{key}.slice", build, ttl=float('inf'))
+    if time.monotonic() - model_slice.checked_at >= CACHE_CONFIG['validate_interval']:
+        if model_slice.sync(uid, config):
+            store_shared(config, key, model_slice.as_list())
+    return model_slice
@@ -18,7 +18,127 @@ PRODUCT_CONFIG = {
     'default_cost_price': 30.00,
 }
 
+# Product search index used by the product pickers
+PRODUCT_INDEX_CONFIG = {
+    'refresh_interval': 30,  # Seconds before changed products are read again
+    'max_matches': 10  # Matches shown per search
+}
+
 # Default quantities for inventory
 INVENTORY_CONFIG = {
     'default_stock_quantity': 10
-}
\ No newline at end of file
+}
+
+# Report output settings
+REPORT_CONFIG = {
+    'page_size': 500  # Records fetched per request when streaming report rows
+}
+
+# Bulk operation settings
+BULK_CONFIG = {
+    'chunk_size': 200,  # Rows in the first create/write batch; later batches adapt
+    'min_chunk_size': 10,  # Smallest batch the adaptive sizing shrinks to
+    'max_chunk_size': 2000,  # Largest batch the adaptive sizing grows to
+    'target_chunk_seconds': 15,  # Batches slower than this are made smaller
+    'checkpoint_dir': '.checkpoints'  # Where resumable jobs record their progress
+}
+
+# Cache settings for master data (categories, units of measure, schema)
+CACHE_CONFIG = {
+    'default_ttl': 300,  # Seconds before cached data is read again
+    'availability_ttl': 30,  # Seconds before stock availability is read again
+    'shared': True,  # Share master data between processes on this host
+    'shared_path': None,  # Shared cache file (defaults to shared_cache.db in the checkpoint directory)
+    'shared_lease': 30,  # Seconds other processes wait for one process reloading an entry
+    'validate_interval': 2,  # Seconds before a cached listing is checked against Odoo again
+    'slice_max_age': 3600  # Seconds before a cached listing is read in full again
+}
+
+# Background warming of the data the menu options need
+PREFETCH_CONFIG = {
+    'enabled': True,
+    'refresh_after': 240,  # Seconds after which warmed data is read again (below CACHE_CONFIG['default_ttl'])
+    'idle_interval': 60  # Seconds between refresh checks while the menu waits for input
+}
+
+# Inventory history (as-of-date reports)
+HISTORY_CONFIG = {
+    'snapshot_interval_days': 30  # Days of move history between saved balance snapshots
+}
+
+# Client-side pricing with pricelists
+PRICING_CONFIG = {
+    'refresh_interval': 60,  # Seconds before changed pricelist items are read again
+    'product_ttl': 300  # Seconds before product prices and customer pricelists are read again
+}
+
+# Request scheduling for all calls to the Odoo server
+SCHEDULER_CONFIG = {
+    'initial_concurrency': 4,  # Requests allowed in flight at start
+    'min_concurrency': 1,
+    'max_concurrency': 16,
+    'latency_target': 2.0,  # Seconds; slower requests lower the concurrency limit
+    'requests_per_second': 10,  # Token bucket rate (0 disables the rate limit)
+    'burst': 20,  # Requests that may start back to back after an idle period
+    'max_throttle_retries': 3,  # Retries of a request throttled with 429/503
+    'throttle_backoff': 1.0  # Seconds before the first retry without Retry-After
+}
+
+# Timeouts and hedged reads for XML-RPC calls
+RPC_CONFIG = {
+    'timeout': 60,  # Socket timeout per request, in seconds
+    'single_flight': True,  # Identical concurrent reads share one request
+    'workflow_deadline': 600,  # Time budget for multi-step workflows such as the complete process
+    'hedge_reads': True,  # Send a duplicate of slow idempotent reads
+    'hedge_percentile': 95,  # Hedge once a read is slower than this latency percentile
+    'hedge_min_samples': 20,  # Latency samples needed before hedging starts
+    'hedge_min_delay': 0.05,  # Never hedge sooner than this, in seconds
+    'hedge_budget': 0.1,  # At most this share of reads may be duplicated
+    'hedge_workers': 8,  # Threads for duplicate reads, added to twice SCHEDULER_CONFIG['max_concurrency'] for first requests
+    'latency_window': 200  # Recent samples kept per model and method
+}
+
+# Recording of execute_kw calls (python main.py --trace <file>)
+TRACE_CONFIG = {
+    'scrub_pattern': r'pass|secret|token|api_?key|auth|signature',  # Values of matching keys are replaced
+    'shape_depth': 4,  # Levels of nesting recorded in response shapes
+    'shape_max_fields': 300  # Keys recorded per dict in response shapes
+}
+
+# Server-side macros (needs the rights to create server actions)
+MACRO_CONFIG = {
+    'enabled': False  # Run sales workflows as one server action call instead of a request per step
+}
+
+# Local journal of writes sent to Odoo in the background
+JOURNAL_CONFIG = {
+    'enabled': False,  # Queue sales and stock additions locally when Odoo cannot be reached
+    'flush_interval': 5,  # Seconds between attempts to send queued writes
+    'max_backoff': 300,  # Longest wait between attempts while Odoo is unreachable
+    'batch_size': 100,  # Queued operations sent per batch
+    'flush_lease': 300  # Seconds one process may send the journal before another can take over
+}
+
+# Client-side profiling (python main.py --profile)
+PROFILE_CONFIG = {
+    'output_dir': 'profiles',  # Where per-action profile files are written
+    'sample_interval': 0.005,  # Seconds between stack samples
+    'top_functions': 30,  # Functions listed in the text report
+    'top_allocators': 20,  # Allocation sites listed in the text report
+    'traceback_frames': 5  # Frames kept per allocation
+}
+
+# Headless job runner (python main.py --job <file>)
+JOB_CONFIG = {
+    'max_parallel_steps': 4  # Independent steps run at the same time
+}
+
+# Service mode (python main.py --serve)
+SERVICE_CONFIG = {
+    'host': '127.0.0.1',  # Listen on localhost only
+    'port': 8765,
+    'token': '',  # If set, callers must send it in the X-Api-Token header; write endpoints need it
+    'allowed_hosts': [],  # Host header names accepted besides localhost and the listen address
+    'request_deadline': 120,  # Seconds one API request may spend on Odoo calls
+    'log_requests': False  # Print a line per API request
+}
@@ -1,7 +1,88 @@
 """
 Functions for establishing and maintaining connection to Odoo.
 """
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import http.client
+import json
+import socket
+import threading
+import time
 import xmlrpc.client
+from config import RPC_CONFIG, SCHEDULER_CONFIG
+from deadlines import DeadlineExceeded, current_deadline, remaining_time
+from request_scheduler import current_priority, get_scheduler
+
+# Read-only methods that are safe to send twice
+HEDGED_METHODS = ('search_read', 'read', 'fields_get', 'read_group')
+
+# Read-only methods whose concurrent identical requests can share one answer
+READ_ONLY_METHODS = HEDGED_METHODS + ('search', 'search_count', 'name_search', 'name_get')
+
+# Observer of every execute_kw call, see set_call_recorder
+_call_recorder = None
+
+# Write trackers of the calling thread, see track_writes
+_write_local = threading.local()
+
+def set_call_recorder(recorder):
+    """
+    Report every execute_kw call to a recorder, or stop reporting with None.
+    
+    Args:
+        recorder (object): Object with a record(args, priority, started,
+            seconds, result, error) method, called in the calling thread
+            after each call (see rpc_trace.TraceRecorder)
+    """
+    global _call_recorder
+    _call_recorder = recorder
+
+def is_connection_error(error):
+    """True for errors that mean Odoo could not be reached or did not answer in time."""
+    return isinstance(error, (OSError, http.client.HTTPException, xmlrpc.client.ProtocolError))
+
+def is_unsent_error(error):
+    """True for errors that mean the server did not run the call: refused connections and throttling responses."""
+    if isinstance(error, xmlrpc.client.ProtocolError):
+        return error.errcode in (429, 503)
+    return isinstance(error, ConnectionRefusedError)
+
+class WriteTracker:
+    """Count of the write requests of a block that Odoo may have applied, see track_writes."""
+    
+    def __init__(self, parent=None):
+        self.parent = parent
+        self.sent = 0
+    
+    def add(self):
+        tracker = self
+        while tracker is not None:
+            tracker.sent += 1
+            tracker = tracker.parent
+
+@contextlib.contextmanager
+def track_writes():
+    """
+    Count the write requests made by the calling thread inside the block.
+    
+    Every execute_kw call of a method outside READ_ONLY_METHODS counts unless
+    it failed in a way that shows Odoo did not apply it: an Odoo fault (the
+    transaction was rolled back), a refused connection or a throttling
+    response. Callers of non-idempotent work use the count to decide whether
+    sending it again could apply it twice.
+    
+    Yields:
+        WriteTracker: Tracker whose sent attribute holds the count
+    """
+    previous = getattr(_write_local, 'tracker', None)
+    tracker = WriteTracker(previous)
+    _write_local.tracker = tracker
+    try:
+        yield tracker
+    finally:
+        _write_local.tracker = previous
 
 def test_connection(url, db_name, username, password):
     """
@@ -18,7 +99,7 @@ def test_connection(url, db_name, username, password):
     """
     print(f"Connecting to Odoo at {url}...")
     try:
-        common = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/common')
+        common, _ = _make_proxy(f'{url}/xmlrpc/2/common', RPC_CONFIG['timeout'])
         version_info = common.version()
         print(f"Connected to Odoo server version: {version_info['server_version']}")
         print(f"Authenticating as {username}...")
@@ -34,14 +115,354 @@ def test_connection(url, db_name, username, password):
         print(f"Connection error: {str(e)}")
         return None
 
+class _TimeoutTransportMixin:
+    """Transport whose socket timeout can be changed before every request."""
+    
+    timeout = None
+    
+    def make_connection(self, host):
+        connection = super().make_connection(host)
+        connection.timeout = self.timeout
+        # A kept-alive connection already has a socket with the old timeout
+        if connection.sock is not None:
+            connection.sock.settimeout(self.timeout)
+        return connection
+
+class TimeoutTransport(_TimeoutTransportMixin, xmlrpc.client.Transport):
+    """HTTP transport with a per-request socket timeout."""
+
+class SafeTimeoutTransport(_TimeoutTransportMixin, xmlrpc.client.SafeTransport):
+    """HTTPS transport with a per-request socket timeout."""
+
+def _make_proxy(endpoint, timeout):
+    """
+    Create a ServerProxy whose requests time out.
+    
+    Args:
+        endpoint (str): Full URL of the XML-RPC endpoint
+        timeout (float): Socket timeout in seconds
+        
+    Returns:
+        tuple: (ServerProxy, transport) - the transport lets callers change the timeout
+    """
+    transport_class = SafeTimeoutTransport if endpoint.startswith('https') else TimeoutTransport
+    transport = transport_class()
+    transport.timeout = timeout
+    return xmlrpc.client.ServerProxy(endpoint, transport=transport), transport
+
+class LatencyTracker:
+    """
+    Recent latencies per (model, method), used to decide when to hedge.
+    
+    Args:
+        window (int): Number of recent samples kept per key
+    """
+    
+    def __init__(self, window=200):
+        self.window = window
+        self.samples = {}
+        self.lock = threading.Lock()
+    
+    def record(self, key, seconds):
+        """Add one latency sample for a key."""
+        with self.lock:
+            self.samples.setdefault(key, collections.deque(maxlen=self.window)).append(seconds)
+    
+    def percentile(self, key, percent, min_samples=1):
+        """
+        Return a latency percentile for a key.
+        
+        Args:
+            key (tuple): (model, method)
+            percent (float): Percentile between 0 and 100
+            min_samples (int): Return None until this many samples exist
+            
+        Returns:
+            float or None: Latency in seconds
+        """
+        with self.lock:
+            samples = sorted(self.samples.get(key, ()))
+        if len(samples) < max(1, min_samples):
+            return None
+        index = min(len(samples) - 1, int(round(percent / 100.0 * (len(samples) - 1))))
+        return samples[index]
+
+class _InFlightCall:
+    """A request in flight whose result is shared with identical requests."""
+    
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+class SingleFlight:
+    """
+    Share one in-flight request between identical concurrent requests.
+    
+    The first caller for a key sends the request; callers arriving with the
+    same key while it is in flight wait for it and get a copy of its result
+    (or its error) instead of sending their own request. A leader that ran
+    out of its own deadline does not fail its followers: a follower with
+    time left sends the request again.
+    """
+    
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.calls = {}
+        self.shared = 0
+    
+    def do(self, key, call, absolute_deadline=None):
+        """
+        Run call() unless an identical request is already in flight.
+        
+        Args:
+            key (tuple): Identity of the request
+            call (callable): Function without arguments that sends the request
+            absolute_deadline (float): Give up waiting after this time.monotonic() value
+            
+        Returns:
+            object: The result of the request
+        """
+        while True:
+            with self.lock:
+                in_flight = self.calls.get(key)
+                leader = in_flight is None
+                if leader:
+                    in_flight = _InFlightCall()
+                    self.calls[key] = in_flight
+                else:
+                    self.shared += 1
+            
+            if leader:
+                try:
+                    in_flight.result = call()
+                except Exception as e:
+                    in_flight.error = e
+                finally:
+                    with self.lock:
+                        del self.calls[key]
+                    in_flight.done.set()
+                if in_flight.error is not None:
+                    raise in_flight.error
+                return in_flight.result
+            
+            if not in_flight.done.wait(remaining_time(absolute_deadline)):
+                raise DeadlineExceeded(f"Deadline exceeded while waiting for a shared {key[2]}.{key[3]} request")
+            if isinstance(in_flight.error, DeadlineExceeded):
+                # The leader gave up on its own deadline, which may be shorter than ours
+                remaining = remaining_time(absolute_deadline)
+                if remaining is None or remaining > 0:
+                    continue
+            if in_flight.error is not None:
+                raise in_flight.error
+            # Callers may modify what they get back, so each follower gets its own copy
+            return copy.deepcopy(in_flight.result)
+
+class ModelConnection:
+    """
+    Connection to the object endpoint whose execute_kw calls are scheduled.
+    
+    Each thread gets its own ServerProxy, because a proxy keeps one HTTP
+    connection open and cannot be shared between threads. Every request has a
+    socket timeout bounded by RPC_CONFIG['timeout'] and by the current deadline
+    (see deadlines.deadline). Identical read-only requests made at the same
+    time share a single request. Idempotent reads are also hedged: once a read has
+    taken longer than the recent p95 latency of that model and method, a
+    duplicate is sent and whichever answer arrives first is used.
+    
+    Args:
+        url (str): The Odoo server URL
+    """
+    
+    def __init__(self, url):
+        self.url = url
+        self.scheduler = get_scheduler(url)
+        self.latencies = LatencyTracker(RPC_CONFIG['latency_window'])
+        self.single_flight = SingleFlight()
+        self._local = threading.local()
+        self._hedge_lock = threading.Lock()
+        self._hedge_pool = None
+        self.reads = 0
+        self.hedges = 0
+    
+    def _proxy(self):
+        """Return the calling thread's proxy and transport, creating them on first use."""
+        proxy = getattr(self._local, 'proxy', None)
+        if proxy is None:
+            proxy = _make_proxy(f'{self.url}/xmlrpc/2/object', RPC_CONFIG['timeout'])
+            self._local.proxy = proxy
+        return proxy
+    
+    def _send(self, args, absolute_deadline, priority):
+        """Send one request through the scheduler with a deadline-bound timeout."""
+        def call():
+            timeout = RPC_CONFIG['timeout']
+            remaining = remaining_time(absolute_deadline)
+            if remaining is not None:
+                if remaining <= 0:
+                    raise DeadlineExceeded(f"Deadline exceeded before calling {args[3]}.{args[4]}")
+                timeout = min(timeout, remaining) if timeout else remaining
+            proxy, transport = self._proxy()
+            transport.timeout = timeout
+            try:
+                return proxy.execute_kw(*args)
+            except socket.timeout as e:
+                if remaining is not None and timeout >= remaining:
+                    raise DeadlineExceeded(f"Deadline exceeded while calling {args[3]}.{args[4]}") from e
+                raise
+        
+        started = time.monotonic()
+        result = self.scheduler.run(call, priority, absolute_deadline)
+        self.latencies.record((args[3], args[4]), time.monotonic() - started)
+        return result
+    
+    def execute_kw(self, *args):
+        """Call a model method once the request scheduler admits the request."""
+        tracker = getattr(_write_local, 'tracker', None)
+        if tracker is not None and args[4] not in READ_ONLY_METHODS:
+            try:
+                result = self._recorded_execute_kw(args)
+            except xmlrpc.client.Fault:
+                raise
+            except Exception as e:
+                if not is_unsent_error(e):
+                    tracker.add()
+                raise
+            tracker.add()
+            return result
+        return self._recorded_execute_kw(args)
+    
+    def _recorded_execute_kw(self, args):
+        recorder = _call_recorder
+        if recorder is None:
+            return self._execute_kw(args)
+        
+        started = time.time()
+        clock = time.monotonic()
+        try:
+            result = self._execute_kw(args)
+        except Exception as e:
+            recorder.record(args, current_priority(), started, time.monotonic() - clock, None, e)
+            raise
+        recorder.record(args, current_priority(), started, time.monotonic() - clock, result, None)
+        return result
+    
+    def _execute_kw(self, args):
+        absolute_deadline = current_deadline()
+        priority = current_priority()
+        
+        def send():
+            if RPC_CONFIG['hedge_reads'] and args[4] in HEDGED_METHODS:
+                return self._hedged_send(args, absolute_deadline, priority)
+            return self._send(args, absolute_deadline, priority)
+        
+        if RPC_CONFIG['single_flight'] and args[4] in READ_ONLY_METHODS:
+            # Requests of different lanes are not shared, so an interactive read never waits in the bulk lane
+            key = (args[0], args[1], args[3], args[4], json.dumps(args[5:], sort_keys=True, default=str), priority)
+            return self.single_flight.do(key, send, absolute_deadline)
+        return send()
+    
+    def _hedge_delay(self, key):
+        """Return how long to wait before hedging a read, or None to not hedge."""
+        delay = self.latencies.percentile(key, RPC_CONFIG['hedge_percentile'], RPC_CONFIG['hedge_min_samples'])
+        if delay is None:
+            return None
+        with self._hedge_lock:
+            self.reads += 1
+            # Keep duplicates to a small share of reads so hedging cannot double the load
+            if self.hedges >= self.reads * RPC_CONFIG['hedge_budget']:
+                return None
+        return max(delay, RPC_CONFIG['hedge_min_delay'])
+    
+    def _pool(self):
+        """Thread pool running hedged reads, created on first use."""
+        with self._hedge_lock:
+            if self._hedge_pool is None:
+                # First requests of every thread run here too; the scheduler admits up to max_concurrency
+                # of them and the rest wait for admission, so they must not hold up each other or the hedges
+                self._hedge_pool = concurrent.futures.ThreadPoolExecutor(
+                    max_workers=SCHEDULER_CONFIG['max_concurrency'] * 2 + RPC_CONFIG['hedge_workers'],
+                    thread_name_prefix='odoo-hedge')
+            return self._hedge_pool
+    
+    def _hedged_send(self, args, absolute_deadline, priority):
+        """Send a read, and a duplicate if the first one is slower than usual."""
+        delay = self._hedge_delay((args[3], args[4]))
+        if delay is None:
+            return self._send(args, absolute_deadline, priority)
+        
+        pool = self._pool()
+        pending = {pool.submit(self._send, args, absolute_deadline, priority)}
+        done, pending = concurrent.futures.wait(pending, timeout=delay)
+        
+        remaining = remaining_time(absolute_deadline)
+        if not done and (remaining is None or remaining > 0):
+            with self._hedge_lock:
+                self.hedges += 1
+            pending.add(pool.submit(self._send, args, absolute_deadline, priority))
+        
+        error = None
+        while True:
+            for future in done:
+                if future.exception() is None:
+                    return future.result()
+                error = future.exception()
+            if not pending:
+                raise error
+            done, pending = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+
+_model_connections = {}
+_model_connections_lock = threading.Lock()
+
 def get_model_connection(url):
     """
     Get a connection to the object endpoint for model operations.
     
+    The connection is shared by all callers for the same URL, so every
+    request to that server goes through one request scheduler.
+    
     Args:
         url (str): The Odoo server URL
         
     Returns:
-        ServerProxy: An XML-RPC proxy for model operations
+        ModelConnection: A scheduled XML-RPC connection for model operations
+    """
+    with _model_connections_lock:
+        if url not in _model_connections:
+            _model_connections[url] = ModelConnection(url)
+        return _model_connections[url]
+
+def iter_search_read(models, config, uid, model, domain, fields, page_size=500):
+    """
+    Iterate over search_read results one page at a time.
+    
+    Pages are fetched with an ``id > last_id`` cursor rather than an offset,
+    so each page costs the same no matter how deep into the result set it is
+    and only one page is held in memory at a time.
+    
+    Args:
+        models (ModelConnection): Connection for model operations
+        config (dict): Configuration dictionary with Odoo connection parameters
+        uid (int): User ID for authentication
+        model (str): Model name, e.g. 'stock.quant'
+        domain (list): Search domain
+        fields (list): Fields to read
+        page_size (int): Number of records fetched per request
+        
+    Yields:
+        list: One page of records, in ascending id order
     """
-    return xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
\ No newline at end of file
+    last_id = 0
+    while True:
+        page = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            model, 'search_read',
+            [list(domain) + [['id', '>', last_id]]],
+            {'fields': fields, 'order': 'id asc', 'limit': page_size}
+        )
+        if not page:
+            return
+        yield page
+        if len(page) < page_size:
+            return
+        last_id = page[-1]['id']
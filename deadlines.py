@@ -0,0 +1,90 @@
+"""
+Deadlines for requests to Odoo.
+
+A deadline set with the deadline() context manager applies to every request
+made inside the block, including requests made by nested helper functions,
+so a multi-step workflow can be given one overall time budget.
+"""
+import contextlib
+import threading
+import time
+
+_local = threading.local()
+
+class DeadlineExceeded(TimeoutError):
+    """Raised when a request cannot finish before the current deadline."""
+
+def current_deadline():
+    """
+    Return the deadline of the calling thread.
+
+    Returns:
+        float or None: Absolute time.monotonic() value, or None without a deadline
+    """
+    return getattr(_local, 'deadline', None)
+
+@contextlib.contextmanager
+def deadline(seconds):
+    """
+    Limit the requests made inside the block to the given number of seconds.
+
+    Nested deadlines never extend an outer one; the earliest deadline wins.
+
+    Args:
+        seconds (float): Time budget for the block, or None for no limit
+    """
+    previous = current_deadline()
+    new_deadline = previous
+    if seconds is not None:
+        candidate = time.monotonic() + seconds
+        new_deadline = candidate if previous is None else min(previous, candidate)
+    _local.deadline = new_deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+@contextlib.contextmanager
+def use_deadline(absolute_deadline):
+    """
+    Apply a deadline captured in another thread.
+
+    Worker threads do not inherit the deadline of the thread that started
+    them, so code handing work to a thread passes current_deadline() along
+    and the worker re-enters it with this context manager.
+
+    Args:
+        absolute_deadline (float): Value returned by current_deadline()
+    """
+    previous = current_deadline()
+    _local.deadline = absolute_deadline
+    try:
+        yield
+    finally:
+        _local.deadline = previous
+
+def remaining_time(absolute_deadline=None):
+    """
+    Seconds left until a deadline.
+
+    Args:
+        absolute_deadline (float): Deadline to check (defaults to the current one)
+
+    Returns:
+        float or None: Seconds left (may be negative), or None without a deadline
+    """
+    absolute_deadline = current_deadline() if absolute_deadline is None else absolute_deadline
+    if absolute_deadline is None:
+        return None
+    return absolute_deadline - time.monotonic()
+
+def check_deadline(absolute_deadline=None):
+    """
+    Raise DeadlineExceeded if the deadline has passed.
+
+    Args:
+        absolute_deadline (float): Deadline to check (defaults to the current one)
+    """
+    remaining = remaining_time(absolute_deadline)
+    if remaining is not None and remaining <= 0:
+        raise DeadlineExceeded("Deadline exceeded before the request could be sent")
@@ -0,0 +1,256 @@
+"""
+Functions for shipping confirmed sales orders in Odoo.
+"""
+import xmlrpc.client
+from cache import get_cached
+from config import BULK_CONFIG
+from connection import get_model_connection
+from shared_cache import schema_validator
+from bulk_operations import _fault_message, chunked, write_grouped
+from inventory_operations import invalidate_product_availability
+from report_output import ConsoleTableSink, ReportColumn
+from request_scheduler import PRIORITY_BULK, request_priority
+
+# Delivery states that still need to be shipped
+OPEN_PICKING_STATES = ['confirmed', 'waiting', 'assigned']
+
+# Wizards button_validate may return instead of validating
+BACKORDER_WIZARD = 'stock.backorder.confirmation'
+IMMEDIATE_TRANSFER_WIZARD = 'stock.immediate.transfer'
+
+FULFILLMENT_COLUMNS = [
+    ReportColumn('picking', 'Delivery', 20),
+    ReportColumn('order', 'Order', 15),
+    ReportColumn('moves', 'Moves', 8),
+    ReportColumn('state', 'State', 12),
+    ReportColumn('error', 'Error', 50),
+]
+
+def _done_quantity_vals(uid, config, models):
+    """
+    Return how to read a move's reserved quantity and ship it on this Odoo version.
+
+    Odoo 17 and later keep the reserved quantity in quantity and ship it with
+    the picked flag; earlier versions report it as reserved_availability and
+    take the shipped quantity as quantity_done, which fills in the move lines.
+
+    Returns:
+        tuple: (reserved quantity field, function taking a reserved quantity
+            and returning the values to write)
+    """
+    def load():
+        fields = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'stock.move', 'fields_get',
+            [], {'attributes': ['type']}
+        )
+        return 'picked' in fields and 'quantity' in fields
+
+    if get_cached(config, 'stock.move.picked', load, shared=True, validator=schema_validator(uid, config, 'stock.move')):
+        return 'quantity', lambda reserved: {'quantity': reserved, 'picked': True}
+    return 'reserved_availability', lambda reserved: {'quantity_done': reserved}
+
+def _process_wizards(uid, config, models, action, create_backorders):
+    """
+    Confirm the wizards button_validate returned, for all pickings at once.
+
+    The wizard is created with the context of the returned action, which
+    holds the IDs of every picking being validated, so one create and one
+    process call answer it for the whole batch.
+
+    Returns:
+        bool: True when the pickings were validated
+    """
+    # A validation can chain an immediate transfer wizard into a backorder one
+    for _ in range(3):
+        if not isinstance(action, dict) or not action.get('res_model'):
+            return True
+
+        wizard_model = action['res_model']
+        context = action.get('context') or {}
+        if wizard_model == BACKORDER_WIZARD:
+            method = 'process' if create_backorders else 'process_cancel_backorder'
+        elif wizard_model == IMMEDIATE_TRANSFER_WIZARD:
+            method = 'process'
+        else:
+            print(f"Unexpected wizard after validation: {wizard_model}")
+            return False
+
+        wizard_id = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            wizard_model, 'create',
+            [{}], {'context': context}
+        )
+        action = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            wizard_model, method,
+            [[wizard_id]], {'context': context}
+        )
+    return not isinstance(action, dict) or not action.get('res_model')
+
+def _validate_pickings(uid, config, models, picking_ids, create_backorders):
+    """
+    Validate pickings with one button_validate call, one by one if it fails.
+
+    Returns:
+        dict: Mapping of picking ID to an error message (None on success)
+    """
+    try:
+        action = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'stock.picking', 'button_validate',
+            [picking_ids]
+        )
+        if _process_wizards(uid, config, models, action, create_backorders):
+            return {picking_id: None for picking_id in picking_ids}
+        return {picking_id: "Validation needs manual confirmation" for picking_id in picking_ids}
+    except xmlrpc.client.Fault as e:
+        if len(picking_ids) == 1:
+            return {picking_ids[0]: _fault_message(e)}
+
+    # One bad picking fails the whole call, so find it by validating one by one
+    errors = {}
+    for picking_id in picking_ids:
+        errors.update(_validate_pickings(uid, config, models, [picking_id], create_backorders))
+    return errors
+
+def ship_orders(uid, config, order_ids=None, order_names=None, sink=None, create_backorders=True, chunk_size=None):
+    """
+    Ship the open deliveries of confirmed sales orders.
+
+    The deliveries of all orders are found with one search and their moves
+    with another. Each move ships what is reserved for it, set with grouped
+    writes, and each chunk of deliveries is validated with a single
+    button_validate call; backorder and immediate transfer wizards are
+    answered for the whole chunk at once. Quantities without reserved stock
+    go to a backorder (or are cancelled), and deliveries with nothing
+    reserved are left open.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        order_ids (list): Sales order IDs to ship
+        order_names (list): Sales order references to ship, e.g. ['S00042'];
+            without order_ids or order_names all orders with open deliveries are shipped
+        sink (object): Report sink for the per-delivery results (defaults to console table)
+        create_backorders (bool): Keep unshipped quantities on a backorder
+            instead of cancelling them
+        chunk_size (int): Deliveries per validation call
+
+    Returns:
+        dict: Number of deliveries per outcome ('shipped', 'waiting', 'failed')
+    """
+    summary = {'shipped': 0, 'waiting': 0, 'failed': 0}
+
+    if not uid:
+        return summary
+
+    sink = sink or ConsoleTableSink()
+    chunk_size = chunk_size or BULK_CONFIG['chunk_size']
+
+    try:
+        print("\n--- SHIPPING CONFIRMED ORDERS ---")
+        models = get_model_connection(config['url'])
+
+        with request_priority(PRIORITY_BULK):
+            domain = [['picking_type_code', '=', 'outgoing'], ['state', 'in', OPEN_PICKING_STATES]]
+            if order_ids:
+                domain.append(['sale_id', 'in', list(order_ids)])
+            elif order_names:
+                domain.append(['sale_id.name', 'in', list(order_names)])
+            else:
+                domain.append(['sale_id', '!=', False])
+            pickings = models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'stock.picking', 'search_read',
+                [domain],
+                {'fields': ['id', 'name', 'state', 'sale_id'], 'order': 'id asc'}
+            )
+
+            if not pickings:
+                print("No open deliveries found")
+                return summary
+
+            picking_ids = [picking['id'] for picking in pickings]
+            print(f"Found {len(pickings)} open deliveries")
+
+            # Reserve stock for deliveries still waiting; failures are left to validation
+            waiting_ids = [picking['id'] for picking in pickings if picking['state'] != 'assigned']
+            if waiting_ids:
+                try:
+                    models.execute_kw(
+                        config['db_name'], uid, config['password'],
+                        'stock.picking', 'action_assign',
+                        [waiting_ids]
+                    )
+                except Exception as e:
+                    print(f"Warning: Could not reserve stock: {str(e)}")
+
+            reserved_field, done_vals = _done_quantity_vals(uid, config, models)
+            moves = models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'stock.move', 'search_read',
+                [[['picking_id', 'in', picking_ids], ['state', 'not in', ['done', 'cancel']]]],
+                {'fields': ['id', 'picking_id', 'product_id', 'product_uom_qty', reserved_field]}
+            )
+
+            # Ship only what is reserved; forcing the demand would drive stock negative
+            shippable = {move['id']: min(move.get(reserved_field) or 0.0, move['product_uom_qty']) for move in moves}
+            move_errors = write_grouped(models, config, uid, 'stock.move',
+                                        {move_id: done_vals(quantity)
+                                         for move_id, quantity in shippable.items() if quantity > 0})
+
+            move_count = {}
+            reserved = set()
+            errors = {}
+            for move in moves:
+                picking_id = move['picking_id'][0]
+                move_count[picking_id] = move_count.get(picking_id, 0) + 1
+                if shippable[move['id']] > 0:
+                    reserved.add(picking_id)
+                if move_errors.get(move['id']):
+                    errors[picking_id] = move_errors[move['id']]
+
+            waiting = {picking_id for picking_id in picking_ids if picking_id not in reserved}
+            for chunk in chunked([picking_id for picking_id in picking_ids
+                                  if picking_id not in errors and picking_id not in waiting], chunk_size):
+                errors.update(_validate_pickings(uid, config, models, chunk, create_backorders))
+
+            states = {
+                picking['id']: picking['state']
+                for picking in models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    'stock.picking', 'read',
+                    [picking_ids], {'fields': ['state']}
+                )
+            }
+
+        invalidate_product_availability(config, list({move['product_id'][0] for move in moves}))
+
+        sink.begin_section('fulfillment', "Shipped Deliveries", FULFILLMENT_COLUMNS, rule_width=110)
+        for picking in pickings:
+            error = errors.get(picking['id'])
+            state = states.get(picking['id'], picking['state'])
+            if picking['id'] in waiting and not error:
+                error = "No stock reserved; left open"
+                summary['waiting'] += 1
+            else:
+                if not error and state != 'done':
+                    error = f"Delivery is {state} after validation"
+                summary['failed' if error else 'shipped'] += 1
+            sink.write_row({
+                'picking': picking['name'],
+                'order': picking['sale_id'][1] if picking.get('sale_id') else '',
+                'moves': move_count.get(picking['id'], 0),
+                'state': state,
+                'error': error or '',
+            })
+        sink.end_section()
+    except Exception as e:
+        print(f"Error shipping orders: {str(e)}")
+    finally:
+        sink.close()
+
+    print(f"\nFulfillment summary: {summary['shipped']} shipped, {summary['waiting']} waiting for stock, "
+          f"{summary['failed']} failed")
+    return summary
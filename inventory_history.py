@@ -0,0 +1,351 @@
+"""
+Stock positions at past dates, rebuilt from the stock move history.
+
+Done stock.move.line records are streamed once in (date, id) order and
+applied to running balances per product and internal location. Snapshots of
+the balances are saved locally at regular intervals, so a later as-of query
+only replays the moves after the nearest snapshot before its date.
+
+Locations are read with archived ones included, since moves into and out of
+a location archived later still make up the past balances, and done
+quantities recorded in the unit of the move line are converted to the
+product's unit.
+"""
+import datetime
+import hashlib
+import json
+import os
+import xmlrpc.client
+from cache import get_cached
+from cache_validation import get_model_slice
+from config import BULK_CONFIG, HISTORY_CONFIG, REPORT_CONFIG
+from connection import get_model_connection
+from shared_cache import model_validator, schema_validator
+from report_output import ConsoleTableSink, ReportColumn
+
+ODOO_DATETIME_FORMAT = '%Y-%m-%d %H:%M:%S'
+
+# Stored in snapshots; snapshots of another version are rebuilt
+SNAPSHOT_VERSION = 2
+
+# Domain leaf that lifts the active filter, like the active_test: False context
+ANY_ACTIVE = ['active', 'in', [True, False]]
+
+def _quantity_field(uid, config, models):
+    """
+    Field holding the done quantity of a move line, in the product's unit.
+
+    Odoo 17 has quantity_product_uom; older versions record qty_done in the
+    unit of the line.
+    """
+    def load():
+        fields = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'stock.move.line', 'fields_get',
+            [], {'attributes': ['type']}
+        )
+        for name in ('quantity_product_uom', 'qty_done', 'quantity'):
+            if name in fields:
+                return name
+        return 'qty_done'
+
+    return get_cached(config, 'stock.move.line.quantity_field', load, shared=True,
+                      validator=schema_validator(uid, config, 'stock.move.line'))
+
+def _internal_locations(uid, config):
+    """
+    Names of all internal locations, archived ones included.
+
+    The location index only holds active locations, so history reads its
+    own slice of stock.location.
+
+    Returns:
+        dict: Location ID to complete name
+    """
+    locations = get_model_slice(uid, config, 'stock.location.internal.all', 'stock.location',
+                                [['usage', '=', 'internal'], ANY_ACTIVE], ['id', 'name', 'complete_name']).as_list()
+    return {location['id']: location.get('complete_name') or location['name'] for location in locations}
+
+def _uom_factors(uid, config, models):
+    """
+    Conversion factors of all units of measure, archived ones included.
+
+    Returns:
+        dict: Unit ID (as a string, like all keys of shared values) to its factor
+            relative to the reference unit of its category
+    """
+    def load():
+        for model in ('uom.uom', 'product.uom'):
+            try:
+                units = models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    model, 'search_read',
+                    [[ANY_ACTIVE]], {'fields': ['id', 'factor']}
+                )
+                return {str(unit['id']): unit['factor'] for unit in units}
+            except xmlrpc.client.Fault:
+                # Odoo before 12 names the model product.uom
+                continue
+        return {}
+
+    return get_cached(config, 'uom.uom.factors', load, shared=True,
+                      validator=model_validator(uid, config, 'uom.uom', [ANY_ACTIVE]))
+
+def _after_cursor(cursor):
+    """Domain for move lines after a (date, id) cursor."""
+    if not cursor:
+        return []
+    date, line_id = cursor
+    return ['|', ['date', '>', date], '&', ['date', '=', date], ['id', '>', line_id]]
+
+def _up_to_cursor(cursor):
+    """Domain for move lines up to and including a (date, id) cursor."""
+    date, line_id = cursor
+    return ['|', ['date', '<', date], '&', ['date', '=', date], ['id', '<=', line_id]]
+
+class StockHistory:
+    """
+    Replays done move lines into balances and keeps local snapshots.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        snapshot_dir (str): Directory for the snapshots of this Odoo instance
+            (defaults to a folder under BULK_CONFIG['checkpoint_dir'])
+    """
+
+    def __init__(self, uid, config, snapshot_dir=None):
+        self.uid = uid
+        self.config = config
+        self.models = get_model_connection(config['url'])
+        instance = hashlib.sha1(f"{config['url']}:{config['db_name']}".encode('utf-8')).hexdigest()[:12]
+        self.snapshot_dir = snapshot_dir or os.path.join(BULK_CONFIG['checkpoint_dir'], 'inventory_history', instance)
+
+    def snapshots(self):
+        """
+        List the saved snapshots, oldest first.
+
+        Returns:
+            list: (cursor date, cursor line ID, path) tuples
+        """
+        if not os.path.isdir(self.snapshot_dir):
+            return []
+        snapshots = []
+        for name in os.listdir(self.snapshot_dir):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stamp, line_id = name[:-5].split('_')
+                date = datetime.datetime.strptime(stamp, '%Y%m%d%H%M%S').strftime(ODOO_DATETIME_FORMAT)
+                snapshots.append((date, int(line_id), os.path.join(self.snapshot_dir, name)))
+            except ValueError:
+                continue
+        return sorted(snapshots)
+
+    def _save(self, cursor, line_count, balances):
+        """Write a snapshot atomically so a crash never leaves half a file."""
+        os.makedirs(self.snapshot_dir, exist_ok=True)
+        stamp = datetime.datetime.strptime(cursor[0], ODOO_DATETIME_FORMAT).strftime('%Y%m%d%H%M%S')
+        path = os.path.join(self.snapshot_dir, f"{stamp}_{cursor[1]}.json")
+        temp_path = path + '.tmp'
+        with open(temp_path, 'w', encoding='utf-8') as handle:
+            json.dump({
+                'version': SNAPSHOT_VERSION,
+                'date': cursor[0],
+                'line_id': cursor[1],
+                'line_count': line_count,
+                'balances': [[product_id, location_id, quantity]
+                             for (product_id, location_id), quantity in balances.items() if quantity],
+            }, handle)
+        os.replace(temp_path, path)
+
+    def _load(self, path):
+        """Read a snapshot back, checking that no move was backdated before it."""
+        with open(path, encoding='utf-8') as handle:
+            snapshot = json.load(handle)
+        if snapshot.get('version') != SNAPSHOT_VERSION:
+            return None
+        cursor = (snapshot['date'], snapshot['line_id'])
+        line_count = self.models.execute_kw(
+            self.config['db_name'], self.uid, self.config['password'],
+            'stock.move.line', 'search_count',
+            [[['state', '=', 'done']] + _up_to_cursor(cursor)]
+        )
+        if line_count != snapshot['line_count']:
+            return None
+        balances = {(product_id, location_id): quantity
+                    for product_id, location_id, quantity in snapshot['balances']}
+        return cursor, line_count, balances
+
+    def _starting_point(self, as_of):
+        """Find the newest valid snapshot at or before a date, dropping invalid ones."""
+        for date, line_id, path in reversed(self.snapshots()):
+            if date > as_of:
+                continue
+            try:
+                loaded = self._load(path)
+            except (OSError, ValueError, KeyError):
+                loaded = None
+            if loaded:
+                return loaded
+            # Moves were added before this snapshot later on, so it and all newer ones are wrong
+            for later_date, later_id, later_path in self.snapshots():
+                if (later_date, later_id) >= (date, line_id):
+                    os.remove(later_path)
+        return None, 0, {}
+
+    def balances_as_of(self, as_of):
+        """
+        Rebuild stock balances at a point in time.
+
+        Args:
+            as_of (str): UTC date and time as 'YYYY-MM-DD HH:MM:SS'
+
+        Returns:
+            dict: {(product_id, location_id): quantity} for internal locations
+        """
+        cursor, line_count, balances = self._starting_point(as_of)
+        internal = _internal_locations(self.uid, self.config)
+        quantity_field = _quantity_field(self.uid, self.config, self.models)
+        interval = datetime.timedelta(days=HISTORY_CONFIG['snapshot_interval_days'])
+        last_snapshot = datetime.datetime.strptime(cursor[0], ODOO_DATETIME_FORMAT) if cursor else None
+
+        # Before Odoo 17 the done quantity is in the unit of the line
+        fields = ['date', 'product_id', 'location_id', 'location_dest_id', quantity_field]
+        convert = quantity_field != 'quantity_product_uom'
+        if convert:
+            fields.append('product_uom_id')
+            factors = _uom_factors(self.uid, self.config, self.models)
+            product_uoms = {}
+
+        def is_internal(location):
+            return bool(location) and location[0] in internal
+
+        def in_product_uom(line, quantity):
+            line_uom = line.get('product_uom_id')
+            product_uom = product_uoms.get(line['product_id'][0])
+            if not line_uom or not product_uom or line_uom[0] == product_uom:
+                return quantity
+            line_factor, product_factor = factors.get(str(line_uom[0])), factors.get(str(product_uom))
+            if not line_factor or not product_factor:
+                raise ValueError(f"No conversion from {line_uom[1]} for move line {line['id']}")
+            return quantity / line_factor * product_factor
+
+        page_size = REPORT_CONFIG['page_size']
+        while True:
+            lines = self.models.execute_kw(
+                self.config['db_name'], self.uid, self.config['password'],
+                'stock.move.line', 'search_read',
+                [[['state', '=', 'done'], ['date', '<=', as_of]] + _after_cursor(cursor)],
+                {'fields': fields, 'order': 'date asc, id asc', 'limit': page_size}
+            )
+            if not lines:
+                break
+
+            if convert:
+                missing = list({line['product_id'][0] for line in lines} - set(product_uoms))
+                if missing:
+                    for product in self.models.execute_kw(
+                        self.config['db_name'], self.uid, self.config['password'],
+                        'product.product', 'read',
+                        [missing], {'fields': ['uom_id'], 'context': {'active_test': False}}
+                    ):
+                        product_uoms[product['id']] = product['uom_id'][0] if product.get('uom_id') else None
+
+            for line in lines:
+                product_id = line['product_id'][0]
+                quantity = line.get(quantity_field) or 0.0
+                if convert:
+                    quantity = in_product_uom(line, quantity)
+                if is_internal(line['location_id']):
+                    key = (product_id, line['location_id'][0])
+                    balances[key] = balances.get(key, 0.0) - quantity
+                if is_internal(line['location_dest_id']):
+                    key = (product_id, line['location_dest_id'][0])
+                    balances[key] = balances.get(key, 0.0) + quantity
+
+            line_count += len(lines)
+            cursor = (lines[-1]['date'], lines[-1]['id'])
+            cursor_time = datetime.datetime.strptime(cursor[0], ODOO_DATETIME_FORMAT)
+            if last_snapshot is None or cursor_time - last_snapshot >= interval:
+                self._save(cursor, line_count, balances)
+                last_snapshot = cursor_time
+
+            if len(lines) < page_size:
+                break
+
+        return balances
+
+def generate_inventory_as_of_report(uid, config, as_of, sink=None):
+    """
+    Generate an inventory report for a past date and time.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        as_of (str): UTC date and time as 'YYYY-MM-DD HH:MM:SS'; a date alone
+            means the end of that day
+        sink (object): Report sink from report_output (defaults to console table)
+
+    Returns:
+        bool: True if the report was written, False if it failed
+    """
+    if not uid:
+        return False
+
+    as_of = as_of.strip()
+    if len(as_of) == 10:
+        as_of += ' 23:59:59'
+    try:
+        datetime.datetime.strptime(as_of, ODOO_DATETIME_FORMAT)
+    except ValueError:
+        print(f"Invalid date '{as_of}'. Use YYYY-MM-DD or YYYY-MM-DD HH:MM:SS")
+        return False
+
+    sink = sink or ConsoleTableSink()
+
+    try:
+        print(f"\n--- GENERATING INVENTORY REPORT AS OF {as_of} ---")
+        models = get_model_connection(config['url'])
+        balances = StockHistory(uid, config).balances_as_of(as_of)
+        locations = _internal_locations(uid, config)
+
+        stock = [(locations.get(location_id, f"Location {location_id}"), product_id, quantity)
+                 for (product_id, location_id), quantity in balances.items() if abs(quantity) > 1e-9]
+
+        product_names = {}
+        product_ids = list({product_id for _, product_id, _ in stock})
+        for start in range(0, len(product_ids), REPORT_CONFIG['page_size']):
+            products = models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'product.product', 'read',
+                [product_ids[start:start + REPORT_CONFIG['page_size']]],
+                {'fields': ['name'], 'context': {'active_test': False}}
+            )
+            product_names.update({product['id']: product['name'] for product in products})
+
+        sink.begin_section('inventory_as_of', f"Inventory as of {as_of} (UTC)", [
+            ReportColumn('location', 'Location', 30),
+            ReportColumn('product_id', 'Product ID', 10, console=False),
+            ReportColumn('product', 'Product', 30),
+            ReportColumn('quantity', 'Quantity', 10, '.2f'),
+        ], rule_width=80)
+
+        for location_name, product_id, quantity in sorted(
+                stock, key=lambda row: (row[0], product_names.get(row[1], ''))):
+            sink.write_row({
+                'location': location_name,
+                'product_id': product_id,
+                'product': product_names.get(product_id, f"Unknown ({product_id})"),
+                'quantity': quantity
+            })
+
+        if not stock:
+            sink.write_note("No inventory at that time")
+        sink.end_section()
+        return True
+    except Exception as e:
+        print(f"Error generating inventory report: {str(e)}")
+        return False
+    finally:
+        sink.close()
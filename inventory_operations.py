@@ -1,7 +1,21 @@
 """
 Functions for managing inventory in Odoo.
 """
-from connection import get_model_connection
+from cache import get_cached_many, invalidate_many
+from config import CACHE_CONFIG, JOURNAL_CONFIG, REPORT_CONFIG
+from connection import get_model_connection, is_connection_error, iter_search_read
+from cache_validation import get_model_slice
+from bulk_operations import (
+    AdaptiveBatchSizer,
+    ChunkNeedsReview,
+    JobCheckpoint,
+    create_records,
+    iter_file_records,
+    run_checkpointed_job,
+    write_grouped
+)
+from report_output import ConsoleTableSink, ReportColumn
+from location_index import get_location_index, get_subtree_stock
 
 def get_warehouses(uid, config):
     """
@@ -21,12 +35,7 @@ def get_warehouses(uid, config):
         models = get_model_connection(config['url'])
         
         # Get warehouses
-        warehouses = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'stock.warehouse', 'search_read',
-            [[]],
-            {'fields': ['id', 'name', 'code', 'lot_stock_id']}
-        )
+        warehouses = load_warehouses(uid, config, models)
         
         print("\nAvailable warehouses:")
         for wh in warehouses:
@@ -73,6 +82,130 @@ def get_stock_locations(uid, config):
         print(f"Error getting stock locations: {str(e)}")
         return []
 
+AVAILABILITY_FIELDS = ['qty_available', 'virtual_available']
+
+def load_warehouses(uid, config, models):
+    """Read the warehouses and their stock locations, cached and validated per Odoo instance."""
+    return get_model_slice(uid, config, 'stock.warehouse', 'stock.warehouse',
+                           fields=['id', 'name', 'code', 'lot_stock_id']).as_list()
+
+def _read_availability(uid, config, models, product_ids):
+    """
+    Read on-hand and forecast quantities of products in every warehouse.
+    
+    Makes one product.product read per warehouse, using the 'warehouse'
+    context so Odoo computes the quantities for that warehouse only. If the
+    server rejects the context reads, the on-hand quantities are rolled up
+    from grouped quants instead and the forecast is taken to be the same.
+    
+    Returns:
+        dict: {product_id: availability dict}, see get_product_availability
+    """
+    warehouses = load_warehouses(uid, config, models)
+    availability = {
+        product_id: {'qty_available': 0.0, 'virtual_available': 0.0, 'warehouses': {}}
+        for product_id in product_ids
+    }
+    
+    try:
+        for wh in warehouses:
+            products = models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'product.product', 'read',
+                [list(product_ids)],
+                {'fields': AVAILABILITY_FIELDS, 'context': {'warehouse': wh['id']}}
+            )
+            for product in products:
+                entry = availability.get(product['id'])
+                if entry is None:
+                    continue
+                entry['warehouses'][wh['id']] = {field: product.get(field) or 0.0 for field in AVAILABILITY_FIELDS}
+    except Exception:
+        # Fall back to quants: one grouped read rolled up to each warehouse stock location
+        stock_locations = {wh['lot_stock_id'][0]: wh['id'] for wh in warehouses if wh.get('lot_stock_id')}
+        subtree_stock = get_subtree_stock(uid, config, list(stock_locations), product_ids)
+        for location_id, wh_id in stock_locations.items():
+            for product_id, entry in availability.items():
+                quantity = subtree_stock[location_id].get(product_id, 0.0)
+                entry['warehouses'][wh_id] = {'qty_available': quantity, 'virtual_available': quantity}
+    
+    for entry in availability.values():
+        for field in AVAILABILITY_FIELDS:
+            entry[field] = sum(wh_entry[field] for wh_entry in entry['warehouses'].values())
+    
+    return availability
+
+def get_product_availability(uid, config, product_ids):
+    """
+    Get on-hand and forecast quantities of products across all warehouses.
+    
+    Results are cached per product for CACHE_CONFIG['availability_ttl']
+    seconds, so checking a basket only reads the products not seen recently,
+    with one request per warehouse for all of them.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        product_ids (list): Product IDs to look up
+        
+    Returns:
+        dict: {product_id: {'qty_available': float, 'virtual_available': float,
+            'warehouses': {warehouse_id: {'qty_available': float,
+            'virtual_available': float}}}}, or empty dict if error
+    """
+    if not uid or not product_ids:
+        return {}
+    
+    try:
+        models = get_model_connection(config['url'])
+        return get_cached_many(
+            config, 'product.availability', list(dict.fromkeys(product_ids)),
+            lambda missing: _read_availability(uid, config, models, missing),
+            ttl=CACHE_CONFIG['availability_ttl']
+        )
+    except Exception as e:
+        print(f"Error getting product availability: {str(e)}")
+        return {}
+
+def invalidate_product_availability(config, product_ids):
+    """Drop cached availability of products whose stock has changed."""
+    invalidate_many(config, 'product.availability', product_ids)
+
+def check_basket_availability(uid, config, basket, warehouse_id=None):
+    """
+    Check that there is enough stock for every line of a basket.
+    
+    Quantities are compared with the forecast (virtual_available), which
+    already accounts for stock reserved by other confirmed orders.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        basket (list): List of (product_id, quantity) tuples
+        warehouse_id (int): Check this warehouse only (all warehouses if None)
+        
+    Returns:
+        list: One dict with product_id, requested and available per line that
+            cannot be fulfilled; empty if everything is in stock
+    """
+    requested = {}
+    for product_id, quantity in basket:
+        requested[product_id] = requested.get(product_id, 0) + quantity
+    
+    availability = get_product_availability(uid, config, list(requested))
+    shortages = []
+    for product_id, quantity in requested.items():
+        entry = availability.get(product_id)
+        if entry is None:
+            available = 0.0
+        elif warehouse_id:
+            available = entry['warehouses'].get(warehouse_id, {}).get('virtual_available', 0.0)
+        else:
+            available = entry['virtual_available']
+        if available < quantity:
+            shortages.append({'product_id': product_id, 'requested': quantity, 'available': available})
+    return shortages
+
 def add_product_to_warehouse(uid, config, product_id, location_id, quantity=10):
     """
     Add product inventory to a specific warehouse location.
@@ -91,6 +224,12 @@ def add_product_to_warehouse(uid, config, product_id, location_id, quantity=10):
         print("Missing required parameters for adding inventory")
         return False
     
+    # Stock is about to change, so the cached availability is no longer valid
+    invalidate_product_availability(config, [product_id])
+    
+    # Set once a request that changes stock has been sent
+    stock_written = False
+    
     try:
         print(f"\n--- ADDING PRODUCT (ID: {product_id}) TO LOCATION (ID: {location_id}) ---")
         models = get_model_connection(config['url'])
@@ -141,6 +280,7 @@ def add_product_to_warehouse(uid, config, product_id, location_id, quantity=10):
                 print(f"Found existing quant ID: {quant_id} with quantity: {current_qty}")
                 
                 # Update the existing quant with new quantity
+                stock_written = True
                 result = models.execute_kw(
                     config['db_name'], uid, config['password'],
                     'stock.quant', 'write',
@@ -179,6 +319,7 @@ def add_product_to_warehouse(uid, config, product_id, location_id, quantity=10):
                 if company_user and company_user[0].get('partner_id'):
                     quant_vals['owner_id'] = company_user[0]['partner_id'][0]
                 
+                stock_written = True
                 quant_id = models.execute_kw(
                     config['db_name'], uid, config['password'],
                     'stock.quant', 'create',
@@ -189,6 +330,9 @@ def add_product_to_warehouse(uid, config, product_id, location_id, quantity=10):
                 return True
                 
         except Exception as e:
+            # The other methods cannot work either while Odoo is unreachable
+            if is_connection_error(e):
+                raise
             print(f"Error directly updating stock.quant: {str(e)}")
             
             # Try to use the stock_change_product_qty wizard which is often available
@@ -284,19 +428,39 @@ def add_product_to_warehouse(uid, config, product_id, location_id, quantity=10):
                     return False
         
     except Exception as e:
+        if JOURNAL_CONFIG['enabled'] and is_connection_error(e) and not stock_written:
+            # Nothing was changed in Odoo yet, so the addition can be sent later
+            from write_journal import queue_stock_addition
+            key = queue_stock_addition(config, product_id, location_id, quantity)
+            print(f"Odoo could not be reached ({str(e)}); stock addition queued in the write journal as {key}")
+            return True
+        if stock_written and is_connection_error(e):
+            print(f"Connection lost while adding stock ({str(e)}); check the quantity in Odoo before retrying")
+            return False
         print(f"Error in add_product_to_warehouse: {str(e)}")
         return False
 
-def generate_inventory_report(uid, config):
+def generate_inventory_report(uid, config, sink=None):
     """
     Generate inventory report for all locations.
     
+    Each warehouse's stock location is reported together with all of its
+    sub-locations (zones, bins), found through the cached location index.
+    Rows are written to the sink as each page of quants arrives, so the
+    report uses constant memory apart from the per-product totals.
+    
     Args:
         uid (int): User ID for authentication
         config (dict): Configuration dictionary with Odoo connection parameters
+        sink (object): Report sink from report_output (defaults to console table)
+        
+    Returns:
+        bool: True if the report was written, False if it failed
     """
     if not uid:
-        return
+        return False
+    
+    sink = sink or ConsoleTableSink()
     
     try:
         print("\n--- GENERATING INVENTORY REPORT ---")
@@ -314,53 +478,348 @@ def generate_inventory_report(uid, config):
                     'warehouse': wh['name']
                 })
         
-        # Get products with inventory information
-        print("\nLocation-wise Inventory Report:")
-        print("-" * 80)
-        print(f"{'Location':<30} {'Product':<30} {'Quantity':<10}")
-        print("-" * 80)
+        index = get_location_index(uid, config)
+        
+        # Stream quants location by location
+        sink.begin_section('location_inventory', "Location-wise Inventory Report", [
+            ReportColumn('location', 'Location', 30),
+            ReportColumn('warehouse', 'Warehouse', 20, console=False),
+            ReportColumn('product_id', 'Product ID', 10, console=False),
+            ReportColumn('product', 'Product', 30),
+            ReportColumn('quantity', 'Quantity', 10, '.2f'),
+        ], rule_width=80)
         
         total_inventory = {}
+        direct_stock = {}  # (location_id, product_id) -> quantity held directly there
+        product_names = {}
         
         for location in stock_locations:
-            # Get quants for this location
-            quants = models.execute_kw(
-                config['db_name'], uid, config['password'],
-                'stock.quant', 'search_read',
-                [[['location_id', '=', location['id']], ['quantity', '>', 0]]],
-                {'fields': ['product_id', 'quantity']}
+            found = False
+            pages = iter_search_read(
+                models, config, uid, 'stock.quant',
+                [['location_id', 'in', index.descendants(location['id'])], ['quantity', '>', 0]],
+                ['product_id', 'location_id', 'quantity'],
+                page_size=REPORT_CONFIG['page_size']
             )
             
-            if not quants:
-                print(f"{location['name']} ({location['warehouse']}):<30 No inventory")
-                continue
-            
-            for quant in quants:
-                product = models.execute_kw(
-                    config['db_name'], uid, config['password'],
-                    'product.product', 'read',
-                    [quant['product_id'][0]],
-                    {'fields': ['name']}
-                )
+            for quants in pages:
+                found = True
                 
-                product_name = product[0]['name'] if product else f"Unknown ({quant['product_id'][0]})"
-                quantity = quant['quantity']
+                # Read the names of new products on the page in one request
+                product_ids = list({quant['product_id'][0] for quant in quants} - set(product_names))
+                if product_ids:
+                    products = models.execute_kw(
+                        config['db_name'], uid, config['password'],
+                        'product.product', 'read',
+                        [product_ids],
+                        {'fields': ['name']}
+                    )
+                    product_names.update({product['id']: product['name'] for product in products})
                 
-                print(f"{location['name']:<30} {product_name:<30} {quantity:<10.2f}")
+                for quant in quants:
+                    product_id = quant['product_id'][0]
+                    location_id = quant['location_id'][0]
+                    product_name = product_names.get(product_id, f"Unknown ({product_id})")
+                    quantity = quant['quantity']
+                    
+                    sink.write_row({
+                        'location': index.name(location_id) if location_id != location['id'] else location['name'],
+                        'warehouse': location['warehouse'],
+                        'product_id': product_id,
+                        'product': product_name,
+                        'quantity': quantity
+                    })
+                    
+                    # Add to total inventory
+                    if product_name not in total_inventory:
+                        total_inventory[product_name] = 0
+                    total_inventory[product_name] += quantity
+                    
+                    key = (location_id, product_id)
+                    direct_stock[key] = direct_stock.get(key, 0) + quantity
                 
-                # Add to total inventory
-                if product_name not in total_inventory:
-                    total_inventory[product_name] = 0
-                total_inventory[product_name] += quantity
+                sink.flush()
+            
+            if not found:
+                sink.write_note(f"{location['name'] + ' (' + location['warehouse'] + ')':<30} No inventory")
+        
+        sink.end_section()
+        
+        # Roll stock in zones and bins up to each branch
+        branch_totals = index.rollup(direct_stock)
         
-        # Print consolidated report
-        print("\nConsolidated Inventory Report:")
-        print("-" * 50)
-        print(f"{'Product':<30} {'Total Quantity':<10}")
-        print("-" * 50)
+        sink.begin_section('branch_inventory', "Branch Inventory (including sub-locations)", [
+            ReportColumn('warehouse', 'Warehouse', 20),
+            ReportColumn('product_id', 'Product ID', 10, console=False),
+            ReportColumn('product', 'Product', 30),
+            ReportColumn('quantity', 'Quantity', 10, '.2f'),
+        ], rule_width=70)
+        
+        by_branch = {}
+        for (location_id, product_id), quantity in branch_totals.items():
+            by_branch.setdefault(location_id, []).append((product_id, quantity))
+        
+        for location in stock_locations:
+            for product_id, quantity in by_branch.get(location['id'], []):
+                sink.write_row({
+                    'warehouse': location['warehouse'],
+                    'product_id': product_id,
+                    'product': product_names.get(product_id, f"Unknown ({product_id})"),
+                    'quantity': quantity
+                })
+        
+        sink.end_section()
+        
+        # Write consolidated report
+        sink.begin_section('consolidated_inventory', "Consolidated Inventory Report", [
+            ReportColumn('product', 'Product', 30),
+            ReportColumn('quantity', 'Total Quantity', 10, '.2f'),
+        ], rule_width=50)
         
         for product_name, quantity in total_inventory.items():
-            print(f"{product_name:<30} {quantity:<10.2f}")
+            sink.write_row({'product': product_name, 'quantity': quantity})
+        
+        sink.end_section()
+        return True
         
     except Exception as e:
-        print(f"Error generating inventory report: {str(e)}")
\ No newline at end of file
+        print(f"Error generating inventory report: {str(e)}")
+        return False
+    finally:
+        sink.close()
+
+STOCK_LOAD_COLUMNS = [
+    ReportColumn('row', 'Row', 8),
+    ReportColumn('default_code', 'Code', 20),
+    ReportColumn('location', 'Location', 25),
+    ReportColumn('quantity', 'Quantity', 10, '.2f'),
+    ReportColumn('status', 'Status', 10),
+    ReportColumn('id', 'Quant ID', 10),
+    ReportColumn('error', 'Error', 30),
+]
+
+def _internal_location_ids(uid, config, models):
+    """Map complete names of internal locations to their IDs, cached and validated per Odoo instance."""
+    locations = get_model_slice(uid, config, 'stock.location.internal', 'stock.location',
+                                [['usage', '=', 'internal']], ['id', 'complete_name']).as_list()
+    return {loc['complete_name'].lower(): loc['id'] for loc in locations if loc.get('complete_name')}
+
+def _load_stock_chunk(uid, config, models, rows, location_ids):
+    """
+    Add the quantities of one stock-load chunk to stock.quant.
+    
+    Products are resolved with one default_code search and the matching quants
+    with one search. Existing quants get grouped writes and missing ones are
+    created in one multi-record create, following add_product_to_warehouse.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        models (ModelConnection): Connection for model operations
+        rows (list): List of (row number, record) tuples
+        location_ids (dict): Location complete name (lower case) to ID
+        
+    Returns:
+        list: One result dict per row, in row order
+    """
+    results = {}
+    prepared = []
+    
+    for row_number, record in rows:
+        code = str(record.get('default_code') or record.get('code') or '').strip()
+        location = str(record.get('location') or '').strip()
+        result = {'row': row_number, 'default_code': code, 'location': location,
+                  'quantity': None, 'status': 'failed', 'id': None, 'error': None, 'key': None}
+        results[row_number] = result
+        
+        try:
+            result['quantity'] = float(record.get('quantity'))
+        except (TypeError, ValueError):
+            result['error'] = f"Invalid quantity: {record.get('quantity')!r}"
+            continue
+        
+        if not code and not record.get('product_id'):
+            result['error'] = "Missing default_code"
+            continue
+        
+        location_id = record.get('location_id') or location_ids.get(location.lower())
+        if not location_id:
+            result['error'] = f"Unknown location: {location}"
+            continue
+        
+        prepared.append((result, code, int(location_id), record.get('product_id')))
+    
+    # Resolve product codes in one search
+    product_ids = {}
+    codes = list({code for _, code, _, product_id in prepared if not product_id})
+    if codes:
+        products = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'product.product', 'search_read',
+            [[['default_code', 'in', codes]]],
+            {'fields': ['id', 'default_code'], 'order': 'id asc'}
+        )
+        for product in products:
+            product_ids.setdefault(product['default_code'], product['id'])
+    
+    # Sum rows for the same product and location
+    totals = {}
+    pair_rows = {}
+    for result, code, location_id, product_id in prepared:
+        product_id = int(product_id) if product_id else product_ids.get(code)
+        if not product_id:
+            result['error'] = f"Unknown product: {code}"
+            continue
+        pair = (product_id, location_id)
+        totals[pair] = totals.get(pair, 0) + result['quantity']
+        pair_rows.setdefault(pair, []).append(result)
+    
+    if not totals:
+        return [results[row_number] for row_number, _ in rows]
+    
+    invalidate_product_availability(config, list({pair[0] for pair in totals}))
+    
+    # Find existing quants for all pairs in one search
+    quants = models.execute_kw(
+        config['db_name'], uid, config['password'],
+        'stock.quant', 'search_read',
+        [[['product_id', 'in', list({pair[0] for pair in totals})],
+          ['location_id', 'in', list({pair[1] for pair in totals})]]],
+        {'fields': ['id', 'product_id', 'location_id', 'quantity'], 'order': 'id asc'}
+    )
+    existing = {}
+    for quant in quants:
+        existing.setdefault((quant['product_id'][0], quant['location_id'][0]), quant)
+    
+    updates = {}
+    create_pairs = []
+    create_vals = []
+    for pair, quantity in totals.items():
+        quant = existing.get(pair)
+        if quant:
+            updates[quant['id']] = {'quantity': quant.get('quantity', 0) + quantity}
+        else:
+            create_pairs.append(pair)
+            create_vals.append({'product_id': pair[0], 'location_id': pair[1], 'quantity': quantity})
+    
+    errors = write_grouped(models, config, uid, 'stock.quant', updates)
+    outcome = {}
+    for pair, quant in existing.items():
+        if quant['id'] in errors:
+            outcome[pair] = (quant['id'], errors[quant['id']])
+    for pair, created in zip(create_pairs, create_records(models, config, uid, 'stock.quant', create_vals)):
+        outcome[pair] = created
+    
+    for pair, pair_results in pair_rows.items():
+        quant_id, error = outcome[pair]
+        for result in pair_results:
+            result['id'] = quant_id
+            result['error'] = error
+            result['status'] = 'failed' if error else 'loaded'
+            result['key'] = f"{pair[0]}@{pair[1]}"
+    
+    return [results[row_number] for row_number, _ in rows]
+
+def add_stock_batch(uid, config, additions):
+    """
+    Add several stock quantities with grouped requests.
+    
+    Quantities for the same product and location are summed and applied the
+    way a stock-load chunk is: one quant search, grouped writes and one
+    multi-record create.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        additions (list): List of (key, product_id, location_id, quantity) tuples
+        
+    Returns:
+        dict: Mapping of key to (quant ID or None, error message or None)
+    """
+    models = get_model_connection(config['url'])
+    rows = [(key, {'product_id': product_id, 'location_id': location_id, 'quantity': quantity})
+            for key, product_id, location_id, quantity in additions]
+    return {result['row']: (result['id'], result['error'])
+            for result in _load_stock_chunk(uid, config, models, rows, {})}
+
+def import_stock_from_file(uid, config, path, sink=None, chunk_size=None, restart=False):
+    """
+    Add stock quantities from a CSV or JSON Lines file.
+    
+    Each row needs default_code, location (complete name such as 'WH/Stock')
+    and quantity; the quantity is added to what is already on hand. Progress is
+    checkpointed after every chunk. Because adding stock is not idempotent, a
+    job that finished is not loaded again unless restart is True.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        path (str): Path to a .csv or .jsonl file
+        sink (object): Report sink for the per-row results (defaults to console table)
+        chunk_size (int): Rows in the first chunk; later chunks adapt to the
+            observed latency (defaults to the checkpointed or configured size)
+        restart (bool): Ignore an existing checkpoint and start from the first row
+        
+    Returns:
+        dict: Number of rows per status
+    """
+    summary = {'loaded': 0, 'failed': 0}
+    
+    if not uid:
+        return summary
+    
+    sink = sink or ConsoleTableSink()
+    checkpoint = None
+    
+    try:
+        print(f"\n--- LOADING STOCK FROM {path} ---")
+        models = get_model_connection(config['url'])
+        
+        checkpoint = JobCheckpoint('stock_load', path)
+        if checkpoint.stale and not restart:
+            print(f"The file changed since the last run. Delete {checkpoint.path} or restart the load to start over.")
+            return summary
+        if restart:
+            checkpoint.reset()
+        if checkpoint.completed:
+            print(f"This file was already loaded ({checkpoint.rows_done} rows). Restart the load to add it again.")
+            summary.update(checkpoint.summary)
+            return summary
+        
+        location_ids = _internal_location_ids(uid, config, models)
+        
+        def process_chunk(rows):
+            return _load_stock_chunk(uid, config, models, rows, location_ids)
+        
+        sink.begin_section('stock_load', "Stock Load Results", STOCK_LOAD_COLUMNS, rule_width=120)
+        
+        sizer = AdaptiveBatchSizer(initial=chunk_size or checkpoint.chunk_size)
+        
+        summary.update(run_checkpointed_job(checkpoint, iter_file_records(path), process_chunk,
+                                            sizer, on_result=sink.write_row, on_chunk=sink.flush,
+                                            idempotent=False))
+        sink.end_section()
+    except ChunkNeedsReview as e:
+        # Some quants of the chunk may already hold the added quantity; resuming would add it again
+        for row_number, record in e.rows:
+            sink.write_row({'row': row_number, 'default_code': record.get('default_code') or record.get('code'),
+                            'location': record.get('location'), 'quantity': record.get('quantity'),
+                            'status': 'review', 'id': None, 'error': str(e.error)})
+        sink.end_section()
+        summary.update(checkpoint.summary)
+        summary['review'] = len(e.rows)
+        print(f"Error loading stock: {str(e)}")
+        print(f"Rows {e.rows[0][0]}-{e.rows[-1][0]} may be partly applied. Check their stock in Odoo and undo "
+              f"any added quantities before running the load again, which resumes after row "
+              f"{checkpoint.rows_done} and sends these rows again.")
+    except Exception as e:
+        print(f"Error loading stock: {str(e)}")
+        if checkpoint and checkpoint.rows_done:
+            print(f"Rows up to {checkpoint.rows_done} are committed. Run the load again to resume.")
+        summary.update(checkpoint.summary if checkpoint else {})
+    finally:
+        sink.close()
+    
+    review = f", {summary['review']} to review" if summary.get('review') else ""
+    print(f"\nStock load summary: {summary['loaded']} loaded, {summary['failed']} failed{review}")
+    return summary
@@ -0,0 +1,392 @@
+"""
+Headless runner for scripted workflows.
+
+A job file (JSON, or YAML when PyYAML is installed) lists steps such as
+creating products, loading stock, creating orders and running reports. Steps
+run as soon as the steps they need have finished, independent steps run at
+the same time, and all of them share one authenticated session, request
+scheduler and cache.
+
+Example:
+
+    {
+      "name": "nightly",
+      "steps": [
+        {"id": "products", "action": "create_products",
+         "products": [{"default_code": "ARR-750", "name": "Arrack 750ml", "list_price": 3500}]},
+        {"id": "stock", "action": "add_stock", "product_id": "${products.ids.ARR-750}",
+         "warehouses": {"NUG": 15, "KOT": 20}},
+        {"id": "order", "action": "create_order", "needs": ["stock"], "customer_id": 7,
+         "lines": [{"product_id": "${products.ids.ARR-750}", "quantity": 5}]},
+        {"id": "report", "action": "inventory_report", "needs": ["order"],
+         "format": "csv", "output": "inventory.csv"}
+      ]
+    }
+
+A string value of the form "${step.key.subkey}" is replaced by that part of
+an earlier step's result and makes the step depend on it.
+"""
+import json
+import os
+import re
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from config import JOB_CONFIG
+from connection import get_model_connection
+from deadlines import current_deadline, deadline, use_deadline
+from profiling import profile_action
+from fulfillment_operations import ship_orders
+from inventory_history import generate_inventory_as_of_report
+from inventory_operations import (
+    add_product_to_warehouse,
+    generate_inventory_report,
+    import_stock_from_file,
+    load_warehouses
+)
+from partner_resolver import resolve_partners
+from product_operations import import_products_from_file, upsert_products
+from replenishment_operations import create_replenishment_transfers, load_replenishment_plan
+from report_output import ConsoleTableSink, ReportColumn, open_report_sink
+from sales_operations import create_order_from_basket, generate_sales_report
+
+REFERENCE_PATTERN = re.compile(r'^\$\{([^.}]+)((?:\.[^.}]+)*)\}$')
+
+JOB_SUMMARY_COLUMNS = [
+    ReportColumn('step', 'Step', 20),
+    ReportColumn('action', 'Action', 20),
+    ReportColumn('status', 'Status', 10),
+    ReportColumn('seconds', 'Seconds', 9, '.1f'),
+    ReportColumn('detail', 'Detail', 50),
+]
+
+class JobError(Exception):
+    """Raised for job files that cannot be run."""
+
+def load_job(path):
+    """
+    Read a job file.
+
+    Args:
+        path (str): Path to a .json, .yaml or .yml file
+
+    Returns:
+        dict: The job with its list of steps
+    """
+    extension = os.path.splitext(path)[1].lower()
+    with open(path, encoding='utf-8') as handle:
+        if extension in ('.yaml', '.yml'):
+            try:
+                import yaml
+            except ImportError:
+                raise JobError("YAML job files need PyYAML (pip install pyyaml); use JSON otherwise")
+            job = yaml.safe_load(handle)
+        else:
+            job = json.load(handle)
+
+    if isinstance(job, list):
+        job = {'steps': job}
+    if not isinstance(job, dict) or not isinstance(job.get('steps'), list):
+        raise JobError("A job needs a list of steps")
+    return job
+
+def _references(value):
+    """Collect the step IDs referenced by "${step.key}" strings in a parameter value."""
+    if isinstance(value, str):
+        match = REFERENCE_PATTERN.match(value)
+        return {match.group(1)} if match else set()
+    if isinstance(value, dict):
+        return set().union(*[_references(item) for item in value.values()]) if value else set()
+    if isinstance(value, list):
+        return set().union(*[_references(item) for item in value]) if value else set()
+    return set()
+
+def _resolve(value, results):
+    """Replace "${step.key}" strings with values from earlier step results."""
+    if isinstance(value, str):
+        match = REFERENCE_PATTERN.match(value)
+        if not match:
+            return value
+        resolved = results[match.group(1)]
+        for part in [part for part in match.group(2).split('.') if part]:
+            if isinstance(resolved, dict) and part in resolved:
+                resolved = resolved[part]
+            elif isinstance(resolved, list) and part.isdigit() and int(part) < len(resolved):
+                resolved = resolved[int(part)]
+            else:
+                raise JobError(f"{value} does not exist in the result of step '{match.group(1)}'")
+        return resolved
+    if isinstance(value, dict):
+        return {key: _resolve(item, results) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_resolve(item, results) for item in value]
+    return value
+
+def _report_sink(params, default_name):
+    """Sink for a report step: console table, or a file given by format and output."""
+    output_format = params.get('format', 'table')
+    path = params.get('output')
+    if output_format != 'table' and not path:
+        path = f"{default_name}.{output_format}"
+    return open_report_sink(output_format, path)
+
+def _summary_result(summary, failed_key='failed', allow_failures=False):
+    """Step outcome of a bulk operation: it fails if any row failed, unless allowed."""
+    ok = allow_failures or not summary.get(failed_key)
+    return ok, summary
+
+def _action_import_products(uid, config, params):
+    summary = import_products_from_file(uid, config, params['file'], chunk_size=params.get('chunk_size'),
+                                        restart=params.get('restart', False))
+    return _summary_result(summary, allow_failures=params.get('allow_failures', False))
+
+def _action_create_products(uid, config, params):
+    results = upsert_products(uid, config, params['products'])
+    failed = [result for result in results if result['status'] == 'failed']
+    summary = {
+        'ids': {result['default_code']: result['id'] for result in results if result.get('id')},
+        'failed': len(failed),
+        'errors': {result['default_code']: result['error'] for result in failed},
+    }
+    if not results:
+        return False, summary
+    return _summary_result(summary, allow_failures=params.get('allow_failures', False))
+
+def _action_load_stock(uid, config, params):
+    summary = import_stock_from_file(uid, config, params['file'], chunk_size=params.get('chunk_size'),
+                                     restart=params.get('restart', False))
+    return _summary_result(summary, allow_failures=params.get('allow_failures', False))
+
+def _action_add_stock(uid, config, params):
+    product_id = int(params['product_id'])
+    targets = []
+    if params.get('location_id'):
+        targets.append((int(params['location_id']), float(params['quantity'])))
+    else:
+        # Quantities per warehouse, keyed by warehouse code, name or ID
+        models = get_model_connection(config['url'])
+        warehouses = load_warehouses(uid, config, models)
+        for key, quantity in (params.get('warehouses') or {}).items():
+            wh = next((wh for wh in warehouses
+                       if str(key) in (str(wh['id']), wh.get('code'), wh['name'])), None)
+            if not wh or not wh.get('lot_stock_id'):
+                return False, {'error': f"Unknown warehouse: {key}"}
+            targets.append((wh['lot_stock_id'][0], float(quantity)))
+    if not targets:
+        return False, {'error': "Give location_id and quantity, or warehouses"}
+
+    added = {}
+    for location_id, quantity in targets:
+        if not add_product_to_warehouse(uid, config, product_id, location_id, quantity):
+            return False, {'added': added, 'error': f"Could not add stock to location {location_id}"}
+        added[location_id] = quantity
+    return True, {'added': added}
+
+def _action_create_order(uid, config, params):
+    customer_id = params.get('customer_id')
+    if not customer_id and params.get('customer'):
+        partner_ids = resolve_partners(uid, config, [params['customer']])
+        customer_id = partner_ids[0] if partner_ids else None
+    if not customer_id:
+        return False, {'error': "Could not resolve the customer"}
+
+    warehouse_id = params.get('warehouse_id')
+    if not warehouse_id and params.get('warehouse'):
+        models = get_model_connection(config['url'])
+        wh = next((wh for wh in load_warehouses(uid, config, models)
+                   if params['warehouse'] in (wh.get('code'), wh['name'])), None)
+        if not wh:
+            return False, {'error': f"Unknown warehouse: {params['warehouse']}"}
+        warehouse_id = wh['id']
+
+    basket = [(int(line['product_id']), float(line.get('quantity', 1))) for line in params['lines']]
+    order = create_order_from_basket(uid, config, int(customer_id), basket, warehouse_id=warehouse_id,
+                                     confirm=params.get('confirm', True))
+    return order is not None, order or {'error': "Could not create the order"}
+
+def _action_ship_orders(uid, config, params):
+    summary = ship_orders(uid, config, order_ids=params.get('order_ids'), order_names=params.get('order_names'),
+                          create_backorders=params.get('create_backorders', True))
+    return _summary_result(summary, allow_failures=params.get('allow_failures', False))
+
+def _action_replenish(uid, config, params):
+    summary = create_replenishment_transfers(uid, config, load_replenishment_plan(params['file']),
+                                             confirm=params.get('confirm', True))
+    return _summary_result(summary, allow_failures=params.get('allow_failures', False))
+
+def _action_inventory_report(uid, config, params):
+    if not generate_inventory_report(uid, config, _report_sink(params, 'inventory_report')):
+        return False, {'error': "Could not generate the inventory report"}
+    return True, {}
+
+def _action_sales_report(uid, config, params):
+    if not generate_sales_report(uid, config, _report_sink(params, 'sales_report')):
+        return False, {'error': "Could not generate the sales report"}
+    return True, {}
+
+def _action_inventory_as_of(uid, config, params):
+    if not generate_inventory_as_of_report(uid, config, params['as_of'], _report_sink(params, 'inventory_as_of')):
+        return False, {'error': "Could not generate the inventory report"}
+    return True, {}
+
+# Step actions and the parameters each one requires
+ACTIONS = {
+    'import_products': (_action_import_products, ['file']),
+    'create_products': (_action_create_products, ['products']),
+    'load_stock': (_action_load_stock, ['file']),
+    'add_stock': (_action_add_stock, ['product_id']),
+    'create_order': (_action_create_order, ['lines']),
+    'ship_orders': (_action_ship_orders, []),
+    'replenish': (_action_replenish, ['file']),
+    'inventory_report': (_action_inventory_report, []),
+    'sales_report': (_action_sales_report, []),
+    'inventory_as_of': (_action_inventory_as_of, ['as_of']),
+}
+
+def validate_job(job):
+    """
+    Check a job's steps and work out what each step waits for.
+
+    Args:
+        job (dict): Job as returned by load_job
+
+    Returns:
+        dict: Mapping of step ID to the set of step IDs it depends on
+    """
+    steps = job['steps']
+    ids = [step.get('id') for step in steps]
+    if any(not step_id for step_id in ids):
+        raise JobError("Every step needs an id")
+    duplicates = {step_id for step_id in ids if ids.count(step_id) > 1}
+    if duplicates:
+        raise JobError(f"Duplicate step ids: {', '.join(sorted(duplicates))}")
+
+    dependencies = {}
+    for step in steps:
+        action = ACTIONS.get(step.get('action'))
+        if not action:
+            raise JobError(f"Step '{step['id']}' has unknown action '{step.get('action')}'. "
+                           f"Use one of: {', '.join(ACTIONS)}")
+        missing = [param for param in action[1] if param not in step]
+        if missing:
+            raise JobError(f"Step '{step['id']}' is missing: {', '.join(missing)}")
+
+        params = {key: value for key, value in step.items() if key not in ('id', 'action', 'needs')}
+        needs = set(step.get('needs') or []) | _references(params)
+        unknown = needs - set(ids)
+        if unknown:
+            raise JobError(f"Step '{step['id']}' needs unknown steps: {', '.join(sorted(unknown))}")
+        dependencies[step['id']] = needs
+
+    # Depth-first search for cycles
+    state = {}
+    def visit(step_id, path):
+        if state.get(step_id) == 'done':
+            return
+        if state.get(step_id) == 'visiting':
+            raise JobError(f"Steps depend on each other in a cycle: {' -> '.join(path + [step_id])}")
+        state[step_id] = 'visiting'
+        for needed in dependencies[step_id]:
+            visit(needed, path + [step_id])
+        state[step_id] = 'done'
+    for step_id in ids:
+        visit(step_id, [])
+
+    return dependencies
+
+def run_job(uid, config, job, max_parallel=None):
+    """
+    Run the steps of a job, starting each one as soon as its dependencies are done.
+
+    A failed step makes the steps that depend on it be skipped; unrelated
+    steps still run.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        job (dict): Job as returned by load_job
+        max_parallel (int): Steps run at the same time (defaults to
+            the job's max_parallel or JOB_CONFIG['max_parallel_steps'])
+
+    Returns:
+        dict: Mapping of step ID to its outcome (status, seconds, result)
+    """
+    dependencies = validate_job(job)
+    steps = {step['id']: step for step in job['steps']}
+    max_parallel = max_parallel or job.get('max_parallel') or JOB_CONFIG['max_parallel_steps']
+    outcomes = {}
+    results = {}
+
+    print(f"\n--- RUNNING JOB {job.get('name') or 'unnamed'} ({len(steps)} steps) ---")
+
+    def run_step(step, job_deadline):
+        started = time.monotonic()
+        with use_deadline(job_deadline), profile_action(f"job-{step['id']}"):
+            try:
+                params = _resolve({key: value for key, value in step.items()
+                                   if key not in ('id', 'action', 'needs')}, results)
+                ok, result = ACTIONS[step['action']][0](uid, config, params)
+            except Exception as e:
+                ok, result = False, {'error': str(e)}
+        return ok, result, time.monotonic() - started
+
+    with deadline(job.get('deadline')), ThreadPoolExecutor(max_workers=max_parallel) as executor:
+        job_deadline = current_deadline()
+        running = {}
+        pending = list(steps)
+
+        while pending or running:
+            for step_id in list(pending):
+                needs = dependencies[step_id]
+                if any(outcomes.get(needed, {}).get('status') in ('failed', 'skipped') for needed in needs):
+                    pending.remove(step_id)
+                    outcomes[step_id] = {'status': 'skipped', 'seconds': 0.0,
+                                         'result': {'error': "A step it needs did not succeed"}}
+                elif all(outcomes.get(needed, {}).get('status') == 'done' for needed in needs):
+                    pending.remove(step_id)
+                    print(f"Starting step '{step_id}' ({steps[step_id]['action']})")
+                    running[executor.submit(run_step, steps[step_id], job_deadline)] = step_id
+
+            if not running:
+                continue
+            finished, _ = wait(list(running), return_when=FIRST_COMPLETED)
+            for future in finished:
+                step_id = running.pop(future)
+                ok, result, seconds = future.result()
+                results[step_id] = result
+                outcomes[step_id] = {'status': 'done' if ok else 'failed', 'seconds': seconds, 'result': result}
+                print(f"Step '{step_id}' {'finished' if ok else 'FAILED'} in {seconds:.1f}s")
+
+    sink = ConsoleTableSink()
+    sink.begin_section('job_summary', "Job Summary", JOB_SUMMARY_COLUMNS, rule_width=110)
+    for step_id in steps:
+        outcome = outcomes[step_id]
+        error = outcome['result'].get('error') if isinstance(outcome['result'], dict) else None
+        sink.write_row({
+            'step': step_id,
+            'action': steps[step_id]['action'],
+            'status': outcome['status'],
+            'seconds': outcome['seconds'],
+            'detail': error or '',
+        })
+    sink.end_section()
+    return outcomes
+
+def run_job_file(uid, config, path):
+    """
+    Load and run a job file.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        path (str): Path to a .json, .yaml or .yml job file
+
+    Returns:
+        bool: True if every step succeeded
+    """
+    try:
+        job = load_job(path)
+        outcomes = run_job(uid, config, job)
+    except (OSError, ValueError, JobError) as e:
+        print(f"Cannot run job {path}: {str(e)}")
+        return False
+    return all(outcome['status'] == 'done' for outcome in outcomes.values())
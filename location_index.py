@@ -0,0 +1,208 @@
+"""
+In-memory index of the stock.location hierarchy.
+
+The index is built from one paged read of all locations and answers ancestor
+and descendant questions locally, so stock held in sub-locations (zones,
+bins) can be rolled up to its branch without a child_of request per location.
+The cached index is checked against Odoo with one small request and only
+rebuilt, from the changed locations, when locations were added or edited.
+"""
+import xmlrpc.client
+from cache import get_cached, set_cached
+from cache_validation import get_model_slice
+from config import REPORT_CONFIG
+from connection import get_model_connection, iter_search_read
+
+LOCATION_FIELDS = ['id', 'name', 'complete_name', 'usage', 'location_id', 'parent_path']
+
+class LocationIndex:
+    """
+    Parent/child index of stock locations.
+
+    Args:
+        locations (list): Location records with id, complete_name, usage,
+            location_id and (on Odoo 12+) parent_path
+    """
+
+    def __init__(self, locations):
+        self.locations = {}
+        self.parents = {}
+        self.children = {}
+        self.paths = {}
+
+        for loc in locations:
+            self.locations[loc['id']] = loc
+            parent = loc.get('location_id')
+            parent_id = parent[0] if isinstance(parent, (list, tuple)) and parent else None
+            self.parents[loc['id']] = parent_id
+            if parent_id:
+                self.children.setdefault(parent_id, []).append(loc['id'])
+            if loc.get('parent_path'):
+                # parent_path is "1/7/12/" for location 12 under 7 under 1
+                self.paths[loc['id']] = [int(part) for part in loc['parent_path'].strip('/').split('/') if part]
+
+    def name(self, location_id):
+        """Return the full name of a location."""
+        loc = self.locations.get(location_id)
+        return (loc.get('complete_name') or loc['name']) if loc else f"Location {location_id}"
+
+    def ancestors(self, location_id):
+        """
+        Return the ancestors of a location, nearest parent first.
+
+        Args:
+            location_id (int): Location ID
+
+        Returns:
+            list: Ancestor location IDs
+        """
+        if location_id in self.paths:
+            return list(reversed(self.paths[location_id][:-1]))
+
+        # Without parent_path (Odoo 11 and older) walk up location_id
+        ancestors = []
+        parent_id = self.parents.get(location_id)
+        while parent_id and parent_id not in ancestors:
+            ancestors.append(parent_id)
+            parent_id = self.parents.get(parent_id)
+        return ancestors
+
+    def descendants(self, location_id, include_self=True):
+        """
+        Return all locations below a location.
+
+        Args:
+            location_id (int): Location ID
+            include_self (bool): Include the location itself
+
+        Returns:
+            list: Location IDs of the subtree
+        """
+        result = [location_id] if include_self else []
+        stack = list(self.children.get(location_id, []))
+        while stack:
+            child_id = stack.pop()
+            result.append(child_id)
+            stack.extend(self.children.get(child_id, []))
+        return result
+
+    def is_descendant(self, location_id, ancestor_id):
+        """Return True if location_id is ancestor_id or lies below it."""
+        return location_id == ancestor_id or ancestor_id in self.ancestors(location_id)
+
+    def rollup(self, quantities):
+        """
+        Roll quantities up the tree.
+
+        Args:
+            quantities (dict): {location_id: quantity} or
+                {(location_id, product_id): quantity} for stock held directly
+                in each location
+
+        Returns:
+            dict: Same keys for every location that has stock in its subtree,
+                with the total of the location and all its descendants
+        """
+        totals = {}
+        for key, quantity in quantities.items():
+            location_id, rest = (key[0], key[1:]) if isinstance(key, tuple) else (key, None)
+            for target in [location_id] + self.ancestors(location_id):
+                target_key = (target,) + rest if rest is not None else target
+                totals[target_key] = totals.get(target_key, 0) + quantity
+        return totals
+
+def get_location_index(uid, config):
+    """
+    Return the cached location index, rebuilding it when locations changed.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+
+    Returns:
+        LocationIndex: The index
+    """
+    locations = None
+    if not get_cached(config, 'stock.location.legacy', lambda: False, ttl=float('inf')):
+        try:
+            locations = get_model_slice(uid, config, 'stock.location', 'stock.location', fields=LOCATION_FIELDS)
+        except xmlrpc.client.Fault:
+            # parent_path only exists from Odoo 12 on
+            set_cached(config, 'stock.location.legacy', True)
+    if locations is None:
+        fields = [field for field in LOCATION_FIELDS if field != 'parent_path']
+        locations = get_model_slice(uid, config, 'stock.location.legacy', 'stock.location', fields=fields)
+
+    version, index = get_cached(config, 'stock.location.index',
+                                lambda: (locations.version, LocationIndex(locations.as_list())), ttl=float('inf'))
+    if version != locations.version:
+        index = LocationIndex(locations.as_list())
+        set_cached(config, 'stock.location.index', (locations.version, index))
+    return index
+
+def get_stock_by_location(uid, config, product_ids=None):
+    """
+    Read the on-hand quantity held directly in each internal location.
+
+    Uses one read_group request when the server supports it and falls back to
+    a paged read of the quants.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        product_ids (list): Limit to these products (all products if None)
+
+    Returns:
+        dict: {(location_id, product_id): quantity}
+    """
+    models = get_model_connection(config['url'])
+    domain = [['location_id.usage', '=', 'internal']]
+    if product_ids:
+        domain.append(['product_id', 'in', list(product_ids)])
+
+    stock = {}
+    try:
+        groups = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'stock.quant', 'read_group',
+            [domain, ['quantity:sum'], ['location_id', 'product_id']],
+            {'lazy': False}
+        )
+        for group in groups:
+            if group.get('location_id') and group.get('product_id'):
+                key = (group['location_id'][0], group['product_id'][0])
+                stock[key] = stock.get(key, 0) + (group.get('quantity') or 0)
+        return stock
+    except Exception:
+        stock = {}
+
+    for quants in iter_search_read(models, config, uid, 'stock.quant', domain,
+                                   ['location_id', 'product_id', 'quantity'],
+                                   page_size=REPORT_CONFIG['page_size']):
+        for quant in quants:
+            key = (quant['location_id'][0], quant['product_id'][0])
+            stock[key] = stock.get(key, 0) + quant['quantity']
+    return stock
+
+def get_subtree_stock(uid, config, location_ids, product_ids=None):
+    """
+    Total stock per product in each given location including its sub-locations.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        location_ids (list): Locations to total, e.g. the warehouses' lot_stock_id
+        product_ids (list): Limit to these products (all products if None)
+
+    Returns:
+        dict: {location_id: {product_id: quantity}}
+    """
+    index = get_location_index(uid, config)
+    totals = index.rollup(get_stock_by_location(uid, config, product_ids))
+
+    wanted = set(location_ids)
+    result = {location_id: {} for location_id in location_ids}
+    for (location_id, product_id), quantity in totals.items():
+        if location_id in wanted:
+            result[location_id][product_id] = quantity
+    return result
@@ -3,28 +3,60 @@
 Odoo Integration Main Script
 This script provides a menu-driven interface to interact with Odoo.
 """
+import atexit
 import sys
-from config import ODOO_CONFIG
+from config import JOURNAL_CONFIG, MACRO_CONFIG, ODOO_CONFIG, PREFETCH_CONFIG, PRODUCT_INDEX_CONFIG, RPC_CONFIG
 from connection import test_connection
 from product_operations import (
     inspect_existing_products,
     inspect_product_fields,
-    create_liquor_product
+    create_liquor_product,
+    import_products_from_file
 )
 from inventory_operations import (
     get_warehouses,
     get_stock_locations,
     add_product_to_warehouse,
-    generate_inventory_report
+    generate_inventory_report,
+    import_stock_from_file,
+    check_basket_availability,
+    invalidate_product_availability
 )
 from sales_operations import (
     create_customer,
     create_sale_order,
     generate_sales_report
 )
+from inventory_history import generate_inventory_as_of_report
+from fulfillment_operations import ship_orders
+from replenishment_operations import create_replenishment_transfers, load_replenishment_plan
+from report_output import REPORT_FORMATS, open_report_sink
+from bulk_operations import JobCheckpoint
+from request_scheduler import PRIORITY_INTERACTIVE, request_priority
+from deadlines import deadline
+from service import run_service
+from job_runner import run_job_file
+from server_macros import MacroOutcomeUnknown, sale_order_macro
+from prefetch import start_prefetcher, stop_prefetcher, wake_prefetcher
+from product_index import get_product_index
+from profiling import enable_profiling, profile_action
+from rpc_trace import start_recording
+from write_journal import FAILED, QUEUED, REVIEW, get_write_journal, start_journal_flusher, stop_journal_flusher
 
 def main():
     """Main function to orchestrate the entire process."""
+    # Profile every menu action and job step (CPU, stack samples, allocations)
+    if '--profile' in sys.argv[1:]:
+        enable_profiling()
+    
+    # Record every Odoo call to a trace file, for replay with rpc_trace.py
+    if '--trace' in sys.argv[1:]:
+        position = sys.argv.index('--trace')
+        if position + 1 >= len(sys.argv):
+            print("Usage: python main.py --trace <trace file>")
+            sys.exit(2)
+        start_recording(sys.argv[position + 1])
+    
     uid = test_connection(
         ODOO_CONFIG['url'],
         ODOO_CONFIG['db_name'],
@@ -36,6 +68,29 @@ def main():
         print("Authentication failed. Cannot proceed.")
         return
     
+    # Send writes queued while Odoo was unreachable in the background
+    if JOURNAL_CONFIG['enabled']:
+        start_journal_flusher(uid, ODOO_CONFIG)
+        atexit.register(stop_journal_flusher, ODOO_CONFIG)
+    
+    if '--serve' in sys.argv[1:]:
+        run_service(uid, ODOO_CONFIG)
+        return
+    
+    if '--job' in sys.argv[1:]:
+        position = sys.argv.index('--job')
+        if position + 1 >= len(sys.argv):
+            print("Usage: python main.py --job <job file>")
+            sys.exit(2)
+        if not run_job_file(uid, ODOO_CONFIG, sys.argv[position + 1]):
+            sys.exit(1)
+        return
+    
+    # Warm the data the menu options need while the menu waits for input
+    if PREFETCH_CONFIG['enabled']:
+        start_prefetcher(uid, ODOO_CONFIG)
+        atexit.register(stop_prefetcher, ODOO_CONFIG)
+    
     while True:
         print("\n" + "=" * 60)
         print("ENHANCED ODOO PRODUCT MANAGER")
@@ -48,31 +103,109 @@ def main():
         print("6. Generate inventory report")
         print("7. Generate sales report")
         print("8. Run complete process (steps 3-7)")
+        print("9. Import products from file (CSV/JSONL)")
+        print("10. Load stock from file (CSV/JSONL)")
+        print("11. Ship confirmed orders")
+        print("12. Replenish branches from a transfer plan (CSV/JSONL)")
+        print("13. Generate inventory report for a past date")
+        print("14. Show the write journal and send queued writes")
         print("0. Exit")
         
-        choice = input("\nEnter your choice (0-8): ")
+        choice = input("\nEnter your choice (0-14): ")
         
-        if choice == '1':
-            inspect_existing_products(uid, ODOO_CONFIG)
-        elif choice == '2':
-            inspect_product_fields(uid, ODOO_CONFIG)
-        elif choice == '3':
-            create_liquor_product(uid, ODOO_CONFIG)
-        elif choice == '4':
-            handle_add_product_to_warehouses(uid, ODOO_CONFIG)
-        elif choice == '5':
-            handle_create_sale(uid, ODOO_CONFIG)
-        elif choice == '6':
-            generate_inventory_report(uid, ODOO_CONFIG)
-        elif choice == '7':
-            generate_sales_report(uid, ODOO_CONFIG)
-        elif choice == '8':
-            run_complete_process(uid, ODOO_CONFIG)
-        elif choice == '0':
+        if choice == '0':
             print("\nExiting. Thank you!")
             break
-        else:
-            print("\nInvalid choice. Please try again.")
+        
+        # Menu actions go ahead of any bulk work on the request scheduler
+        with request_priority(PRIORITY_INTERACTIVE), profile_action(f"option-{choice}"):
+            if choice == '1':
+                inspect_existing_products(uid, ODOO_CONFIG)
+            elif choice == '2':
+                inspect_product_fields(uid, ODOO_CONFIG)
+            elif choice == '3':
+                create_liquor_product(uid, ODOO_CONFIG)
+            elif choice == '4':
+                handle_add_product_to_warehouses(uid, ODOO_CONFIG)
+            elif choice == '5':
+                handle_create_sale(uid, ODOO_CONFIG)
+            elif choice == '6':
+                sink = choose_report_sink('inventory_report')
+                if sink:
+                    generate_inventory_report(uid, ODOO_CONFIG, sink)
+            elif choice == '7':
+                sink = choose_report_sink('sales_report')
+                if sink:
+                    generate_sales_report(uid, ODOO_CONFIG, sink)
+            elif choice == '8':
+                run_complete_process(uid, ODOO_CONFIG)
+            elif choice == '9':
+                handle_import_products(uid, ODOO_CONFIG)
+            elif choice == '10':
+                handle_load_stock(uid, ODOO_CONFIG)
+            elif choice == '11':
+                handle_ship_orders(uid, ODOO_CONFIG)
+            elif choice == '12':
+                handle_replenishment(uid, ODOO_CONFIG)
+            elif choice == '13':
+                as_of = input("Enter the date (YYYY-MM-DD, optionally HH:MM:SS, in UTC): ").strip()
+                sink = choose_report_sink('inventory_as_of') if as_of else None
+                if sink:
+                    generate_inventory_as_of_report(uid, ODOO_CONFIG, as_of, sink)
+            elif choice == '14':
+                handle_write_journal(uid, ODOO_CONFIG)
+            else:
+                print("\nInvalid choice. Please try again.")
+        
+        # Refresh data the action changed or that has grown old before the next choice
+        wake_prefetcher(ODOO_CONFIG)
+
+def choose_report_sink(default_name):
+    """Ask for a report output format and return the matching sink."""
+    output_format = input(f"Output format ({'/'.join(REPORT_FORMATS)}, leave empty for table): ").strip().lower() or 'table'
+    path = None
+    
+    if output_format != 'table':
+        default_path = f"{default_name}.{output_format}"
+        path = input(f"Output file (leave empty for {default_path}): ").strip() or default_path
+    
+    try:
+        return open_report_sink(output_format, path)
+    except (ValueError, OSError) as e:
+        print(f"Could not open report output: {str(e)}")
+        return None
+
+def choose_product(uid, config, title):
+    """
+    Let the user search the product index and pick a product.
+    
+    Each search shows the best matches by internal reference or name; entering
+    the number of a shown match picks it.
+    
+    Returns:
+        int or None: ID of the chosen product, or None if cancelled
+    """
+    index = get_product_index(uid, config)
+    
+    if not index:
+        return None
+    
+    print(f"\n{title} ({len(index.products)} products)")
+    matches = []
+    while True:
+        query = input("Search by name or internal reference (number to pick, empty to cancel): ").strip()
+        if not query:
+            return None
+        if query.isdigit() and 1 <= int(query) <= len(matches):
+            return matches[int(query) - 1]['id']
+        
+        matches = index.search(query, PRODUCT_INDEX_CONFIG['max_matches'])
+        if not matches:
+            print("No matching products")
+            continue
+        for i, product in enumerate(matches):
+            code = f"[{product['default_code']}] " if product.get('default_code') else ''
+            print(f"{i+1}. {code}{product['name']} - {product['list_price']} (ID: {product['id']})")
 
 def handle_add_product_to_warehouses(uid, config):
     """Handle the process of adding a product to warehouses."""
@@ -83,29 +216,12 @@ def handle_add_product_to_warehouses(uid, config):
         print("No warehouses found")
         return
     
-    # Get products
-    products = inspect_existing_products(uid, config)
-    
-    if not products:
-        print("No products found")
-        return
-    
     # Select product
-    print("\nSelect a product to add to warehouses:")
-    for i, product in enumerate(products):
-        print(f"{i+1}. {product['name']} (ID: {product['id']})")
+    product_id = choose_product(uid, config, "Select a product to add to warehouses")
     
-    try:
-        product_idx = int(input("Enter product number: ")) - 1
-        if product_idx < 0 or product_idx >= len(products):
-            print("Invalid product selection")
-            return
-    except ValueError:
-        print("Please enter a valid number")
+    if not product_id:
         return
     
-    product_id = products[product_idx]['id']
-    
     # Add to each warehouse
     for wh in warehouses:
         if wh.get('lot_stock_id'):
@@ -118,30 +234,110 @@ def handle_add_product_to_warehouses(uid, config):
                 print("Please enter a valid number. Using default quantity of 10.")
                 add_product_to_warehouse(uid, config, product_id, location_id, 10)
 
-def handle_create_sale(uid, config):
-    """Handle the process of creating a sale."""
-    # Get products
-    products = inspect_existing_products(uid, config)
+def handle_import_products(uid, config):
+    """Handle the process of importing products from a CSV or JSON Lines file."""
+    path = input("Enter path of the product file (.csv or .jsonl): ").strip()
     
-    if not products:
-        print("No products found")
+    if not path:
+        print("No file given")
         return
     
-    # Select product
-    print("\nSelect a product to sell:")
-    for i, product in enumerate(products):
-        print(f"{i+1}. {product['name']} (ID: {product['id']})")
+    sink = choose_report_sink('product_import')
+    if sink:
+        import_products_from_file(uid, config, path, sink)
+
+def handle_load_stock(uid, config):
+    """Handle the process of loading stock quantities from a CSV or JSON Lines file."""
+    path = input("Enter path of the stock file (.csv or .jsonl): ").strip()
     
+    if not path:
+        print("No file given")
+        return
+    
+    restart = False
     try:
-        product_idx = int(input("Enter product number: ")) - 1
-        if product_idx < 0 or product_idx >= len(products):
-            print("Invalid product selection")
+        checkpoint = JobCheckpoint('stock_load', path)
+    except OSError as e:
+        print(f"Cannot read {path}: {str(e)}")
+        return
+    
+    if checkpoint.completed or checkpoint.stale:
+        answer = input("This file was loaded before or has changed since. Load it again from the first row? (y/N): ")
+        if answer.strip().lower() != 'y':
             return
-    except ValueError:
-        print("Please enter a valid number")
+        restart = True
+    elif checkpoint.rows_done:
+        print(f"Resuming the previous load after row {checkpoint.rows_done}.")
+    
+    sink = choose_report_sink('stock_load')
+    if sink:
+        import_stock_from_file(uid, config, path, sink, restart=restart)
+
+def handle_ship_orders(uid, config):
+    """Handle the process of shipping the deliveries of confirmed orders."""
+    references = input("Enter order references separated by commas (leave empty for all open deliveries): ")
+    order_names = [name.strip() for name in references.split(',') if name.strip()]
+    
+    answer = input("Keep quantities that cannot be shipped on a backorder? (Y/n): ")
+    create_backorders = answer.strip().lower() != 'n'
+    
+    sink = choose_report_sink('fulfillment')
+    if sink:
+        ship_orders(uid, config, order_names=order_names or None, sink=sink,
+                    create_backorders=create_backorders)
+
+def handle_replenishment(uid, config):
+    """Handle the process of creating transfers from a replenishment plan file."""
+    path = input("Enter path of the transfer plan (.csv or .jsonl): ").strip()
+    
+    if not path:
+        print("No file given")
         return
     
-    product_id = products[product_idx]['id']
+    try:
+        plan = load_replenishment_plan(path)
+    except (OSError, ValueError) as e:
+        print(f"Cannot read {path}: {str(e)}")
+        return
+    
+    sink = choose_report_sink('replenishment')
+    if sink:
+        create_replenishment_transfers(uid, config, plan, sink)
+
+def handle_write_journal(uid, config):
+    """Show queued and flagged writes of the journal and send the queued ones now."""
+    journal = get_write_journal(config)
+    counts = journal.counts()
+    print(f"\nWrite journal: {journal.path}")
+    print(", ".join(f"{count} {state}" for state, count in sorted(counts.items())) or "No operations recorded")
+    
+    flagged = journal.operations([REVIEW, FAILED])
+    for operation in flagged:
+        print(f"  - {operation['key']} {operation['kind']} {operation['state']}: {operation['error']}")
+        print(f"    {operation['payload']}")
+    
+    review_keys = [operation['key'] for operation in flagged if operation['state'] == REVIEW]
+    if review_keys and input("Requeue the operations that need review? Check Odoo first (y/n): ").strip().lower() == 'y':
+        journal.requeue(review_keys)
+    
+    if counts.get(QUEUED) or review_keys:
+        try:
+            summary = journal.flush(uid, config)
+            if summary is None:
+                print("Another process is sending the queued writes of this journal.")
+                return
+            print(f"Sent queued writes: {summary['done']} done, {summary['failed']} failed, "
+                  f"{summary['review']} need review")
+        except Exception as e:
+            print(f"Could not send queued writes: {str(e)}")
+
+def handle_create_sale(uid, config):
+    """Handle the process of creating a sale."""
+    # Select product
+    product_id = choose_product(uid, config, "Select a product to sell")
+    
+    if not product_id:
+        return
     
     # Get customer
     customer_id = create_customer(uid, config)
@@ -181,8 +377,16 @@ def handle_create_sale(uid, config):
         print("Please enter a valid number. Using default quantity of 1.")
         quantity = 1
     
+    # Check stock before selling
+    shortages = check_basket_availability(uid, config, [(product_id, quantity)], warehouse_id)
+    if shortages:
+        print(f"Only {shortages[0]['available']} units available in {warehouses[wh_idx]['name']}, "
+              f"{shortages[0]['requested']} requested.")
+        if input("Create the sale anyway? (y/n): ").strip().lower() != 'y':
+            return
+    
     # Create sale
-    create_sale_order(uid, config, product_id, customer_id, warehouse_id, quantity)
+    create_sale_order(uid, config, product_id, customer_id, warehouse_id, quantity, check_stock=False)
 
 def run_complete_process(uid, config):
     """Run the complete process from creating a product to generating reports."""
@@ -197,6 +401,14 @@ def run_complete_process(uid, config):
     
     product_id = liquor_product['id']
     
+    # The remaining steps share one time budget, so a stuck request cannot hang the whole run
+    with deadline(RPC_CONFIG['workflow_deadline']):
+        run_process_steps(uid, config, product_id)
+    
+    print("\n--- COMPLETE PROCESS FINISHED ---")
+
+def run_process_steps(uid, config, product_id):
+    """Run steps 4-7 of the complete process for a product."""
     # Step 4: Add to warehouses
     warehouses = get_warehouses(uid, config)
     
@@ -207,6 +419,15 @@ def run_complete_process(uid, config):
     # Add product to each warehouse with different quantities
     quantities = [15, 20, 25]  # Different quantities for different warehouses
     
+    from sales_operations import check_sales_module_available
+    sales_available = check_sales_module_available(uid, config)
+    
+    # Steps 4 and 5 in one request when server macros are enabled
+    if MACRO_CONFIG['enabled'] and sales_available and run_stock_and_sale_macro(
+            uid, config, product_id, warehouses, quantities):
+        run_report_steps(uid, config, sales_available)
+        return
+    
     for i, wh in enumerate(warehouses):
         if wh.get('lot_stock_id'):
             location_id = wh['lot_stock_id'][0]
@@ -216,9 +437,6 @@ def run_complete_process(uid, config):
             add_product_to_warehouse(uid, config, product_id, location_id, quantity)
     
     # Step 5: Create a sale if the sales module is available
-    from sales_operations import check_sales_module_available
-    sales_available = check_sales_module_available(uid, config)
-    
     if sales_available:
         customer_id = create_customer(uid, config)
         
@@ -229,6 +447,42 @@ def run_complete_process(uid, config):
     else:
         print("Skipping sales process since sales module is not available.")
     
+    run_report_steps(uid, config, sales_available)
+
+def run_stock_and_sale_macro(uid, config, product_id, warehouses, quantities):
+    """
+    Add the product to each warehouse and sell 5 units with one server macro request.
+
+    Returns:
+        bool: False if the macro saved nothing and the steps should run one by one
+    """
+    stock = []
+    for i, wh in enumerate(warehouses):
+        if wh.get('lot_stock_id'):
+            stock.append((product_id, wh['lot_stock_id'][0], quantities[i % len(quantities)]))
+    
+    print(f"Adding stock to {len(stock)} warehouses and creating a sale in {warehouses[0]['name']} (server macro)...")
+    try:
+        order = sale_order_macro(
+            uid, config, [(product_id, 5, None)],
+            customer={'name': 'Sample Customer', 'email': 'sample@example.com', 'phone': '+9412345678'},
+            warehouse_id=warehouses[0]['id'], stock=stock
+        )
+    except MacroOutcomeUnknown as e:
+        # Running the steps again could add the stock and the sale twice
+        print(f"{str(e)}. Not repeating steps 4-5; check the stock and sales orders in Odoo")
+        invalidate_product_availability(config, [product_id])
+        return True
+    if not order:
+        print("Server macro failed, running the steps one by one instead")
+        return False
+    
+    invalidate_product_availability(config, [product_id])
+    print(f"Order: {order['name']}, State: {order['state']}, Total: {order['amount_total']}")
+    return True
+
+def run_report_steps(uid, config, sales_available):
+    """Run steps 6-7 of the complete process."""
     # Step 6: Generate inventory report
     print("\nGenerating inventory report...")
     generate_inventory_report(uid, config)
@@ -237,9 +491,6 @@ def run_complete_process(uid, config):
     if sales_available:
         print("\nGenerating sales report...")
         generate_sales_report(uid, config)
-    
-    print("\n--- COMPLETE PROCESS FINISHED ---")  
-    print("\n--- COMPLETE PROCESS FINISHED ---")
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -2,6 +2,7 @@
 import xmlrpc.client
 import json
 from pprint import pprint
+from connection import get_model_connection
 
 # Connection parameters
 url = 'https://ncinga.odoo.com'
@@ -34,7 +35,7 @@ def inspect_existing_products(uid):
     
     try:
         print("\n--- INSPECTING EXISTING PRODUCTS ---")
-        models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+        models = get_model_connection(url)
         
         # Get all products
         products = models.execute_kw(
@@ -80,7 +81,7 @@ def inspect_product_fields(uid):
     
     try:
         print("\n--- INSPECTING PRODUCT FIELDS ---")
-        models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+        models = get_model_connection(url)
         
         # Get fields for product.product model
         product_fields = models.execute_kw(
@@ -122,7 +123,7 @@ def create_sample_product(uid):
     
     try:
         print("\n--- ATTEMPTING TO CREATE A PRODUCT WITH MINIMAL FIELDS ---")
-        models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+        models = get_model_connection(url)
         
         # Get product categories
         categories = models.execute_kw(
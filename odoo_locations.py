@@ -1,6 +1,9 @@
 #!/usr/bin/env python3
 import xmlrpc.client
 import sys
+import json
+from connection import get_model_connection
+from bulk_operations import create_records, iter_file_records
 
 # Connection parameters
 url = 'https://ncinga.odoo.com'
@@ -40,7 +43,7 @@ def check_permissions(uid):
     
     try:
         print("\nChecking user permissions...")
-        models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+        models = get_model_connection(url)
         
         # Get user details
         user_data = models.execute_kw(
@@ -84,7 +87,7 @@ def verify_locations(uid):
     
     try:
         print("\nVerifying existing stock locations...")
-        models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+        models = get_model_connection(url)
         
         # Get all stock locations
         locations = models.execute_kw(
@@ -111,7 +114,7 @@ def list_warehouses(uid):
     
     try:
         # Connect to the object endpoint
-        models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+        models = get_model_connection(url)
         
         # Search for warehouses
         warehouse_ids = models.execute_kw(
@@ -153,7 +156,7 @@ def create_stock_location(uid, name, parent_location_id=None):
     
     try:
         print(f"\nAttempting to create new stock location: {name}...")
-        models = xmlrpc.client.ServerProxy(f'{url}/xmlrpc/2/object')
+        models = get_model_connection(url)
         
         # First try to get the default WH/Stock location if no parent is specified
         if not parent_location_id:
@@ -229,26 +232,213 @@ def create_stock_location(uid, name, parent_location_id=None):
             print("Try using the Odoo web interface instead, or contact your administrator.")
         return None
 
+# Function to find the default parent (WH/Stock, or any internal location)
+def find_default_parent_location(uid, models):
+    stock_locations = models.execute_kw(
+        db_name, uid, password,
+        'stock.location', 'search_read',
+        [[('name', '=', 'Stock'), ('usage', '=', 'internal')]],
+        {'fields': ['id', 'complete_name'], 'limit': 1}
+    )
+    
+    if stock_locations:
+        return stock_locations[0]
+    
+    # Fallback to getting any internal location
+    internal_locations = models.execute_kw(
+        db_name, uid, password,
+        'stock.location', 'search_read',
+        [[('usage', '=', 'internal')]],
+        {'fields': ['id', 'complete_name'], 'limit': 1}
+    )
+    
+    return internal_locations[0] if internal_locations else None
+
+# Function to read a location tree from a file.
+# JSON files hold a nested tree: a node or a list of nodes such as
+# {"name": "Nugegoda", "usage": "view", "children": [{"name": "Zone A", "children": [...]}]}.
+# CSV and JSON Lines files hold one location per row with "name", optional "parent"
+# (full name of the parent location) and "usage".
+def load_location_tree_file(path):
+    if path.lower().endswith('.json'):
+        with open(path, encoding='utf-8') as handle:
+            tree = json.load(handle)
+        return tree if isinstance(tree, list) else [tree]
+    
+    return [record for _, record in iter_file_records(path)]
+
+# Function to create many locations, including whole trees, in a few requests.
+# Each spec has a "name" and optionally "parent" (the full name of an existing location
+# or of another spec in the same batch), "usage", "barcode" and nested "children".
+# Existing locations are reused, each level of the tree is created with one
+# multi-record create and all new locations are read back with a single read.
+def create_locations_bulk(uid, location_specs):
+    if not uid:
+        return []
+    
+    try:
+        models = get_model_connection(url)
+        
+        # Resolve full paths: a spec without parent goes under the default parent
+        nodes = []
+        listed = set()
+        default_parent = None
+        pending = [(spec, None) for spec in location_specs]
+        while pending:
+            spec, inherited_parent = pending.pop(0)
+            parent = spec.get('parent') or inherited_parent
+            if not parent:
+                if default_parent is None:
+                    default_parent = find_default_parent_location(uid, models)
+                    if not default_parent:
+                        print("No suitable parent location found. Cannot create new locations.")
+                        return []
+                    print(f"Using parent location: {default_parent['complete_name']} (ID: {default_parent['id']})")
+                parent = default_parent['complete_name']
+            full_name = f"{parent}/{spec['name']}"
+            if full_name in listed:
+                print(f"{full_name} is listed more than once; creating it once")
+            else:
+                listed.add(full_name)
+                nodes.append({'spec': spec, 'parent': parent, 'full_name': full_name})
+            for child in spec.get('children') or []:
+                pending.append((child, full_name))
+        
+        # Look up every parent and target path in one search
+        names = list({node['parent'] for node in nodes} | {node['full_name'] for node in nodes})
+        existing = models.execute_kw(
+            db_name, uid, password,
+            'stock.location', 'search_read',
+            [[('complete_name', 'in', names)]],
+            {'fields': ['id', 'complete_name']}
+        )
+        location_ids = {loc['complete_name']: loc['id'] for loc in existing}
+        
+        # Group the missing locations by depth below an existing location
+        batch_nodes = {node['full_name']: node for node in nodes}
+        depth = {}
+        def node_depth(node):
+            if node['full_name'] not in depth:
+                parent_node = batch_nodes.get(node['parent'])
+                depth[node['full_name']] = 0 if parent_node is None else node_depth(parent_node) + 1
+            return depth[node['full_name']]
+        
+        levels = {}
+        reused = []
+        failed = {}
+        # Error that stopped each failed location, passed on to its subtree
+        causes = {}
+        for node in nodes:
+            if node['full_name'] in location_ids:
+                reused.append(node['full_name'])
+                continue
+            if node['parent'] not in location_ids and node['parent'] not in batch_nodes:
+                print(f"Skipping {node['full_name']}: parent location {node['parent']} does not exist")
+                causes[node['full_name']] = f"Parent location {node['parent']} does not exist"
+                failed[node['full_name']] = causes[node['full_name']]
+                continue
+            levels.setdefault(node_depth(node), []).append(node)
+        
+        if reused:
+            print(f"{len(reused)} locations already exist and are reused")
+        
+        # Create each level with one request, parents before children
+        created = []
+        for level in sorted(levels):
+            batch = []
+            for node in levels[level]:
+                if node['parent'] in location_ids:
+                    batch.append(node)
+                    continue
+                # The parent failed or was skipped, so the whole subtree is left out
+                causes[node['full_name']] = causes.get(node['parent'])
+                failed[node['full_name']] = f"Parent {node['parent']} not created: {causes[node['full_name']]}"
+                print(f"Skipping {node['full_name']}: {failed[node['full_name']]}")
+            if not batch:
+                continue
+            vals_list = []
+            for node in batch:
+                vals = {
+                    'name': node['spec']['name'],
+                    'usage': node['spec'].get('usage', 'internal'),
+                    'location_id': location_ids[node['parent']],
+                }
+                if node['spec'].get('barcode'):
+                    vals['barcode'] = node['spec']['barcode']
+                vals_list.append(vals)
+            
+            print(f"Creating {len(vals_list)} locations at level {level + 1}...")
+            for node, (location_id, error) in zip(batch, create_records(models, {'db_name': db_name, 'password': password},
+                                                                       uid, 'stock.location', vals_list)):
+                if error:
+                    print(f"Could not create {node['full_name']}: {error}")
+                    failed[node['full_name']] = causes[node['full_name']] = error
+                    continue
+                location_ids[node['full_name']] = location_id
+                created.append(location_id)
+        
+        if failed:
+            print("\nNot created:")
+            print("-" * 80)
+            for full_name, error in failed.items():
+                print(f"{full_name:<50} {error}")
+            print("-" * 80)
+        
+        if not created:
+            return []
+        
+        # Read back all new locations in one request
+        locations = models.execute_kw(
+            db_name, uid, password,
+            'stock.location', 'read',
+            [created, ['name', 'complete_name', 'location_id', 'usage']]
+        )
+        
+        print("\nNew Locations:")
+        print("-" * 80)
+        for loc in locations:
+            print(f"ID: {loc['id']:<8} {loc['complete_name']:<50} Usage: {loc['usage']}")
+        print("-" * 80)
+        
+        return locations
+        
+    except Exception as e:
+        print(f"Error creating locations: {str(e)}")
+        if "Access Denied" in str(e) or "access right" in str(e).lower():
+            print("\nPermission denied: Your user account doesn't have rights to create stock locations.")
+            print("Try using the Odoo web interface instead, or contact your administrator.")
+        return []
+
 # Main function to create multiple locations
 def create_multiple_locations(uid, location_names):
     print(f"\nAttempting to create {len(location_names)} new locations...")
     
-    created_locations = []
-    for name in location_names:
-        location_id = create_stock_location(uid, name)
-        if location_id:
-            created_locations.append((name, location_id))
+    locations = create_locations_bulk(uid, [{'name': name} for name in location_names])
     
-    if created_locations:
+    if locations:
         print("\nSummary of created locations:")
-        for name, loc_id in created_locations:
-            print(f" - {name} (ID: {loc_id})")
+        for loc in locations:
+            print(f" - {loc['name']} (ID: {loc['id']})")
     else:
-        print("\nNo locations were successfully created.")
+        print("\nNo locations were created.")
     
     # Verify all locations after creation attempts
     verify_locations(uid)
 
+# Function to create a branch tree (branch, zones, bins) described in a file
+def create_location_tree_from_file(uid, path):
+    print(f"\nCreating locations from {path}...")
+    
+    try:
+        tree = load_location_tree_file(path)
+    except (OSError, ValueError) as e:
+        print(f"Could not read location file: {str(e)}")
+        return []
+    
+    locations = create_locations_bulk(uid, tree)
+    print(f"\nCreated {len(locations)} locations.")
+    return locations
+
 # Main execution
 def main():
     uid = test_connection()
@@ -260,6 +450,11 @@ def main():
     # Check permissions first
     check_permissions(uid)
     
+    # A location file (e.g. a whole branch with zones and bins) can be given on the command line
+    if len(sys.argv) > 1:
+        create_location_tree_from_file(uid, sys.argv[1])
+        return
+    
     # Location names to create
     location_names = ["Nugegoda", "Kottawa", "Maharagama"]
     
@@ -0,0 +1,618 @@
+"""
+Local stand-in for an Odoo server.
+
+Serves the XML-RPC endpoints this tool uses from an in-memory database seeded
+with two warehouses, a few locations, products and a customer, so features
+can be tried without an Odoo instance. Server macros run for real: their code
+is executed against a small emulation of the Odoo ORM, inside a transaction
+that is rolled back if the macro fails.
+
+This is not Odoo. Domains, fields and workflows only go as far as this tool
+needs, and data is lost when the process stops.
+
+Usage:
+    python odoo_standin.py [port] [latency]
+
+latency adds a delay in seconds to every request, to mimic a remote server.
+Set ODOO_CONFIG['url'] to http://127.0.0.1:8069; any database, username and
+password are accepted.
+"""
+import copy
+import itertools
+import re
+import sys
+import threading
+import time
+import xmlrpc.client
+from socketserver import ThreadingMixIn
+from xmlrpc.server import SimpleXMLRPCRequestHandler, SimpleXMLRPCServer
+
+SERVER_VERSION = '17.0'
+
+# Model of the records many2one fields point to
+MANY2ONE = {
+    'categ_id': 'product.category',
+    'company_id': 'res.company',
+    'default_location_src_id': 'stock.location',
+    'default_location_dest_id': 'stock.location',
+    'location_id': 'stock.location',
+    'location_dest_id': 'stock.location',
+    'lot_stock_id': 'stock.location',
+    'model_id': 'ir.model',
+    'order_id': 'sale.order',
+    'partner_id': 'res.partner',
+    'picking_id': 'stock.picking',
+    'picking_type_id': 'stock.picking.type',
+    'pricelist_id': 'product.pricelist',
+    'product_id': 'product.product',
+    'product_tmpl_id': 'product.template',
+    'sale_id': 'sale.order',
+    'uom_id': 'uom.uom',
+    'warehouse_id': 'stock.warehouse',
+}
+
+# One2many fields: (comodel, inverse many2one)
+ONE2MANY = {
+    ('sale.order', 'order_line'): ('sale.order.line', 'order_id'),
+    ('sale.order', 'picking_ids'): ('stock.picking', 'sale_id'),
+    ('stock.picking', 'move_ids'): ('stock.move', 'picking_id'),
+}
+
+# Fields fields_get reports besides the ones found on stored records
+EXTRA_FIELDS = {
+    'res.partner': ['customer_rank', 'property_product_pricelist'],
+    'stock.move': ['quantity', 'picked'],
+    'stock.move.line': ['quantity_product_uom'],
+    'stock.picking': ['move_ids'],
+}
+
+# Models with an active field: new records are active and searches skip
+# archived ones unless the domain mentions active
+ACTIVE_MODELS = {'product.product', 'product.template', 'res.partner'}
+
+def _now():
+    return time.strftime('%Y-%m-%d %H:%M:%S')
+
+def _like_token(match):
+    """Translate one token of a LIKE pattern to a regular expression."""
+    if match.group(0) == '%':
+        return '.*'
+    if match.group(0) == '_':
+        return '.'
+    return re.escape(match.group(1) if match.group(1) is not None else match.group(2))
+
+class StandinDatabase:
+    """In-memory records of the stand-in, with the Odoo methods the tool calls."""
+
+    def __init__(self, latency=0.0):
+        self.latency = latency
+        self.tables = {}
+        self.sequence = itertools.count(1000)
+        self.lock = threading.RLock()
+        self.calls = 0
+        self._seed()
+
+    def _add(self, model, vals, record_id=None):
+        record_id = record_id or next(self.sequence)
+        record = {'id': record_id, 'create_date': _now(), 'write_date': _now()}
+        if model in ACTIVE_MODELS:
+            record['active'] = True
+        record.update(vals)
+        self.tables.setdefault(model, {})[record_id] = record
+        return record_id
+
+    def _seed(self):
+        self._add('res.company', {'name': 'My Company'}, 1)
+        self._add('res.users', {'name': 'Administrator', 'partner_id': [3, 'Administrator']}, 2)
+        self._add('res.partner', {'name': 'Administrator', 'email': 'admin@example.com', 'phone': False,
+                                  'ref': False, 'customer_rank': 0}, 3)
+        self._add('res.partner', {'name': 'Walk-in Customer', 'email': 'customer@example.com', 'phone': '+94111111111',
+                                  'ref': 'C0001', 'customer_rank': 1}, 4)
+        self._add('product.category', {'name': 'Liquor', 'complete_name': 'All / Liquor', 'parent_id': False}, 1)
+        self._add('uom.uom', {'name': 'Units'}, 1)
+        for model in ['res.partner', 'product.product', 'sale.order', 'sale.order.line', 'stock.quant',
+                      'stock.location', 'stock.picking', 'stock.move']:
+            self._add('ir.model', {'model': model, 'name': model})
+
+        self._add('stock.location', {'name': 'Physical Locations', 'complete_name': 'Physical Locations',
+                                     'usage': 'view', 'location_id': False, 'parent_path': '1/',
+                                     'warehouse_id': False}, 1)
+        self._add('stock.location', {'name': 'Customers', 'complete_name': 'Partners/Customers', 'usage': 'customer',
+                                     'location_id': False, 'parent_path': '9/', 'warehouse_id': False}, 9)
+        for index, code in enumerate(['WH', 'NUG']):
+            warehouse_id = index + 1
+            location_id = 10 + index
+            self._add('stock.location', {'name': 'Stock', 'complete_name': f'{code}/Stock', 'usage': 'internal',
+                                         'location_id': [1, 'Physical Locations'], 'parent_path': f'1/{location_id}/',
+                                         'warehouse_id': [warehouse_id, code]}, location_id)
+            self._add('stock.warehouse', {'name': code, 'code': code, 'lot_stock_id': [location_id, f'{code}/Stock'],
+                                          'partner_id': False}, warehouse_id)
+            self._add('stock.picking.type', {'name': 'Internal Transfers', 'code': 'internal',
+                                             'warehouse_id': [warehouse_id, code],
+                                             'default_location_src_id': [location_id, f'{code}/Stock'],
+                                             'default_location_dest_id': [location_id, f'{code}/Stock']}, 20 + index)
+            self._add('stock.picking.type', {'name': 'Delivery Orders', 'code': 'outgoing',
+                                             'warehouse_id': [warehouse_id, code],
+                                             'default_location_src_id': [location_id, f'{code}/Stock'],
+                                             'default_location_dest_id': [9, 'Partners/Customers']}, 30 + index)
+
+        for index, (code, name, price) in enumerate([('WHISKY001', 'Premium Whiskey', 45.99),
+                                                      ('ARR-750', 'Arrack 750ml', 35.0),
+                                                      ('GIN-700', 'Dry Gin 700ml', 28.5)], start=1):
+            self._add('product.template', {'name': name}, 100 + index)
+            self._add('product.product', {'name': name, 'default_code': code, 'type': 'product',
+                                          'categ_id': [1, 'All / Liquor'], 'list_price': price,
+                                          'standard_price': round(price * 0.6, 2),
+                                          'product_tmpl_id': [100 + index, name], 'uom_id': [1, 'Units'],
+                                          'active': True}, index)
+            self._add('stock.quant', {'product_id': [index, name], 'location_id': [10, 'WH/Stock'],
+                                      'quantity': 10.0 * index})
+
+    # Values and domains
+
+    def display_name(self, model, record_id):
+        record = self.tables.get(model, {}).get(record_id, {})
+        return record.get('complete_name') or record.get('name') or str(record_id)
+
+    def _value(self, model, record, field):
+        """Stored or computed value of a field, as XML-RPC would return it."""
+        if (model, field) in ONE2MANY:
+            comodel, inverse = ONE2MANY[(model, field)]
+            return [child['id'] for child in self.tables.get(comodel, {}).values()
+                    if (child.get(inverse) or [None])[0] == record['id']]
+        if model == 'sale.order' and field == 'amount_total':
+            return sum(self._value('sale.order.line', line, 'price_subtotal')
+                       for line in self.tables.get('sale.order.line', {}).values()
+                       if line['order_id'][0] == record['id'])
+        if model == 'sale.order.line' and field == 'price_subtotal':
+            return round(record.get('product_uom_qty', 0.0) * record.get('price_unit', 0.0), 2)
+        return record.get(field, False)
+
+    def _path_value(self, model, record, path):
+        field, _, rest = path.partition('.')
+        value = self._value(model, record, field)
+        if not rest:
+            return value
+        target = self.tables.get(MANY2ONE.get(field), {}).get(value[0] if value else None)
+        return self._path_value(MANY2ONE[field], target, rest) if target else False
+
+    def _match_leaf(self, model, record, leaf):
+        field, operator, expected = leaf
+        value = self._path_value(model, record, field)
+        if isinstance(value, list) and len(value) == 2 and isinstance(value[1], str):
+            value = value[0]
+        if operator == '=':
+            return value == expected or (expected is False and not value)
+        if operator == '!=':
+            return value != expected and not (expected is False and not value)
+        if operator in ('in', 'not in'):
+            values = value if isinstance(value, list) else [value]
+            found = any(item in expected for item in values)
+            return found if operator == 'in' else not found
+        if operator in ('<', '<=', '>', '>='):
+            if value is None or value is False:
+                return False
+            return {'<': value < expected, '<=': value <= expected,
+                    '>': value > expected, '>=': value >= expected}[operator]
+        if operator in ('like', 'ilike'):
+            return str(expected).lower() in str(value or '').lower()
+        if operator in ('=like', '=ilike'):
+            # SQL LIKE: % is any text, _ any character, a backslash escapes the next character
+            regex = re.sub(r'\\(.)|%|_|(.)', _like_token, str(expected))
+            flags = re.DOTALL | (re.IGNORECASE if operator == '=ilike' else 0)
+            return value not in (None, False) and re.fullmatch(regex, str(value), flags) is not None
+        if operator == 'child_of':
+            ids = expected if isinstance(expected, list) else [expected]
+            location = record if field == 'id' else self.tables.get('stock.location', {}).get(value, {})
+            parents = (location.get('parent_path') or '').split('/')
+            return any(str(location_id) in parents for location_id in ids)
+        raise ValueError(f"Unsupported operator {operator}")
+
+    def _match(self, model, record, domain):
+        stack = []
+        for token in reversed(domain):
+            if token == '|':
+                stack.append(stack.pop() | stack.pop())
+            elif token == '&':
+                stack.append(stack.pop() & stack.pop())
+            elif token == '!':
+                stack.append(not stack.pop())
+            else:
+                stack.append(bool(self._match_leaf(model, record, token)))
+        return all(stack)
+
+    def search_records(self, model, domain, offset=0, limit=None, order=None):
+        if model in ACTIVE_MODELS and not any(isinstance(leaf, (list, tuple)) and leaf[0] == 'active' for leaf in domain):
+            domain = [['active', '=', True]] + list(domain)
+        records = [record for record in self.tables.get(model, {}).values() if self._match(model, record, domain)]
+        records.sort(key=lambda record: record['id'])
+        for part in reversed((order or '').split(',')):
+            bits = part.split()
+            if not bits:
+                continue
+            field = bits[0]
+            records.sort(key=lambda record: (record.get(field) is None, record.get(field) or 0
+                                             if isinstance(record.get(field), (int, float)) else str(record.get(field))),
+                         reverse=len(bits) > 1 and bits[1].lower() == 'desc')
+        records = records[offset:]
+        return records[:limit] if limit else records
+
+    def read_records(self, model, ids, fields, context=None):
+        context = context or {}
+        rows = []
+        for record_id in ids:
+            record = self.tables.get(model, {}).get(record_id)
+            if record is None:
+                continue
+            names = fields or list(record)
+            row = {'id': record_id}
+            for field in names:
+                row[field] = self._value(model, record, field)
+            if model == 'product.product' and {'qty_available', 'virtual_available'} & set(names):
+                quantity = self._on_hand(record_id, context)
+                row.update({'qty_available': quantity, 'virtual_available': quantity})
+            rows.append(row)
+        return rows
+
+    def _on_hand(self, product_id, context):
+        """On-hand quantity of a product, limited to a warehouse or location from the context."""
+        total = 0.0
+        for quant in self.tables.get('stock.quant', {}).values():
+            if quant['product_id'][0] != product_id:
+                continue
+            location = self.tables['stock.location'].get(quant['location_id'][0], {})
+            if location.get('usage') != 'internal':
+                continue
+            if context.get('warehouse') and (location.get('warehouse_id') or [None])[0] != context['warehouse']:
+                continue
+            if context.get('location') and str(context['location']) not in (location.get('parent_path') or '').split('/'):
+                continue
+            total += quant['quantity']
+        return total
+
+    # Writes
+
+    def create_record(self, model, vals):
+        vals = dict(vals)
+        children = []
+        for field, value in list(vals.items()):
+            if (model, field) in ONE2MANY:
+                children.append((ONE2MANY[(model, field)], vals.pop(field)))
+            elif field in MANY2ONE and isinstance(value, int) and not isinstance(value, bool):
+                if MANY2ONE[field] in self.tables and value not in self.tables[MANY2ONE[field]]:
+                    raise ValueError(f"Record {MANY2ONE[field]}({value}) does not exist or has been deleted")
+                vals[field] = [value, self.display_name(MANY2ONE[field], value)]
+        if model == 'sale.order':
+            vals.setdefault('state', 'draft')
+            vals.setdefault('date_order', _now())
+        if model == 'sale.order.line':
+            product = self.tables.get('product.product', {}).get(vals['product_id'][0], {})
+            vals.setdefault('price_unit', product.get('list_price', 0.0))
+            vals.setdefault('name', product.get('name'))
+        if model == 'stock.picking':
+            vals.setdefault('state', 'draft')
+        if model == 'res.partner':
+            vals.setdefault('customer_rank', 0)
+
+        record_id = self._add(model, vals)
+        if model == 'sale.order':
+            self.tables[model][record_id]['name'] = f"S{record_id:05d}"
+        elif model == 'stock.picking' and not vals.get('name'):
+            self.tables[model][record_id]['name'] = f"INT/{record_id:05d}"
+        elif model == 'stock.location' and vals.get('location_id'):
+            parent = self.tables[model].get(vals['location_id'][0], {})
+            self.tables[model][record_id].setdefault('complete_name', f"{parent.get('complete_name')}/{vals['name']}")
+            self.tables[model][record_id]['parent_path'] = f"{parent.get('parent_path', '')}{record_id}/"
+
+        for (comodel, inverse), commands in children:
+            for command in commands:
+                if command[0] == 0:
+                    self.create_record(comodel, dict(command[2], **{inverse: record_id}))
+        return record_id
+
+    def write_records(self, model, ids, vals):
+        for record_id in ids:
+            record = self.tables[model][record_id]
+            for field, value in vals.items():
+                if field in MANY2ONE and isinstance(value, int) and not isinstance(value, bool):
+                    value = [value, self.display_name(MANY2ONE[field], value)]
+                record[field] = value
+            record['write_date'] = _now()
+        return True
+
+    def update_quant(self, product_id, location_id, quantity):
+        """Add a quantity to the quant of a product in a location, creating it if needed."""
+        for quant in self.tables.get('stock.quant', {}).values():
+            if quant['product_id'][0] == product_id and quant['location_id'][0] == location_id:
+                quant['quantity'] += quantity
+                return quant['id']
+        return self.create_record('stock.quant', {'product_id': product_id, 'location_id': location_id,
+                                                  'quantity': quantity})
+
+    def confirm_orders(self, order_ids):
+        for order_id in order_ids:
+            order = self.tables['sale.order'][order_id]
+            order['state'] = 'sale'
+            warehouse_id = (order.get('warehouse_id') or [1])[0]
+            stock_location_id = self.tables['stock.warehouse'][warehouse_id]['lot_stock_id'][0]
+            picking_id = self.create_record('stock.picking', {
+                'name': f"{self.tables['stock.warehouse'][warehouse_id]['code']}/OUT/{next(self.sequence):05d}",
+                'sale_id': order_id, 'picking_type_code': 'outgoing', 'state': 'confirmed',
+                'location_id': stock_location_id, 'location_dest_id': 9,
+            })
+            for line in self.tables.get('sale.order.line', {}).values():
+                if line['order_id'][0] == order_id:
+                    self.create_record('stock.move', {
+                        'picking_id': picking_id, 'product_id': line['product_id'][0],
+                        'product_uom_qty': line['product_uom_qty'], 'quantity': 0.0, 'state': 'confirmed',
+                        'location_id': stock_location_id, 'location_dest_id': 9,
+                    })
+            self.assign_pickings([picking_id])
+        return True
+
+    def _open_moves(self, picking_id):
+        return [move for move in self.tables.get('stock.move', {}).values()
+                if move['picking_id'][0] == picking_id and move['state'] not in ('done', 'cancel')]
+
+    def assign_pickings(self, picking_ids):
+        """Reserve what the source locations hold for the open moves of pickings, like action_assign."""
+        for picking_id in picking_ids:
+            moves = self._open_moves(picking_id)
+            for move in moves:
+                product_id, location_id = move['product_id'][0], move['location_id'][0]
+                on_hand = sum(quant['quantity'] for quant in self.tables.get('stock.quant', {}).values()
+                              if quant['product_id'][0] == product_id and quant['location_id'][0] == location_id)
+                reserved = sum(other['quantity'] for other in self.tables['stock.move'].values()
+                               if other is not move and other['state'] not in ('done', 'cancel')
+                               and other['product_id'][0] == product_id and other['location_id'][0] == location_id)
+                move['quantity'] = max(0.0, min(move['product_uom_qty'], on_hand - reserved))
+            self.tables['stock.picking'][picking_id]['state'] = (
+                'assigned' if any(move['quantity'] for move in moves) else 'confirmed')
+        return True
+
+    def validate_pickings(self, picking_ids):
+        """Ship the reserved or picked quantities; the rest of each move goes to a backorder."""
+        for picking_id in picking_ids:
+            if not any(move.get('quantity') for move in self._open_moves(picking_id)):
+                raise xmlrpc.client.Fault(1, "You cannot validate a transfer if no quantities are reserved nor done.")
+        for picking_id in picking_ids:
+            picking = self.tables['stock.picking'][picking_id]
+            backorder_id = None
+            for move in self._open_moves(picking_id):
+                quantity = min(move.get('quantity') or 0.0, move['product_uom_qty'])
+                remaining = move['product_uom_qty'] - quantity
+                if quantity:
+                    self.update_quant(move['product_id'][0], move['location_id'][0], -quantity)
+                    if self.tables['stock.location'][move['location_dest_id'][0]].get('usage') == 'internal':
+                        self.update_quant(move['product_id'][0], move['location_dest_id'][0], quantity)
+                if remaining > 0:
+                    if backorder_id is None:
+                        backorder_id = self.create_record('stock.picking', {
+                            'name': f"{picking['name']}-BO", 'sale_id': picking['sale_id'][0],
+                            'picking_type_code': picking['picking_type_code'], 'state': 'confirmed',
+                            'location_id': picking['location_id'][0], 'location_dest_id': picking['location_dest_id'][0],
+                        })
+                    self.create_record('stock.move', {
+                        'picking_id': backorder_id, 'product_id': move['product_id'][0],
+                        'product_uom_qty': remaining, 'quantity': 0.0, 'state': 'confirmed',
+                        'location_id': move['location_id'][0], 'location_dest_id': move['location_dest_id'][0],
+                    })
+                    move['product_uom_qty'] = quantity
+                move['state'] = 'done' if quantity else 'cancel'
+            picking['state'] = 'done'
+        return True
+
+    def run_server_actions(self, action_ids, context):
+        """Run the code of server actions in a transaction, like ir.actions.server.run."""
+        result = False
+        snapshot = copy.deepcopy(self.tables)
+        try:
+            for action_id in action_ids:
+                action = self.tables['ir.actions.server'][action_id]
+                model = self.tables['ir.model'][action['model_id'][0]]['model']
+                env = StandinEnvironment(self, context)
+                scope = {'env': env, 'model': env[model]}
+                exec(action['code'], scope)
+                result = scope.get('action') or result
+        except Exception:
+            self.tables = snapshot
+            raise
+        return result
+
+    # XML-RPC entry point
+
+    def execute_kw(self, db_name, uid, password, model, method, args, kwargs=None):
+        kwargs = kwargs or {}
+        if self.latency:
+            time.sleep(self.latency)
+        try:
+            with self.lock:
+                self.calls += 1
+                return self._dispatch(model, method, list(args), kwargs)
+        except xmlrpc.client.Fault:
+            raise
+        except Exception as e:
+            raise xmlrpc.client.Fault(2, f"Traceback (most recent call last):\n{type(e).__name__}: {e}")
+
+    def _dispatch(self, model, method, args, kwargs):
+        context = kwargs.get('context') or {}
+        if method in ('search', 'search_read', 'search_count'):
+            domain = args[0] if args else kwargs.get('domain', [])
+            records = self.search_records(model, domain, kwargs.get('offset', 0), kwargs.get('limit'),
+                                          kwargs.get('order'))
+            if method == 'search':
+                return [record['id'] for record in records]
+            if method == 'search_count':
+                return len(records)
+            fields = args[1] if len(args) > 1 else kwargs.get('fields')
+            return self.read_records(model, [record['id'] for record in records], fields, context)
+        if method == 'read':
+            ids = args[0] if isinstance(args[0], list) else [args[0]]
+            fields = args[1] if len(args) > 1 else kwargs.get('fields')
+            return self.read_records(model, ids, fields, context)
+        if method == 'create':
+            if isinstance(args[0], list):
+                return [self.create_record(model, vals) for vals in args[0]]
+            return self.create_record(model, args[0])
+        if method == 'write':
+            return self.write_records(model, args[0], args[1])
+        if method == 'unlink':
+            for record_id in args[0]:
+                self.tables.get(model, {}).pop(record_id, None)
+            return True
+        if method == 'fields_get':
+            names = {field for record in self.tables.get(model, {}).values() for field in record}
+            names.update(EXTRA_FIELDS.get(model, []))
+            return {name: {'type': 'char', 'string': name} for name in sorted(names)}
+        if method == 'read_group':
+            return self._read_group(model, args[0], args[1], args[2])
+        if model == 'sale.order' and method == 'action_confirm':
+            return self.confirm_orders(args[0])
+        if model == 'stock.picking' and method == 'button_validate':
+            return self.validate_pickings(args[0])
+        if model == 'stock.picking' and method == 'action_assign':
+            return self.assign_pickings(args[0])
+        if model == 'ir.actions.server' and method == 'run':
+            return self.run_server_actions(args[0], context)
+        if method in ('action_confirm', 'action_assign', 'action_apply_inventory', 'process', 'process_cancel_backorder'):
+            return True
+        raise xmlrpc.client.Fault(1, f"The method {model}.{method} is not available on the stand-in")
+
+    def _read_group(self, model, domain, fields, groupby):
+        groups = {}
+        for record in self.search_records(model, domain):
+            key = tuple(str(record.get(field)) for field in groupby)
+            group = groups.setdefault(key, dict({field: record.get(field, False) for field in groupby},
+                                                __count=0))
+            group['__count'] += 1
+            for spec in fields:
+                field, _, aggregate = spec.partition(':')
+                value = self._value(model, record, field)
+                if field in groupby or value is None or value is False:
+                    continue
+                if aggregate in ('max', 'min'):
+                    current = group.get(field)
+                    if current is None or (value > current if aggregate == 'max' else value < current):
+                        group[field] = value
+                elif isinstance(value, (int, float)) and not isinstance(value, bool):
+                    group[field] = group.get(field, 0) + value
+        if not groupby and not groups:
+            return [{'__count': 0}]
+        return list(groups.values())
+
+class StandinRecords:
+    """Recordset of the emulated ORM available to server macro code."""
+
+    def __init__(self, database, model, ids=(), context=None):
+        self._database = database
+        self._model = model
+        self._ids = list(ids)
+        self._context = context or {}
+
+    def _new(self, ids):
+        return StandinRecords(self._database, self._model, ids, self._context)
+
+    @property
+    def ids(self):
+        return list(self._ids)
+
+    @property
+    def id(self):
+        return self._ids[0] if self._ids else False
+
+    def __iter__(self):
+        return (self._new([record_id]) for record_id in self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __bool__(self):
+        return bool(self._ids)
+
+    def __getattr__(self, field):
+        if field.startswith('_'):
+            raise AttributeError(field)
+        if not self._ids:
+            return False
+        record = self._database.tables[self._model][self._ids[0]]
+        value = self._database._value(self._model, record, field)
+        if (self._model, field) in ONE2MANY:
+            return StandinRecords(self._database, ONE2MANY[(self._model, field)][0], value, self._context)
+        if field in MANY2ONE:
+            return StandinRecords(self._database, MANY2ONE[field], [value[0]] if value else [], self._context)
+        return value
+
+    def browse(self, ids=()):
+        return self._new([ids] if isinstance(ids, int) else ids)
+
+    def search(self, domain, limit=None, order=None):
+        return self._new([record['id'] for record in
+                          self._database.search_records(self._model, domain, limit=limit, order=order)])
+
+    def create(self, vals):
+        vals_list = vals if isinstance(vals, list) else [vals]
+        return self._new([self._database.create_record(self._model, item) for item in vals_list])
+
+    def write(self, vals):
+        return self._database.write_records(self._model, self._ids, vals)
+
+    def read(self, fields=None):
+        return self._database.read_records(self._model, self._ids, fields, self._context)
+
+    def with_context(self, **values):
+        return StandinRecords(self._database, self._model, self._ids, dict(self._context, **values))
+
+    def sudo(self):
+        return self
+
+    def action_confirm(self):
+        return self._database._dispatch(self._model, 'action_confirm', [self._ids], {})
+
+    def button_validate(self):
+        return self._database._dispatch(self._model, 'button_validate', [self._ids], {})
+
+    def _update_available_quantity(self, product, location, quantity):
+        self._database.update_quant(product.id, location.id, quantity)
+        return self._database._on_hand(product.id, {'location': location.id}), False
+
+class StandinEnvironment:
+    """The env of server macro code: models by name and the call context."""
+
+    def __init__(self, database, context):
+        self.database = database
+        self.context = context
+
+    def __getitem__(self, model):
+        return StandinRecords(self.database, model, context=self.context)
+
+class StandinServer(ThreadingMixIn, SimpleXMLRPCServer):
+    daemon_threads = True
+
+class StandinRequestHandler(SimpleXMLRPCRequestHandler):
+    rpc_paths = ('/xmlrpc/2/common', '/xmlrpc/2/object')
+
+def run_standin(host='127.0.0.1', port=8069, latency=0.0):
+    """
+    Serve the stand-in until interrupted.
+
+    Args:
+        host (str): Address to listen on
+        port (int): Port to listen on
+        latency (float): Delay in seconds added to every request
+    """
+    database = StandinDatabase(latency)
+    server = StandinServer((host, port), requestHandler=StandinRequestHandler, allow_none=True, logRequests=False)
+    server.register_function(lambda: {'server_version': SERVER_VERSION}, 'version')
+    server.register_function(lambda db_name, username, password, user_agent_env: 2, 'authenticate')
+    server.register_function(database.execute_kw, 'execute_kw')
+    print(f"Odoo stand-in serving on http://{host}:{port} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping stand-in.")
+    finally:
+        server.server_close()
+
+if __name__ == "__main__":
+    run_standin(port=int(sys.argv[1]) if len(sys.argv) > 1 else 8069,
+                latency=float(sys.argv[2]) if len(sys.argv) > 2 else 0.0)
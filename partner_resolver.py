@@ -0,0 +1,229 @@
+"""
+Mapping of external customers to res.partner records.
+
+Customers are matched by ref, email or phone against a local index. Keys not
+seen before are looked up with one search per chunk, and customers that do
+not exist yet are created with one multi-record create, so matching a large
+batch of orders costs a handful of requests instead of one per order.
+"""
+import re
+import threading
+from cache import get_cached
+from config import BULK_CONFIG
+from connection import get_model_connection
+from shared_cache import schema_validator
+from bulk_operations import chunked, create_records
+
+# Keys tried in this order when a customer has several of them
+PARTNER_KEYS = ['ref', 'email', 'phone']
+
+PARTNER_FIELDS = ['id', 'name', 'ref', 'email', 'phone']
+
+def normalize_key(key, value):
+    """
+    Normalize a customer key so differently formatted values match.
+
+    Args:
+        key (str): 'ref', 'email' or 'phone'
+        value (str): Raw value
+
+    Returns:
+        str or None: Normalized value, or None if empty
+    """
+    if not value:
+        return None
+    value = str(value).strip()
+    if key == 'email':
+        value = value.lower()
+    elif key == 'phone':
+        value = re.sub(r'\D', '', value)
+    return value or None
+
+def _like_escape(value):
+    """Escape the wildcards of a value so a like pattern matches it literally."""
+    return re.sub(r'([\\%_])', r'\\\1', value)
+
+def _customer_flag(uid, config, models):
+    """Values marking a partner as customer: customer_rank on Odoo 13+, customer before."""
+    def load():
+        fields = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'res.partner', 'fields_get',
+            [], {'attributes': ['type']}
+        )
+        return {'customer_rank': 1} if 'customer_rank' in fields else {'customer': True}
+
+    return get_cached(config, 'res.partner.customer_flag', load, shared=True,
+                      validator=schema_validator(uid, config, 'res.partner'))
+
+class PartnerResolver:
+    """
+    Local index of partners by ref, email and phone.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+    """
+
+    def __init__(self, uid, config):
+        self.uid = uid
+        self.config = config
+        self.index = {key: {} for key in PARTNER_KEYS}
+        self.lock = threading.Lock()
+
+    def _add(self, partner):
+        """Index a partner under each of its keys."""
+        for key in PARTNER_KEYS:
+            value = normalize_key(key, partner.get(key))
+            if value:
+                self.index[key].setdefault(value, partner['id'])
+
+    def _lookup(self, customer):
+        """Return the indexed partner ID of a customer, or None."""
+        for key in PARTNER_KEYS:
+            value = normalize_key(key, customer.get(key))
+            if value and value in self.index[key]:
+                return self.index[key][value]
+        return None
+
+    def _search(self, models, customers):
+        """
+        Look up the keys of unresolved customers with one search.
+
+        Odoo compares stored text, so emails are matched case-insensitively
+        and phones by their digits with any formatting in between. Partners
+        found this way are indexed under their own normalized keys, and only
+        those whose normalized key is equal to the customer's resolve it.
+        """
+        values = {key: set() for key in PARTNER_KEYS}
+        for customer in customers:
+            for key in PARTNER_KEYS:
+                value = normalize_key(key, customer.get(key))
+                if value:
+                    values[key].add(value)
+
+        leaves = []
+        if values['ref']:
+            leaves.append(['ref', 'in', sorted(values['ref'])])
+        for email in sorted(values['email']):
+            leaves.append(['email', '=ilike', _like_escape(email)])
+        for phone in sorted(values['phone']):
+            leaves.append(['phone', '=like', '%' + '%'.join(phone) + '%'])
+        if not leaves:
+            return
+        domain = ['|'] * (len(leaves) - 1) + leaves
+        partners = models.execute_kw(
+            self.config['db_name'], self.uid, self.config['password'],
+            'res.partner', 'search_read',
+            [domain],
+            {'fields': PARTNER_FIELDS, 'order': 'id asc'}
+        )
+        for partner in partners:
+            self._add(partner)
+
+    def resolve(self, customers, create_missing=True, chunk_size=None):
+        """
+        Return the partner ID of each customer, creating missing customers.
+
+        Args:
+            customers (list): Customer dicts with name and at least one of
+                ref, email or phone; other keys are passed to create as-is
+            create_missing (bool): Create partners for unmatched customers
+            chunk_size (int): Customers per search and create request
+
+        Returns:
+            list: Partner ID (or None if not found or not created) per customer
+        """
+        chunk_size = chunk_size or BULK_CONFIG['chunk_size']
+        models = get_model_connection(self.config['url'])
+        results = [None] * len(customers)
+
+        with self.lock:
+            for chunk in chunked(list(enumerate(customers)), chunk_size):
+                unresolved = []
+                for position, customer in chunk:
+                    results[position] = self._lookup(customer)
+                    if results[position] is None:
+                        unresolved.append((position, customer))
+                if not unresolved:
+                    continue
+
+                self._search(models, [customer for _, customer in unresolved])
+                missing = []
+                for position, customer in unresolved:
+                    results[position] = self._lookup(customer)
+                    if results[position] is None:
+                        missing.append((position, customer))
+                if not missing or not create_missing:
+                    continue
+
+                # Customers sharing a key in the same chunk become one partner
+                pending = []
+                pending_keys = {}
+                for position, customer in missing:
+                    keys = [(key, normalize_key(key, customer.get(key))) for key in PARTNER_KEYS]
+                    keys = [key for key in keys if key[1]]
+                    match = next((pending_keys[key] for key in keys if key in pending_keys), None)
+                    if match is None:
+                        match = len(pending)
+                        pending.append((customer, []))
+                    pending[match][1].append(position)
+                    for key in keys:
+                        pending_keys.setdefault(key, match)
+
+                flag = _customer_flag(self.uid, self.config, models)
+                vals_list = []
+                for customer, _ in pending:
+                    vals = {k: v for k, v in customer.items() if v not in (None, '')}
+                    vals.setdefault('name', customer.get('email') or customer.get('phone') or customer.get('ref'))
+                    vals.update(flag)
+                    vals_list.append(vals)
+
+                created = create_records(models, self.config, self.uid, 'res.partner', vals_list)
+                for (customer, positions), (partner_id, error) in zip(pending, created):
+                    if error:
+                        print(f"Could not create customer {customer.get('name')}: {error}")
+                        continue
+                    self._add(dict(customer, id=partner_id))
+                    for position in positions:
+                        results[position] = partner_id
+
+        return results
+
+def get_partner_resolver(uid, config):
+    """
+    Return the shared partner resolver, creating it on first use.
+
+    The resolver's index is kept for CACHE_CONFIG['default_ttl'] seconds, after
+    which a fresh one is started so partners changed elsewhere are picked up.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+
+    Returns:
+        PartnerResolver: The resolver
+    """
+    return get_cached(config, 'res.partner.resolver', lambda: PartnerResolver(uid, config))
+
+def resolve_partners(uid, config, customers, create_missing=True):
+    """
+    Map external customers to partner IDs.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        customers (list): Customer dicts, see PartnerResolver.resolve
+        create_missing (bool): Create partners for unmatched customers
+
+    Returns:
+        list: Partner ID or None per customer, or empty list if error
+    """
+    if not uid:
+        return []
+
+    try:
+        return get_partner_resolver(uid, config).resolve(customers, create_missing)
+    except Exception as e:
+        print(f"Error resolving customers: {str(e)}")
+        return []
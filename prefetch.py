@@ -0,0 +1,111 @@
+"""
+Background warming of the data the menu options start with.
+
+While the menu waits for input, a prefetcher thread reads the warehouses,
+the product index, categories, units of measure, the product schema, the
+location tree and the sales module probe into the cache on the background
+request lane. Data older than PREFETCH_CONFIG['refresh_after'] is read
+again after every action and while the menu is idle, so menu options find
+it warm instead of waiting for Odoo. Reloads replace cached values in place:
+a menu action never waits for a refresh it did not ask for.
+"""
+import threading
+from cache import refresh_ahead
+from config import PREFETCH_CONFIG
+from connection import get_model_connection, is_connection_error
+from inventory_operations import load_warehouses
+from location_index import get_location_index
+from product_index import get_product_index
+from product_operations import _load_product_categories, _load_product_uoms, get_product_schema
+from request_scheduler import PRIORITY_BACKGROUND, request_priority
+from sales_operations import check_sales_module_available
+
+# Name: loader taking uid and config; each reads through the cache
+PREFETCH_TARGETS = {
+    'warehouses': lambda uid, config: load_warehouses(uid, config, get_model_connection(config['url'])),
+    'product index': get_product_index,
+    'categories': _load_product_categories,
+    'units of measure': _load_product_uoms,
+    'product schema': get_product_schema,
+    'location index': get_location_index,
+    'sales module': check_sales_module_available,
+}
+
+class Prefetcher(threading.Thread):
+    """
+    Background thread keeping the menu's master data in the cache.
+
+    It warms all targets on start, again whenever it is woken after a menu
+    action, and every PREFETCH_CONFIG['idle_interval'] seconds.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+    """
+
+    def __init__(self, uid, config):
+        super().__init__(name='cache-prefetcher', daemon=True)
+        self.uid = uid
+        self.config = config
+        self.wake = threading.Event()
+        self.stopping = threading.Event()
+        self.errors = {}
+
+    def warm(self):
+        """Load every target that is missing or older than refresh_after."""
+        with request_priority(PRIORITY_BACKGROUND), refresh_ahead(PREFETCH_CONFIG['refresh_after']):
+            for name, loader in PREFETCH_TARGETS.items():
+                if self.stopping.is_set():
+                    return
+                try:
+                    loader(self.uid, self.config)
+                    self.errors.pop(name, None)
+                except Exception as e:
+                    # Menu options report their own errors; stop early while Odoo is unreachable
+                    self.errors[name] = str(e)
+                    if is_connection_error(e):
+                        return
+
+    def run(self):
+        while not self.stopping.is_set():
+            self.wake.clear()
+            self.warm()
+            self.wake.wait(PREFETCH_CONFIG['idle_interval'])
+
+    def stop(self, timeout=10):
+        """Stop the thread after the target it is loading."""
+        self.stopping.set()
+        self.wake.set()
+        self.join(timeout)
+
+_prefetchers = {}
+_prefetchers_lock = threading.Lock()
+
+def start_prefetcher(uid, config):
+    """
+    Start the prefetcher of an Odoo instance (once).
+
+    Returns:
+        Prefetcher: The running prefetcher
+    """
+    instance = (config['url'], config['db_name'])
+    with _prefetchers_lock:
+        prefetcher = _prefetchers.get(instance)
+        if prefetcher is None or not prefetcher.is_alive():
+            prefetcher = _prefetchers[instance] = Prefetcher(uid, config)
+            prefetcher.start()
+    return prefetcher
+
+def wake_prefetcher(config):
+    """Ask the prefetcher of an Odoo instance to refresh stale data now, if running."""
+    with _prefetchers_lock:
+        prefetcher = _prefetchers.get((config['url'], config['db_name']))
+    if prefetcher:
+        prefetcher.wake.set()
+
+def stop_prefetcher(config):
+    """Stop the prefetcher of an Odoo instance, if running."""
+    with _prefetchers_lock:
+        prefetcher = _prefetchers.pop((config['url'], config['db_name']), None)
+    if prefetcher:
+        prefetcher.stop()
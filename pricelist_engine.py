@@ -0,0 +1,358 @@
+"""
+Client-side pricing with Odoo pricelists.
+
+All pricelist items are read once into an index keyed by pricelist and by
+what each rule applies to (variant, template, category, everything), so the
+price of every line of a basket can be computed locally. Later lookups only
+read the items changed since the newest write_date seen.
+"""
+import datetime
+import math
+import threading
+import time
+from cache import get_cached, get_cached_many
+from config import PRICING_CONFIG, REPORT_CONFIG
+from connection import get_model_connection, iter_search_read
+
+PRICELIST_ITEM_FIELDS = [
+    'id', 'pricelist_id', 'applied_on', 'product_id', 'product_tmpl_id', 'categ_id',
+    'min_quantity', 'date_start', 'date_end', 'compute_price', 'fixed_price',
+    'percent_price', 'base', 'base_pricelist_id', 'price_discount', 'price_surcharge',
+    'price_round', 'price_min_margin', 'price_max_margin', 'write_date'
+]
+
+PRODUCT_PRICING_FIELDS = ['id', 'name', 'list_price', 'standard_price', 'categ_id', 'product_tmpl_id']
+
+# Pricelists based on other pricelists are followed at most this deep
+MAX_PRICELIST_DEPTH = 10
+
+def _many2one_id(value):
+    """Return the ID of a many2one value read over XML-RPC, or None."""
+    return value[0] if isinstance(value, (list, tuple)) and value else None
+
+def _item_sort_key(item):
+    """Order in which Odoo tries the items of one pricelist: highest minimum quantity first."""
+    return (-(item.get('min_quantity') or 0), -item['id'])
+
+class PricelistEngine:
+    """
+    Index of pricelist items that computes prices without the server.
+
+    Args:
+        items (list): product.pricelist.item records with PRICELIST_ITEM_FIELDS
+        categories (list): product.category records with id, parent_id and
+            (on Odoo 12+) parent_path, used to apply category rules to
+            products in sub-categories
+    """
+
+    def __init__(self, items, categories):
+        self.items = {}
+        self.index = {}
+        self.category_parents = {}
+        self.last_write_date = None
+        self.refreshed = time.monotonic()
+        self.lock = threading.Lock()
+
+        for category in categories:
+            path = category.get('parent_path')
+            if path:
+                # parent_path is "1/4/9/" for category 9 under 4 under 1
+                self.category_parents[category['id']] = list(reversed(
+                    [int(part) for part in path.strip('/').split('/') if part][:-1]))
+            else:
+                self.category_parents[category['id']] = _many2one_id(category.get('parent_id'))
+
+        self._apply(items)
+
+    def _category_chain(self, category_id):
+        """Return a category followed by its ancestors, nearest first."""
+        parents = self.category_parents.get(category_id)
+        if isinstance(parents, list):
+            return [category_id] + parents
+
+        chain = []
+        while category_id and category_id not in chain:
+            chain.append(category_id)
+            category_id = self.category_parents.get(category_id)
+        return chain
+
+    def _apply(self, items, removed_ids=()):
+        """Add changed items to the index and drop removed ones."""
+        for item_id in removed_ids:
+            self.items.pop(item_id, None)
+        for item in items:
+            self.items[item['id']] = item
+            if item.get('write_date') and (self.last_write_date is None or item['write_date'] > self.last_write_date):
+                self.last_write_date = item['write_date']
+
+        index = {}
+        for item in self.items.values():
+            pricelist_id = _many2one_id(item.get('pricelist_id'))
+            applied_on = item.get('applied_on') or '3_global'
+            if applied_on == '0_product_variant':
+                key = ('product', _many2one_id(item.get('product_id')))
+            elif applied_on == '1_product':
+                key = ('template', _many2one_id(item.get('product_tmpl_id')))
+            elif applied_on == '2_product_category':
+                key = ('category', _many2one_id(item.get('categ_id')))
+            else:
+                key = ('global', None)
+            index.setdefault(pricelist_id, {}).setdefault(key, []).append(item)
+
+        for rules in index.values():
+            for items_for_key in rules.values():
+                items_for_key.sort(key=_item_sort_key)
+        self.index = index
+
+    def refresh(self, uid, config):
+        """
+        Read the items changed since the last refresh.
+
+        Only items with a write_date at or after the newest one seen are read,
+        plus the list of item IDs so that deleted rules are dropped.
+
+        Args:
+            uid (int): User ID for authentication
+            config (dict): Configuration dictionary with Odoo connection parameters
+        """
+        models = get_model_connection(config['url'])
+        with self.lock:
+            current_ids = set(models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'product.pricelist.item', 'search',
+                [[]]
+            ))
+            # write_date has one-second precision, so also re-read items from the last second seen
+            domain = [['write_date', '>=', self.last_write_date]] if self.last_write_date else []
+            changed = []
+            for page in iter_search_read(models, config, uid, 'product.pricelist.item', domain,
+                                         PRICELIST_ITEM_FIELDS, page_size=REPORT_CONFIG['page_size']):
+                changed.extend(page)
+            removed = [item_id for item_id in self.items if item_id not in current_ids]
+            if changed or removed:
+                self._apply(changed, removed)
+            self.refreshed = time.monotonic()
+
+    def _candidates(self, pricelist_id, product):
+        """Items that may apply to a product, in the order Odoo tries them."""
+        rules = self.index.get(pricelist_id, {})
+        keys = [('product', product['id']), ('template', _many2one_id(product.get('product_tmpl_id')))]
+        keys += [('category', categ_id) for categ_id in self._category_chain(_many2one_id(product.get('categ_id')))]
+        keys.append(('global', None))
+        for key in keys:
+            for item in rules.get(key, []):
+                yield item
+
+    def _base_price(self, item, product, quantity, date, depth):
+        """Price an item's computation starts from."""
+        base = item.get('base') or 'list_price'
+        if base == 'pricelist' and _many2one_id(item.get('base_pricelist_id')):
+            return self.price(_many2one_id(item['base_pricelist_id']), product, quantity, date, depth + 1)
+        if base == 'standard_price':
+            return product.get('standard_price') or 0.0
+        return product.get('list_price') or 0.0
+
+    def price(self, pricelist_id, product, quantity=1, date=None, depth=0):
+        """
+        Compute the unit price of a product.
+
+        Follows Odoo's rules: the first matching item wins (variant, then
+        template, then category from the nearest up, then global, highest
+        minimum quantity first) and its fixed, percentage or formula
+        computation is applied. Currency and unit of measure conversions are
+        not applied.
+
+        Args:
+            pricelist_id (int): Pricelist ID, or None for the sales price
+            product (dict): Product with PRODUCT_PRICING_FIELDS
+            quantity (float): Quantity ordered
+            date (str): Order date as 'YYYY-MM-DD' (defaults to today)
+            depth (int): Recursion depth for pricelists based on other pricelists
+
+        Returns:
+            float: Unit price
+        """
+        list_price = product.get('list_price') or 0.0
+        if not pricelist_id or depth > MAX_PRICELIST_DEPTH:
+            return list_price
+
+        date = date or datetime.date.today().strftime('%Y-%m-%d')
+        for item in self._candidates(pricelist_id, product):
+            if (item.get('min_quantity') or 0) > quantity:
+                continue
+            if item.get('date_start') and str(item['date_start'])[:10] > date:
+                continue
+            if item.get('date_end') and str(item['date_end'])[:10] < date:
+                continue
+            return self._compute(item, product, quantity, date, depth)
+        return list_price
+
+    def _compute(self, item, product, quantity, date, depth):
+        """Apply one pricelist item to a product."""
+        compute_price = item.get('compute_price') or 'fixed'
+        if compute_price == 'fixed':
+            return item.get('fixed_price') or 0.0
+
+        base_price = self._base_price(item, product, quantity, date, depth)
+        if compute_price == 'percentage':
+            return base_price - base_price * (item.get('percent_price') or 0.0) / 100
+
+        # Formula: discount, rounding, surcharge, then margins on the base price
+        price = base_price - base_price * (item.get('price_discount') or 0.0) / 100
+        if item.get('price_round'):
+            price = math.floor(price / item['price_round'] + 0.5) * item['price_round']
+        price += item.get('price_surcharge') or 0.0
+        if item.get('price_min_margin'):
+            price = max(price, base_price + item['price_min_margin'])
+        if item.get('price_max_margin'):
+            price = min(price, base_price + item['price_max_margin'])
+        return price
+
+def build_pricelist_engine(uid, config):
+    """
+    Read all pricelist items and product categories into a new engine.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+
+    Returns:
+        PricelistEngine: The engine
+    """
+    models = get_model_connection(config['url'])
+    items = []
+    for page in iter_search_read(models, config, uid, 'product.pricelist.item', [],
+                                 PRICELIST_ITEM_FIELDS, page_size=REPORT_CONFIG['page_size']):
+        items.extend(page)
+
+    try:
+        categories = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'product.category', 'search_read',
+            [[]], {'fields': ['id', 'parent_id', 'parent_path']}
+        )
+    except Exception:
+        # parent_path only exists from Odoo 12 on
+        categories = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'product.category', 'search_read',
+            [[]], {'fields': ['id', 'parent_id']}
+        )
+
+    return PricelistEngine(items, categories)
+
+def get_pricelist_engine(uid, config):
+    """
+    Return the shared pricing engine, refreshing changed items when it is old.
+
+    The engine is built once per Odoo instance; after
+    PRICING_CONFIG['refresh_interval'] seconds the next call reads the items
+    changed since then.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+
+    Returns:
+        PricelistEngine: The engine
+    """
+    engine = get_cached(config, 'product.pricelist.engine',
+                        lambda: build_pricelist_engine(uid, config), ttl=float('inf'))
+    if time.monotonic() - engine.refreshed >= PRICING_CONFIG['refresh_interval']:
+        engine.refresh(uid, config)
+    return engine
+
+def get_pricing_products(uid, config, product_ids):
+    """
+    Read the fields needed for pricing, cached per product.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        product_ids (list): Product IDs
+
+    Returns:
+        dict: {product_id: product record}
+    """
+    def load(missing):
+        models = get_model_connection(config['url'])
+        products = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'product.product', 'read',
+            [missing], {'fields': PRODUCT_PRICING_FIELDS}
+        )
+        return {product['id']: product for product in products}
+
+    return get_cached_many(config, 'product.pricing', list(dict.fromkeys(product_ids)), load,
+                           ttl=PRICING_CONFIG['product_ttl'])
+
+def get_partner_pricelist(uid, config, partner_id):
+    """
+    Return the pricelist of a customer, or None.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        partner_id (int): Customer ID
+
+    Returns:
+        int or None: Pricelist ID
+    """
+    def load(missing):
+        models = get_model_connection(config['url'])
+        partners = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'res.partner', 'read',
+            [missing], {'fields': ['property_product_pricelist']}
+        )
+        return {partner['id']: _many2one_id(partner.get('property_product_pricelist')) for partner in partners}
+
+    if not partner_id:
+        return None
+    return get_cached_many(config, 'res.partner.pricelist', [partner_id], load,
+                           ttl=PRICING_CONFIG['product_ttl']).get(partner_id)
+
+def quote_basket(uid, config, basket, partner_id=None, pricelist_id=None, date=None):
+    """
+    Price every line of a basket locally.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        basket (list): List of (product_id, quantity) tuples
+        partner_id (int): Customer whose pricelist applies
+        pricelist_id (int): Pricelist to use instead of the customer's
+        date (str): Order date as 'YYYY-MM-DD' (defaults to today)
+
+    Returns:
+        dict: 'pricelist_id', 'lines' (product_id, name, quantity, price_unit,
+            subtotal per basket line) and 'total', or None if error
+    """
+    try:
+        pricelist_id = pricelist_id or get_partner_pricelist(uid, config, partner_id)
+        engine = get_pricelist_engine(uid, config)
+        products = get_pricing_products(uid, config, [product_id for product_id, _ in basket])
+
+        lines = []
+        for product_id, quantity in basket:
+            product = products.get(product_id)
+            if not product:
+                print(f"Product with ID {product_id} not found")
+                return None
+            price_unit = engine.price(pricelist_id, product, quantity, date)
+            lines.append({
+                'product_id': product_id,
+                'name': product['name'],
+                'quantity': quantity,
+                'price_unit': price_unit,
+                'subtotal': price_unit * quantity,
+            })
+
+        return {
+            'pricelist_id': pricelist_id,
+            'lines': lines,
+            'total': sum(line['subtotal'] for line in lines),
+        }
+    except Exception as e:
+        print(f"Error quoting basket: {str(e)}")
+        return None
@@ -0,0 +1,305 @@
+"""
+Local search index of the product catalog.
+
+The index is built from one paged read of all products and then kept up to
+date with incremental refreshes that only read products changed since the
+newest write_date seen. Names and prices live on product.template, so a
+product's write_date is taken as the newer of its own and its template's.
+The product list is kept in the shared cache, so a new process starts from
+it and only reads what changed since. Searches run locally: code and name
+prefixes, words appearing anywhere in the name, and trigram similarity for
+typos, so a picker can show matches while the user types without asking Odoo.
+"""
+import bisect
+import threading
+import time
+from cache import get_cached, invalidate, set_cached
+from config import PRODUCT_INDEX_CONFIG, REPORT_CONFIG
+from connection import get_model_connection, iter_search_read
+from shared_cache import load_shared, store_shared
+
+PRODUCT_INDEX_FIELDS = ['id', 'name', 'default_code', 'list_price', 'active', 'write_date', 'product_tmpl_id']
+
+# Name of the product list in the shared cache
+SHARED_PRODUCTS_KEY = 'product.product.index.products'
+
+# Share of a query's trigrams a product must contain to count as a fuzzy match
+FUZZY_THRESHOLD = 0.4
+
+def _normalize(text):
+    """Lower-case text with single spaces, the form names and codes are indexed in."""
+    return ' '.join(str(text or '').lower().split())
+
+def _trigrams(text):
+    """Three-character substrings of a text, padded so word starts count too."""
+    padded = f"  {text} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+def _read_products(uid, config, models, domain):
+    """
+    Read products in pages, dating each by the newer write_date of product and template.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        models: Model connection
+        domain (list): Search domain
+
+    Returns:
+        list: Product records with PRODUCT_INDEX_FIELDS
+    """
+    products = []
+    for page in iter_search_read(models, config, uid, 'product.product', domain, PRODUCT_INDEX_FIELDS,
+                                 page_size=REPORT_CONFIG['page_size']):
+        template_ids = sorted({product['product_tmpl_id'][0] for product in page if product.get('product_tmpl_id')})
+        template_dates = {}
+        if template_ids:
+            template_dates = {template['id']: template['write_date'] for template in models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'product.template', 'read',
+                [template_ids], {'fields': ['write_date'], 'context': {'active_test': False}}
+            )}
+        for product in page:
+            template_date = template_dates.get(product['product_tmpl_id'][0]) if product.get('product_tmpl_id') else None
+            if template_date and (not product.get('write_date') or template_date > product['write_date']):
+                product['write_date'] = template_date
+        products.extend(page)
+    return products
+
+class _IndexState:
+    """The search structures of a ProductIndex, replaced as a whole when products change."""
+
+    def __init__(self, products, texts, trigrams, prefix_keys):
+        self.products = products
+        self.texts = texts
+        self.trigrams = trigrams
+        self.prefix_keys = prefix_keys
+
+class ProductIndex:
+    """
+    Search index over product names and internal references.
+
+    Updates build a new state and swap it in, so searches in other threads
+    never see structures being changed and need no lock.
+
+    Args:
+        products (list): Product records with PRODUCT_INDEX_FIELDS
+    """
+
+    def __init__(self, products):
+        self.state = _IndexState({}, {}, {}, [])
+        self.last_write_date = None
+        self.lock = threading.Lock()
+        self._apply(products, [])
+
+    @property
+    def products(self):
+        """Indexed products by ID."""
+        return self.state.products
+
+    def _apply(self, changed, removed):
+        """Swap in a state with changed products updated and removed ones dropped."""
+        state = self.state
+        products = dict(state.products)
+        texts = dict(state.texts)
+        trigrams = dict(state.trigrams)
+        # Trigram sets are shared with the current state until they are copied for a change
+        copied = set()
+
+        def ids_of(trigram):
+            if trigram not in copied:
+                trigrams[trigram] = set(trigrams.get(trigram, ()))
+                copied.add(trigram)
+            return trigrams[trigram]
+
+        def remove(product_id):
+            products.pop(product_id, None)
+            text = texts.pop(product_id, None)
+            for trigram in _trigrams(text) if text else ():
+                if trigram in trigrams:
+                    ids = ids_of(trigram)
+                    ids.discard(product_id)
+                    if not ids:
+                        del trigrams[trigram]
+                        copied.discard(trigram)
+
+        for product_id in removed:
+            remove(product_id)
+        for product in changed:
+            remove(product['id'])
+            if product.get('active', True):
+                text = _normalize(f"{product.get('default_code') or ''} {product['name']}")
+                products[product['id']] = product
+                texts[product['id']] = text
+                for trigram in _trigrams(text):
+                    ids_of(trigram).add(product['id'])
+            if product.get('write_date') and (not self.last_write_date or product['write_date'] > self.last_write_date):
+                self.last_write_date = product['write_date']
+
+        # Sorted (key, rank, product ID) entries for prefix lookups: code, full name, each word of the name
+        keys = []
+        for product_id, product in products.items():
+            code = _normalize(product.get('default_code'))
+            name = _normalize(product['name'])
+            if code:
+                keys.append((code, 0, product_id))
+            keys.append((name, 1, product_id))
+            keys.extend((word, 2, product_id) for word in name.split()[1:])
+        keys.sort()
+        self.state = _IndexState(products, texts, trigrams, keys)
+
+    def refresh(self, uid, config):
+        """
+        Read the products changed since the last refresh.
+
+        Products whose own or template write_date is at or after the newest
+        one seen are read, archived ones included so they can be dropped. Deleted products are
+        only looked for when the number of products in Odoo no longer matches
+        the index. Changes are written back to the shared cache.
+
+        Args:
+            uid (int): User ID for authentication
+            config (dict): Configuration dictionary with Odoo connection parameters
+        """
+        models = get_model_connection(config['url'])
+        with self.lock:
+            # write_date has one-second precision, so also re-read products from the last second seen
+            # Editing a product in the standard form only changes its template
+            domain = ['|', ['write_date', '>=', self.last_write_date],
+                      ['product_tmpl_id.write_date', '>=', self.last_write_date]] if self.last_write_date else []
+            changed = _read_products(uid, config, models,
+                                     domain + ['|', ['active', '=', True], ['active', '=', False]])
+            # Products from the last second seen are read again every time; only real changes count
+            changed = [product for product in changed
+                       if (self.products.get(product['id']) != product if product.get('active', True)
+                           else product['id'] in self.products)]
+            if changed:
+                self._apply(changed, [])
+            removed = []
+
+            count = models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'product.product', 'search_count',
+                [[]]
+            )
+            if count != len(self.products):
+                current_ids = set(models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    'product.product', 'search',
+                    [[]]
+                ))
+                removed = [product_id for product_id in self.products if product_id not in current_ids]
+                if removed:
+                    self._apply([], removed)
+
+            if changed or removed:
+                store_shared(config, SHARED_PRODUCTS_KEY, list(self.products.values()))
+
+    def search(self, query, limit=10):
+        """
+        Find products matching a query, best matches first.
+
+        An exact internal reference ranks first, then code and name prefixes,
+        then products containing every word of the query, then products
+        similar enough to catch typos.
+
+        Args:
+            query (str): Part of a name or internal reference
+            limit (int): Maximum number of products to return
+
+        Returns:
+            list: Product dicts with PRODUCT_INDEX_FIELDS
+        """
+        query = _normalize(query)
+        if not query:
+            return []
+
+        # Updates swap in a new state, so one consistent state is read here
+        state = self.state
+        scores = {}
+
+        def score(product_id, value):
+            if value > scores.get(product_id, 0):
+                scores[product_id] = value
+
+        position = bisect.bisect_left(state.prefix_keys, (query,))
+        while position < len(state.prefix_keys) and state.prefix_keys[position][0].startswith(query):
+            key, rank, product_id = state.prefix_keys[position]
+            score(product_id, 6 if rank == 0 and key == query else 5 - rank)
+            position += 1
+
+        query_trigrams = _trigrams(query)
+        if len(query) >= 3:
+            shared = {}
+            for trigram in query_trigrams:
+                for product_id in state.trigrams.get(trigram, ()):
+                    shared[product_id] = shared.get(product_id, 0) + 1
+            words = query.split()
+            for product_id, count in shared.items():
+                similarity = count / len(query_trigrams)
+                if all(word in state.texts[product_id] for word in words):
+                    score(product_id, 2 + similarity)
+                elif similarity >= FUZZY_THRESHOLD:
+                    score(product_id, similarity)
+
+        ranked = sorted(scores, key=lambda product_id: (-scores[product_id],
+                                                         _normalize(state.products[product_id]['name'])))
+        return [state.products[product_id] for product_id in ranked[:limit]]
+
+def build_product_index(uid, config):
+    """
+    Build the search index from the shared product list, or from all products.
+
+    A product list taken from the shared cache that is older than
+    PRODUCT_INDEX_CONFIG['refresh_interval'] is brought up to date with an
+    incremental refresh.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+
+    Returns:
+        ProductIndex: The index
+    """
+    def read_products():
+        return _read_products(uid, config, get_model_connection(config['url']), [])
+
+    products, age = load_shared(config, SHARED_PRODUCTS_KEY, read_products, ttl=float('inf'))
+    index = ProductIndex(products)
+    if age >= PRODUCT_INDEX_CONFIG['refresh_interval']:
+        index.refresh(uid, config)
+    return index
+
+def get_product_index(uid, config):
+    """
+    Return the shared product index, reading changed products when it is old.
+
+    The index is built once per Odoo instance; after
+    PRODUCT_INDEX_CONFIG['refresh_interval'] seconds, or after products were
+    created or changed through this tool, the next call reads the products
+    changed since then.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+
+    Returns:
+        ProductIndex or None: The index, or None if it could not be built
+    """
+    def load():
+        index = build_product_index(uid, config)
+        set_cached(config, 'product.product.index.checked', time.time())
+        return index
+
+    try:
+        index = get_cached(config, 'product.product.index', load, ttl=float('inf'))
+        get_cached(config, 'product.product.index.checked', lambda: index.refresh(uid, config) or time.time(),
+                   ttl=PRODUCT_INDEX_CONFIG['refresh_interval'])
+        return index
+    except Exception as e:
+        print(f"Error loading the product index: {str(e)}")
+        return None
+
+def expire_product_index(config):
+    """Make the next get_product_index() call read changed products."""
+    invalidate(config, 'product.product.index.checked')
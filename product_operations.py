@@ -3,7 +3,22 @@ Functions for managing products in Odoo.
 """
 import json
 from pprint import pprint
+from cache import get_cached
+from config import BULK_CONFIG
 from connection import get_model_connection
+from product_index import expire_product_index
+from shared_cache import model_validator, schema_validator
+from cache_validation import get_model_slice
+from bulk_operations import (
+    AdaptiveBatchSizer,
+    JobCheckpoint,
+    chunked,
+    create_records,
+    iter_file_records,
+    run_checkpointed_job,
+    write_grouped
+)
+from report_output import ConsoleTableSink, ReportColumn
 
 def get_product_categories(uid, config):
     """
@@ -20,15 +35,7 @@ def get_product_categories(uid, config):
         return []
     
     try:
-        models = get_model_connection(config['url'])
-        
-        # Get product categories
-        categories = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'product.category', 'search_read',
-            [[]],
-            {'fields': ['id', 'name', 'complete_name']}
-        )
+        categories = _load_product_categories(uid, config)
         
         print("\nAvailable product categories:")
         for cat in categories:
@@ -54,15 +61,7 @@ def get_product_uoms(uid, config):
         return []
     
     try:
-        models = get_model_connection(config['url'])
-        
-        # Get units of measure - only request id and name fields which should exist in all versions
-        uoms = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'uom.uom', 'search_read',
-            [[]],
-            {'fields': ['id', 'name']}
-        )
+        uoms = _load_product_uoms(uid, config)
         
         print("\nAvailable units of measure:")
         for uom in uoms:
@@ -71,29 +70,108 @@ def get_product_uoms(uid, config):
         return uoms
     except Exception as e:
         print(f"Error getting units of measure: {str(e)}")
+        # Return a default UOM if we can't get the actual ones
+        print("\nUsing default unit of measure (Units)")
+        return [{'id': 1, 'name': 'Units'}]
+
+def _load_product_categories(uid, config):
+    """Read all product categories, cached per Odoo instance."""
+    def load():
+        models = get_model_connection(config['url'])
+        return models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'product.category', 'search_read',
+            [[]],
+            {'fields': ['id', 'name', 'complete_name']}
+        )
+    
+    return get_cached(config, 'product.category', load, shared=True,
+                      validator=model_validator(uid, config, 'product.category'))
+
+def _load_product_uoms(uid, config):
+    """Read all units of measure, cached per Odoo instance."""
+    def load():
+        models = get_model_connection(config['url'])
         
-        # Try with older model name
+        # Only request id and name fields which should exist in all versions
         try:
-            models = get_model_connection(config['url'])
-            
+            return models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'uom.uom', 'search_read',
+                [[]],
+                {'fields': ['id', 'name']}
+            )
+        except Exception as e:
+            print(f"Could not read uom.uom ({str(e)}), trying legacy model product.uom")
             # In older Odoo versions, the model might be called 'product.uom'
-            uoms = models.execute_kw(
+            return models.execute_kw(
                 config['db_name'], uid, config['password'],
                 'product.uom', 'search_read',
                 [[]],
                 {'fields': ['id', 'name']}
             )
-            
-            print("\nAvailable units of measure (using legacy API):")
-            for uom in uoms:
-                print(f"  - ID: {uom['id']}, Name: {uom['name']}")
-            
-            return uoms
-        except Exception as e2:
-            print(f"Error getting units of measure (legacy API): {str(e2)}")
-            # Return a default UOM if we can't get the actual ones
-            print("\nUsing default unit of measure (Units)")
-            return [{'id': 1, 'name': 'Units'}]
+    
+    return get_cached(config, 'uom.uom', load, shared=True, validator=model_validator(uid, config, 'uom.uom'))
+
+def get_product_schema(uid, config):
+    """
+    Get the field definitions of product.product, cached per Odoo instance.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        
+    Returns:
+        dict: Field definitions as returned by fields_get
+    """
+    def load():
+        models = get_model_connection(config['url'])
+        return models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'product.product', 'fields_get',
+            [], {'attributes': ['string', 'help', 'type', 'selection', 'required']}
+        )
+    
+    return get_cached(config, 'product.product.fields', load, shared=True,
+                      validator=schema_validator(uid, config, 'product.product'))
+
+def _default_category_id(categories):
+    """Pick the category for liquor products, falling back to the first one."""
+    category_names = ['Goods', 'Beverages', 'Alcoholic Beverages', 'Liquor']
+    
+    for cat in categories:
+        name = cat['name']
+        if any(cat_name in name for cat_name in category_names):
+            return cat['id']
+    
+    return categories[0]['id'] if categories else None
+
+def _default_uom_id(uoms):
+    """Pick the unit of measure for bottles or units, falling back to the first one."""
+    for uom in uoms:
+        if uom['name'] in ['Units', 'Unit(s)', 'Bottles', 'Bottle(s)']:
+            return uom['id']
+    
+    return uoms[0]['id'] if uoms else None
+
+def _stockable_product_type(type_field):
+    """
+    Pick the stockable product type from the 'type' field definition.
+    
+    Args:
+        type_field (dict): fields_get definition of the 'type' field
+        
+    Returns:
+        str: The selection value to use for new products
+    """
+    selection = (type_field or {}).get('selection') or []
+    
+    for option in selection:
+        if option[0] in ['product', 'stockable']:
+            return option[0]
+    
+    # If no stockable option found, use the first option, otherwise 'product' which is common
+    return selection[0][0] if selection else 'product'
 
 def inspect_existing_products(uid, config):
     """
@@ -111,15 +189,12 @@ def inspect_existing_products(uid, config):
     
     try:
         print("\n--- INSPECTING EXISTING PRODUCTS ---")
-        models = get_model_connection(config['url'])
         
-        # Get all products
-        products = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'product.product', 'search_read',
-            [[]],
-            {'fields': ['id', 'name', 'default_code', 'type', 'categ_id', 'list_price', 'standard_price']}
-        )
+        # Get all products; a repeated listing only reads what changed
+        products = get_model_slice(
+            uid, config, 'product.product.listing', 'product.product',
+            fields=['id', 'name', 'default_code', 'type', 'categ_id', 'list_price', 'standard_price']
+        ).as_list()
         
         if not products:
             print("No products found in the system.")
@@ -228,29 +303,11 @@ def create_liquor_product(uid, config):
         categories = get_product_categories(uid, config)
         
         # Look for a category related to beverages or goods
-        category_names = ['Goods', 'Beverages', 'Alcoholic Beverages', 'Liquor']
-        category_id = None
-        
-        for cat in categories:
-            name = cat['name']
-            if any(cat_name in name for cat_name in category_names):
-                category_id = cat['id']
-                break
-        
-        if not category_id and categories:
-            category_id = categories[0]['id']  # Default to first category if no match
+        category_id = _default_category_id(categories)
         
         # Get UOM
         uoms = get_product_uoms(uid, config)
-        uom_id = None
-        
-        for uom in uoms:
-            if uom['name'] in ['Units', 'Unit(s)', 'Bottles', 'Bottle(s)']:
-                uom_id = uom['id']
-                break
-        
-        if not uom_id and uoms:
-            uom_id = uoms[0]['id']  # Default to first UOM if no match
+        uom_id = _default_uom_id(uoms)
         
         # Prepare product values
         product_name = input("Enter liquor product name (or press Enter for 'Premium Whiskey'): ") or "Premium Whiskey"
@@ -273,68 +330,23 @@ def create_liquor_product(uid, config):
             'standard_price': cost_price,
         }
         
-        # Try to add type field - this may vary between Odoo versions
+        # Fields vary between Odoo versions, so check them against the cached schema
         try:
-            # Check if 'type' is a valid field and get its options
-            field_info = models.execute_kw(
-                config['db_name'], uid, config['password'],
-                'product.product', 'fields_get',
-                [['type']], {'attributes': ['type', 'selection']}
-            )
-            
-            if 'type' in field_info and field_info['type'].get('selection'):
-                # Find the stockable product option
-                for option in field_info['type']['selection']:
-                    if option[0] in ['product', 'stockable']:
-                        product_vals['type'] = option[0]
-                        break
-                
-                # If no stockable option found, use the first option
-                if 'type' not in product_vals and field_info['type']['selection']:
-                    product_vals['type'] = field_info['type']['selection'][0][0]
-            else:
-                # Default to 'product' which is common
-                product_vals['type'] = 'product'
+            fields = get_product_schema(uid, config)
         except Exception as e:
-            print(f"Warning: Could not determine product type options: {str(e)}")
-            # Use default type
-            product_vals['type'] = 'product'
+            print(f"Warning: Could not read product fields: {str(e)}")
+            fields = {}
         
-        # Try to add sale_ok and purchase_ok
-        try:
-            field_info = models.execute_kw(
-                config['db_name'], uid, config['password'],
-                'product.product', 'fields_get',
-                [['sale_ok', 'purchase_ok']], {'attributes': ['type']}
-            )
-            
-            if 'sale_ok' in field_info:
-                product_vals['sale_ok'] = True
-            
-            if 'purchase_ok' in field_info:
-                product_vals['purchase_ok'] = True
-        except Exception:
-            # These fields may not exist in all versions, so ignore errors
-            pass
+        product_vals['type'] = _stockable_product_type(fields.get('type'))
+        
+        for field in ('sale_ok', 'purchase_ok'):
+            if field in fields:
+                product_vals[field] = True
         
-        # Add UOM if available
         if uom_id:
-            # Check if uom_id and uom_po_id fields exist
-            try:
-                field_info = models.execute_kw(
-                    config['db_name'], uid, config['password'],
-                    'product.product', 'fields_get',
-                    [['uom_id', 'uom_po_id']], {'attributes': ['type']}
-                )
-                
-                if 'uom_id' in field_info:
-                    product_vals['uom_id'] = uom_id
-                
-                if 'uom_po_id' in field_info:
-                    product_vals['uom_po_id'] = uom_id
-            except Exception:
-                # These fields may not exist in all versions, so ignore errors
-                pass
+            for field in ('uom_id', 'uom_po_id'):
+                if field in fields:
+                    product_vals[field] = uom_id
         
         print("\nAttempting to create liquor product with values:")
         print(json.dumps(product_vals, indent=2))
@@ -347,6 +359,7 @@ def create_liquor_product(uid, config):
             )
             
             print(f"\nSuccess! Created liquor product with ID: {product_id}")
+            expire_product_index(config)
             
             # Get the created product
             created_product = models.execute_kw(
@@ -367,4 +380,331 @@ def create_liquor_product(uid, config):
         
     except Exception as e:
         print(f"Error in create_liquor_product: {str(e)}")
-        return None
\ No newline at end of file
+        return None
+
+# Columns accepted by the product import, with the aliases used in our catalog exports
+PRODUCT_IMPORT_FIELDS = {
+    'name': str,
+    'default_code': str,
+    'barcode': str,
+    'type': str,
+    'list_price': float,
+    'standard_price': float,
+    'sale_ok': bool,
+    'purchase_ok': bool,
+}
+
+PRODUCT_IMPORT_ALIASES = {
+    'code': 'default_code',
+    'product_code': 'default_code',
+    'sales_price': 'list_price',
+    'price': 'list_price',
+    'cost_price': 'standard_price',
+    'cost': 'standard_price',
+}
+
+PRODUCT_IMPORT_COLUMNS = [
+    ReportColumn('row', 'Row', 8),
+    ReportColumn('default_code', 'Code', 20),
+    ReportColumn('status', 'Status', 10),
+    ReportColumn('id', 'Product ID', 12),
+    ReportColumn('error', 'Error', 40),
+]
+
+def _to_bool(value):
+    """Convert a CSV/JSON value to a boolean."""
+    if isinstance(value, bool):
+        return value
+    return str(value).strip().lower() in ('1', 'true', 'yes', 'y')
+
+def _product_import_lookups(uid, config):
+    """
+    Build the name lookups used to resolve categories and UoMs in import rows.
+    
+    Both lists come from the cache, so repeated imports in one session do not
+    read them again.
+    """
+    categories = _load_product_categories(uid, config)
+    category_ids = {}
+    for cat in categories:
+        category_ids[cat['name'].lower()] = cat['id']
+        if cat.get('complete_name'):
+            category_ids[cat['complete_name'].lower()] = cat['id']
+    
+    try:
+        uoms = _load_product_uoms(uid, config)
+    except Exception as e:
+        print(f"Error getting units of measure: {str(e)}")
+        uoms = []
+    
+    schema = get_product_schema(uid, config)
+    
+    return {
+        'categories': category_ids,
+        'uoms': {uom['name'].lower(): uom['id'] for uom in uoms},
+        'default_category_id': _default_category_id(categories),
+        'default_uom_id': _default_uom_id(uoms),
+        'default_type': _stockable_product_type(schema.get('type')),
+        'fields': set(schema),
+    }
+
+def _product_vals_from_record(record, lookups):
+    """
+    Convert an import record into product.product values.
+    
+    Args:
+        record (dict): One row from the import file
+        lookups (dict): Lookups from _product_import_lookups
+        
+    Returns:
+        tuple: (values dict, error message or None)
+    """
+    vals = {}
+    
+    for key, value in record.items():
+        field = PRODUCT_IMPORT_ALIASES.get(key, key)
+        converter = PRODUCT_IMPORT_FIELDS.get(field)
+        if converter is None or value is None:
+            continue
+        try:
+            vals[field] = _to_bool(value) if converter is bool else converter(value)
+        except (TypeError, ValueError):
+            return None, f"Invalid value for {field}: {value!r}"
+    
+    if not vals.get('default_code'):
+        return None, "Missing default_code"
+    vals['default_code'] = vals['default_code'].strip()
+    
+    category = record.get('category') or record.get('categ_id')
+    if category:
+        category_id = lookups['categories'].get(str(category).lower())
+        if not category_id:
+            return None, f"Unknown category: {category}"
+        vals['categ_id'] = category_id
+    
+    uom = record.get('uom') or record.get('uom_id')
+    if uom:
+        uom_id = lookups['uoms'].get(str(uom).lower())
+        if not uom_id:
+            return None, f"Unknown unit of measure: {uom}"
+        vals['uom_id'] = uom_id
+        if 'uom_po_id' in lookups['fields']:
+            vals['uom_po_id'] = uom_id
+    
+    # Skip fields this Odoo version does not have, e.g. sale_ok without the Sales app
+    vals = {field: value for field, value in vals.items() if field in lookups['fields']}
+    
+    return vals, None
+
+def _values_differ(current, new):
+    """Compare a value read from Odoo with a value we are about to write."""
+    if isinstance(current, (list, tuple)) and current:
+        current = current[0]  # many2one read as [id, name]
+    if isinstance(new, float) or isinstance(current, float):
+        try:
+            return abs(float(current or 0) - float(new or 0)) > 1e-6
+        except (TypeError, ValueError):
+            return True
+    return (current or False) != (new or False)
+
+def _upsert_product_chunk(uid, config, models, rows, lookups):
+    """
+    Create or update the products of one import chunk.
+    
+    Existing products are found with a single default_code search. Rows that
+    change nothing are skipped, new products are sent in one multi-record
+    create and changes go out as grouped writes, so a chunk costs a handful of
+    requests and re-running the same file is a no-op.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        models (ModelConnection): Connection for model operations
+        rows (list): List of (row number, record) tuples
+        lookups (dict): Lookups from _product_import_lookups
+        
+    Returns:
+        list: One result dict per row, in row order
+    """
+    results = {}
+    prepared = []
+    
+    for row_number, record in rows:
+        vals, error = _product_vals_from_record(record, lookups)
+        if error:
+            code = record.get('default_code') or record.get('code') or record.get('product_code') or ''
+            results[row_number] = {'row': row_number, 'default_code': code,
+                                   'status': 'failed', 'id': None, 'error': error}
+        else:
+            prepared.append((row_number, vals))
+    
+    codes = list({vals['default_code'] for _, vals in prepared})
+    read_fields = sorted({field for _, vals in prepared for field in vals} | {'default_code'})
+    
+    existing = {}
+    if codes:
+        found = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'product.product', 'search_read',
+            [[['default_code', 'in', codes]]],
+            {'fields': read_fields, 'order': 'id asc'}
+        )
+        for product in found:
+            # default_code is not unique in Odoo; the oldest product wins
+            existing.setdefault(product['default_code'], product)
+    
+    to_create = {}   # default_code -> merged values of all rows with that code
+    create_rows = {}  # default_code -> row numbers
+    updates = {}     # product id -> changed values
+    update_rows = {}  # product id -> (row number, default_code) tuples
+    
+    for row_number, vals in prepared:
+        code = vals['default_code']
+        product = existing.get(code)
+        
+        if product is None:
+            merged = to_create.setdefault(code, {})
+            merged.update(vals)
+            create_rows.setdefault(code, []).append(row_number)
+            continue
+        
+        changes = {field: value for field, value in vals.items() if _values_differ(product.get(field), value)}
+        if changes:
+            updates.setdefault(product['id'], {}).update(changes)
+            update_rows.setdefault(product['id'], []).append((row_number, code))
+        else:
+            results[row_number] = {'row': row_number, 'default_code': code,
+                                   'status': 'unchanged', 'id': product['id'], 'error': None}
+    
+    # Create new products in one call
+    create_codes = []
+    create_vals = []
+    for code, vals in to_create.items():
+        if not vals.get('name'):
+            for row_number in create_rows[code]:
+                results[row_number] = {'row': row_number, 'default_code': code,
+                                       'status': 'failed', 'id': None, 'error': "Missing name for new product"}
+            continue
+        vals.setdefault('categ_id', lookups['default_category_id'])
+        vals.setdefault('type', lookups['default_type'])
+        if lookups['default_uom_id'] and 'uom_id' not in vals:
+            vals['uom_id'] = lookups['default_uom_id']
+            if 'uom_po_id' in lookups['fields']:
+                vals['uom_po_id'] = lookups['default_uom_id']
+        create_codes.append(code)
+        create_vals.append({field: value for field, value in vals.items() if value is not None})
+    
+    for code, (product_id, error) in zip(create_codes, create_records(models, config, uid, 'product.product', create_vals)):
+        for row_number in create_rows[code]:
+            results[row_number] = {'row': row_number, 'default_code': code,
+                                   'status': 'failed' if error else 'created', 'id': product_id, 'error': error}
+    
+    # Update changed products with grouped writes
+    write_errors = write_grouped(models, config, uid, 'product.product', updates)
+    if create_vals or updates:
+        expire_product_index(config)
+    for product_id, row_numbers in update_rows.items():
+        error = write_errors.get(product_id)
+        for row_number, code in row_numbers:
+            results[row_number] = {'row': row_number, 'default_code': code,
+                                   'status': 'failed' if error else 'updated', 'id': product_id, 'error': error}
+    
+    return [results[row_number] for row_number, _ in rows]
+
+def import_products_from_file(uid, config, path, sink=None, chunk_size=None, restart=False):
+    """
+    Create or update products from a CSV or JSON Lines file, keyed by default_code.
+    
+    The file is streamed in chunks; each chunk resolves its existing products
+    with one search and is sent as one multi-record create plus grouped writes.
+    Progress is checkpointed after every chunk, so an interrupted import
+    resumes after the last committed chunk when it is run again.
+    A per-row result (created, updated, unchanged or failed) is written to the sink.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        path (str): Path to a .csv or .jsonl file
+        sink (object): Report sink for the per-row results (defaults to console table)
+        chunk_size (int): Rows in the first chunk; later chunks adapt to the
+            observed latency (defaults to the checkpointed or configured size)
+        restart (bool): Ignore an existing checkpoint and start from the first row
+        
+    Returns:
+        dict: Number of rows per status
+    """
+    summary = {'created': 0, 'updated': 0, 'unchanged': 0, 'failed': 0}
+    
+    if not uid:
+        return summary
+    
+    sink = sink or ConsoleTableSink()
+    checkpoint = None
+    
+    try:
+        print(f"\n--- IMPORTING PRODUCTS FROM {path} ---")
+        models = get_model_connection(config['url'])
+        lookups = _product_import_lookups(uid, config)
+        
+        checkpoint = JobCheckpoint('product_import', path)
+        if checkpoint.stale:
+            print("The file changed since the last run; starting from the first row.")
+        # The upsert is idempotent, so a finished import simply runs again
+        if restart or checkpoint.stale or checkpoint.completed:
+            checkpoint.reset()
+        
+        def process_chunk(rows):
+            results = _upsert_product_chunk(uid, config, models, rows, lookups)
+            for result in results:
+                result['key'] = result['default_code']
+            return results
+        
+        sink.begin_section('product_import', "Product Import Results", PRODUCT_IMPORT_COLUMNS, rule_width=100)
+        
+        sizer = AdaptiveBatchSizer(initial=chunk_size or checkpoint.chunk_size)
+        
+        summary.update(run_checkpointed_job(checkpoint, iter_file_records(path), process_chunk,
+                                            sizer, on_result=sink.write_row, on_chunk=sink.flush))
+        sink.end_section()
+    except Exception as e:
+        print(f"Error importing products: {str(e)}")
+        if checkpoint and checkpoint.rows_done:
+            print(f"Rows up to {checkpoint.rows_done} are committed. Run the import again to resume.")
+        summary.update(checkpoint.summary if checkpoint else {})
+    finally:
+        sink.close()
+    
+    print(f"\nImport summary: {summary['created']} created, {summary['updated']} updated, "
+          f"{summary['unchanged']} unchanged, {summary['failed']} failed")
+    return summary
+
+def upsert_products(uid, config, records, chunk_size=None):
+    """
+    Create or update products given as dictionaries, keyed by default_code.
+    
+    Works like import_products_from_file for records that are already in
+    memory, without a checkpoint.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        records (list): Product dictionaries with the columns of an import file
+        chunk_size (int): Records per create/write batch
+        
+    Returns:
+        list: One result dict (row, default_code, status, id, error) per record,
+            or empty list if error
+    """
+    if not uid:
+        return []
+    
+    try:
+        models = get_model_connection(config['url'])
+        lookups = _product_import_lookups(uid, config)
+        results = []
+        for rows in chunked(list(enumerate(records, start=1)), chunk_size or BULK_CONFIG['chunk_size']):
+            results.extend(_upsert_product_chunk(uid, config, models, rows, lookups))
+        return results
+    except Exception as e:
+        print(f"Error creating products: {str(e)}")
+        return []
@@ -0,0 +1,194 @@
+"""
+Client-side CPU and memory profiling of menu actions and job steps.
+
+Started with --profile, every menu action and job step runs under:
+
+- cProfile, for exact per-function call counts and times in the thread
+  running the action;
+- a stack sampler, which records the Python stacks of all threads every
+  PROFILE_CONFIG['sample_interval'] seconds. This also covers work done in
+  helper threads, such as unmarshalling responses of hedged reads;
+- tracemalloc, comparing snapshots taken before and after the action to
+  find the lines that allocated the memory still held, plus the peak.
+
+Each profiled action writes three files to PROFILE_CONFIG['output_dir']:
+NAME.pstats (load with pstats or snakeviz), NAME.collapsed (one
+"frame;frame;frame count" line per stack, the input of flamegraph.pl,
+speedscope or inferno) and NAME.txt (top functions and allocators).
+"""
+import contextlib
+import cProfile
+import io
+import os
+import pstats
+import re
+import sys
+import threading
+import time
+import tracemalloc
+from config import PROFILE_CONFIG
+
+# Innermost frames of threads that are waiting for work, left out of the samples
+IDLE_FRAMES = {
+    ('threading.py', 'wait'),
+    ('thread.py', '_worker'),
+    ('queue.py', 'get'),
+    ('selectors.py', 'select'),
+}
+
+_enabled = False
+_sequence = 0
+_sequence_lock = threading.Lock()
+# cProfile can only follow one action at a time; concurrent job steps are still sampled
+_cprofile_lock = threading.Lock()
+
+def enable_profiling(output_dir=None):
+    """
+    Turn on profiling of actions wrapped in profile_action().
+
+    Args:
+        output_dir (str): Where profile files are written (defaults to PROFILE_CONFIG['output_dir'])
+    """
+    global _enabled
+    if output_dir:
+        PROFILE_CONFIG['output_dir'] = output_dir
+    os.makedirs(PROFILE_CONFIG['output_dir'], exist_ok=True)
+    if not tracemalloc.is_tracing():
+        tracemalloc.start(PROFILE_CONFIG['traceback_frames'])
+    _enabled = True
+    print(f"Profiling actions into {PROFILE_CONFIG['output_dir']}/")
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+class StackSampler(threading.Thread):
+    """
+    Thread counting the Python stacks of all other threads at a fixed interval.
+
+    Args:
+        interval (float): Seconds between samples
+    """
+
+    def __init__(self, interval):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+        self.stopping = threading.Event()
+
+    def sample(self):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        for thread_id, frame in sys._current_frames().items():
+            if thread_id == self.ident:
+                continue
+            code = frame.f_code
+            if (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES:
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(_frame_name(frame))
+                frame = frame.f_back
+            stack.append(names.get(thread_id, f"thread-{thread_id}"))
+            key = ';'.join(reversed(stack))
+            self.stacks[key] = self.stacks.get(key, 0) + 1
+        self.samples += 1
+
+    def run(self):
+        while not self.stopping.wait(self.interval):
+            self.sample()
+
+    def stop(self):
+        self.stopping.set()
+        self.join()
+
+    def write(self, path):
+        """Write the samples in collapsed-stack format."""
+        with open(path, 'w', encoding='utf-8') as f:
+            for stack, count in sorted(self.stacks.items()):
+                f.write(f"{stack} {count}\n")
+
+def _snapshot():
+    """Snapshot of traced memory without the allocations of the profiler and of module imports."""
+    return tracemalloc.take_snapshot().filter_traces([
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, __file__),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap>'),
+        tracemalloc.Filter(False, '<frozen importlib._bootstrap_external>'),
+    ])
+
+def _summary(name, wall, cpu, profiler, sampler, before, after, peak):
+    """Text report of an action: totals, top functions and top allocators."""
+    out = io.StringIO()
+    out.write(f"Action: {name}\n")
+    out.write(f"Wall time: {wall:.3f} s, process CPU time: {cpu:.3f} s\n")
+    out.write(f"Stack samples: {sampler.samples} every {sampler.interval * 1000:.0f} ms\n")
+    out.write(f"Peak traced memory: {peak / 1024 / 1024:.1f} MB\n")
+
+    if profiler:
+        out.write("\nTop functions by cumulative time (thread of the action)\n")
+        stats = pstats.Stats(profiler, stream=out)
+        stats.sort_stats('cumulative').print_stats(PROFILE_CONFIG['top_functions'])
+        out.write("\nTop functions by own time\n")
+        stats.sort_stats('tottime').print_stats(PROFILE_CONFIG['top_functions'])
+    else:
+        out.write("\ncProfile was busy with a concurrent action; see the collapsed stacks\n")
+
+    out.write("\nTop allocators (memory still held after the action)\n")
+    for stat in after.compare_to(before, 'traceback')[:PROFILE_CONFIG['top_allocators']]:
+        if stat.size_diff <= 0:
+            continue
+        out.write(f"\n{stat.size_diff / 1024:.1f} KiB in {stat.count_diff} blocks\n")
+        for line in stat.traceback.format(most_recent_first=True)[:PROFILE_CONFIG['traceback_frames'] * 2]:
+            out.write(f"  {line}\n")
+    return out.getvalue()
+
+@contextlib.contextmanager
+def profile_action(name):
+    """
+    Profile the block as one action, if profiling is enabled.
+
+    Args:
+        name (str): Name of the action, used in the file names
+    """
+    if not _enabled:
+        yield
+        return
+
+    global _sequence
+    with _sequence_lock:
+        _sequence += 1
+        sequence = _sequence
+    safe_name = re.sub(r'[^A-Za-z0-9_.-]+', '-', name).strip('-') or 'action'
+    base = os.path.join(PROFILE_CONFIG['output_dir'], f"{time.strftime('%Y%m%d-%H%M%S')}-{sequence:03d}-{safe_name}")
+
+    profiler = cProfile.Profile() if _cprofile_lock.acquire(blocking=False) else None
+    sampler = StackSampler(PROFILE_CONFIG['sample_interval'])
+    tracemalloc.reset_peak()
+    before = _snapshot()
+    started, cpu_started = time.perf_counter(), time.process_time()
+    sampler.start()
+    if profiler:
+        profiler.enable()
+    try:
+        yield
+    finally:
+        if profiler:
+            profiler.disable()
+        sampler.stop()
+        wall, cpu = time.perf_counter() - started, time.process_time() - cpu_started
+        after = _snapshot()
+        peak = tracemalloc.get_traced_memory()[1]
+        try:
+            if profiler:
+                profiler.dump_stats(f"{base}.pstats")
+            sampler.write(f"{base}.collapsed")
+            with open(f"{base}.txt", 'w', encoding='utf-8') as f:
+                f.write(_summary(name, wall, cpu, profiler, sampler, before, after, peak))
+            print(f"\n[profile] {name}: {wall:.2f} s wall, {cpu:.2f} s CPU, "
+                  f"peak {peak / 1024 / 1024:.1f} MB -> {base}.*")
+        except OSError as e:
+            print(f"\n[profile] Could not write profile of {name}: {str(e)}")
+        finally:
+            if profiler:
+                _cprofile_lock.release()
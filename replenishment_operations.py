@@ -0,0 +1,289 @@
+"""
+Functions for moving stock between branch locations in Odoo.
+"""
+from cache import get_cached
+from config import BULK_CONFIG
+from connection import get_model_connection, is_connection_error
+from shared_cache import model_validator, schema_validator
+from bulk_operations import chunked, create_records, iter_file_records
+from inventory_operations import invalidate_product_availability
+from location_index import get_location_index
+from report_output import ConsoleTableSink, ReportColumn
+from request_scheduler import PRIORITY_BULK, request_priority
+
+REPLENISHMENT_COLUMNS = [
+    ReportColumn('row', 'Row', 8),
+    ReportColumn('default_code', 'Code', 15),
+    ReportColumn('source', 'From', 22),
+    ReportColumn('destination', 'To', 22),
+    ReportColumn('quantity', 'Quantity', 10, '.2f'),
+    ReportColumn('picking', 'Transfer', 18),
+    ReportColumn('picking_id', 'Transfer ID', 12, console=False),
+    ReportColumn('status', 'Status', 10),
+    ReportColumn('error', 'Error', 30),
+]
+
+def _picking_moves_field(uid, config, models):
+    """Name of the one2many from stock.picking to its moves: move_ids on Odoo 16+, move_lines before."""
+    def load():
+        fields = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'stock.picking', 'fields_get',
+            [], {'attributes': ['type']}
+        )
+        return 'move_ids' if 'move_ids' in fields else 'move_lines'
+
+    return get_cached(config, 'stock.picking.moves_field', load, shared=True,
+                      validator=schema_validator(uid, config, 'stock.picking'))
+
+def _internal_picking_types(uid, config, models):
+    """Read the internal transfer operation types, cached per Odoo instance."""
+    return get_cached(config, 'stock.picking.type.internal', lambda: models.execute_kw(
+        config['db_name'], uid, config['password'],
+        'stock.picking.type', 'search_read',
+        [[['code', '=', 'internal']]],
+        {'fields': ['id', 'name', 'warehouse_id', 'default_location_src_id']}
+    ), shared=True, validator=model_validator(uid, config, 'stock.picking.type', [['code', '=', 'internal']]))
+
+def _picking_type_for(index, picking_types, source_id):
+    """
+    Pick the internal operation type of the warehouse a source location belongs to.
+
+    The type whose default source location contains the source location wins;
+    otherwise the first internal type is used.
+    """
+    for picking_type in picking_types:
+        default_source = picking_type.get('default_location_src_id')
+        if default_source and index.is_descendant(source_id, default_source[0]):
+            return picking_type['id']
+    return picking_types[0]['id'] if picking_types else None
+
+def load_replenishment_plan(path):
+    """
+    Read a transfer plan from a CSV or JSON Lines file.
+
+    Each row needs source and destination (location complete names such as
+    'NUG/Stock', or source_id/destination_id), default_code (or product_id)
+    and quantity.
+
+    Args:
+        path (str): Path to a .csv or .jsonl file
+
+    Returns:
+        list: List of (row number, record) tuples
+    """
+    return list(iter_file_records(path))
+
+def create_replenishment_transfers(uid, config, plan, sink=None, confirm=True):
+    """
+    Create internal transfers for a replenishment plan.
+
+    Plan lines are grouped by source and destination location into one
+    internal stock.picking each, with its moves embedded as one2many create
+    commands. All pickings of a chunk are created with one multi-record
+    create, then confirmed and reserved with one call each.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        plan (list): List of (row number, record) tuples, see load_replenishment_plan
+        sink (object): Report sink for the per-line results (defaults to console table)
+        confirm (bool): Confirm the transfers and reserve stock for them
+
+    Returns:
+        dict: Number of plan lines per status ('planned', 'failed') and the
+            IDs of the created pickings under 'picking_ids'
+    """
+    summary = {'planned': 0, 'failed': 0, 'picking_ids': []}
+
+    if not uid:
+        return summary
+
+    sink = sink or ConsoleTableSink()
+    results = []
+
+    try:
+        print("\n--- CREATING REPLENISHMENT TRANSFERS ---")
+        models = get_model_connection(config['url'])
+
+        with request_priority(PRIORITY_BULK):
+            index = get_location_index(uid, config)
+            location_ids = {index.name(location_id).lower(): location_id for location_id in index.locations}
+
+            prepared = []
+
+            def record_chunk(chunk, created, names):
+                """Set the result of every plan line of a chunk from its picking (ID or None, error)."""
+                for ((_, lines), (picking_id, error)) in zip(chunk, created):
+                    for _, line_results in lines.values():
+                        for result in line_results:
+                            result['error'] = error
+                            result['status'] = 'planned' if picking_id else 'failed'
+                            result['picking_id'] = picking_id
+                            result['picking'] = (names.get(picking_id) or f"ID {picking_id}") if picking_id else ''
+
+            for row_number, record in plan:
+                code = str(record.get('default_code') or record.get('code') or '').strip()
+                source = str(record.get('source') or '').strip()
+                destination = str(record.get('destination') or '').strip()
+                result = {'row': row_number, 'default_code': code, 'source': source, 'destination': destination,
+                          'quantity': None, 'picking': '', 'picking_id': None, 'status': 'failed', 'error': None}
+                results.append(result)
+
+                try:
+                    result['quantity'] = float(record.get('quantity'))
+                except (TypeError, ValueError):
+                    result['error'] = f"Invalid quantity: {record.get('quantity')!r}"
+                    continue
+                if result['quantity'] <= 0:
+                    result['error'] = "Quantity must be positive"
+                    continue
+
+                source_id = record.get('source_id') or location_ids.get(source.lower())
+                destination_id = record.get('destination_id') or location_ids.get(destination.lower())
+                if not source_id or not destination_id:
+                    result['error'] = f"Unknown location: {source if not source_id else destination}"
+                    continue
+                if int(source_id) == int(destination_id):
+                    result['error'] = "Source and destination are the same"
+                    continue
+                if not code and not record.get('product_id'):
+                    result['error'] = "Missing default_code"
+                    continue
+
+                prepared.append((result, code, record.get('product_id'), int(source_id), int(destination_id)))
+
+            # Resolve product codes in one search
+            codes = list({code for _, code, product_id, _, _ in prepared if code and not product_id})
+            product_ids = {}
+            if codes:
+                for product in models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    'product.product', 'search_read',
+                    [[['default_code', 'in', codes]]],
+                    {'fields': ['id', 'default_code'], 'order': 'id asc'}
+                ):
+                    product_ids.setdefault(product['default_code'], product['id'])
+
+            # Group lines by location pair, summing repeated products
+            pairs = {}
+            for result, code, product_id, source_id, destination_id in prepared:
+                product_id = int(product_id) if product_id else product_ids.get(code)
+                if not product_id:
+                    result['error'] = f"Unknown product: {code}"
+                    continue
+                lines = pairs.setdefault((source_id, destination_id), {})
+                lines.setdefault(product_id, [0, []])
+                lines[product_id][0] += result['quantity']
+                lines[product_id][1].append(result)
+
+            if pairs:
+                all_product_ids = list({product_id for lines in pairs.values() for product_id in lines})
+                products = {
+                    product['id']: product
+                    for product in models.execute_kw(
+                        config['db_name'], uid, config['password'],
+                        'product.product', 'read',
+                        [all_product_ids], {'fields': ['name', 'uom_id']}
+                    )
+                }
+                moves_field = _picking_moves_field(uid, config, models)
+                picking_types = _internal_picking_types(uid, config, models)
+
+                stopped = None
+                for chunk in chunked(list(pairs.items()), BULK_CONFIG['chunk_size']):
+                    if stopped:
+                        record_chunk(chunk, [(None, f"Not sent: {stopped}")] * len(chunk), {})
+                        continue
+
+                    vals_list = []
+                    for (source_id, destination_id), lines in chunk:
+                        moves = []
+                        for product_id, (quantity, _) in lines.items():
+                            product = products.get(product_id, {})
+                            move_vals = {
+                                'name': product.get('name') or f"Product {product_id}",
+                                'product_id': product_id,
+                                'product_uom_qty': quantity,
+                                'location_id': source_id,
+                                'location_dest_id': destination_id,
+                            }
+                            if product.get('uom_id'):
+                                move_vals['product_uom'] = product['uom_id'][0]
+                            moves.append((0, 0, move_vals))
+                        vals_list.append({
+                            'picking_type_id': _picking_type_for(index, picking_types, source_id),
+                            'location_id': source_id,
+                            'location_dest_id': destination_id,
+                            'origin': 'Replenishment',
+                            moves_field: moves,
+                        })
+
+                    try:
+                        created = create_records(models, config, uid, 'stock.picking', vals_list)
+                    except Exception as e:
+                        # Without an answer the pickings may or may not exist; report them and stop
+                        stopped = str(e)
+                        record_chunk(chunk, [(None, f"Unknown whether the transfer was created: {e}")] * len(chunk), {})
+                        continue
+                    picking_ids = [picking_id for picking_id, error in created if not error]
+                    summary['picking_ids'].extend(picking_ids)
+
+                    # Pickings exist from here on, so every line is reported with them whatever fails next
+                    if confirm and picking_ids:
+                        try:
+                            models.execute_kw(
+                                config['db_name'], uid, config['password'],
+                                'stock.picking', 'action_confirm',
+                                [picking_ids]
+                            )
+                        except Exception as e:
+                            created = [(picking_id, error or f"Created as draft, not confirmed: {e}")
+                                       for picking_id, error in created]
+                            if is_connection_error(e):
+                                stopped = str(e)
+                        else:
+                            try:
+                                models.execute_kw(
+                                    config['db_name'], uid, config['password'],
+                                    'stock.picking', 'action_assign',
+                                    [picking_ids]
+                                )
+                            except Exception as e:
+                                print(f"Warning: Could not reserve stock: {str(e)}")
+
+                    names = {}
+                    if picking_ids and not stopped:
+                        try:
+                            names = {
+                                picking['id']: picking['name'] or ''
+                                for picking in models.execute_kw(
+                                    config['db_name'], uid, config['password'],
+                                    'stock.picking', 'read',
+                                    [picking_ids], {'fields': ['name']}
+                                )
+                            }
+                        except Exception as e:
+                            print(f"Warning: Could not read transfer names: {str(e)}")
+                    record_chunk(chunk, created, names)
+
+                invalidate_product_availability(config, all_product_ids)
+
+    except Exception as e:
+        print(f"Error creating replenishment transfers: {str(e)}")
+
+    # Written even after an error, so transfers already created in Odoo are reported
+    try:
+        sink.begin_section('replenishment', "Replenishment Transfers", REPLENISHMENT_COLUMNS, rule_width=145)
+        for result in results:
+            summary[result['status']] += 1
+            sink.write_row(dict(result, error=result['error'] or ''))
+        sink.end_section()
+    except Exception as e:
+        print(f"Error writing replenishment results: {str(e)}")
+    finally:
+        sink.close()
+
+    print(f"\nReplenishment summary: {summary['planned']} lines planned in "
+          f"{len(summary['picking_ids'])} transfers, {summary['failed']} failed")
+    return summary
@@ -0,0 +1,240 @@
+"""
+Output sinks for streaming report rows to the console, CSV or JSON Lines.
+
+Reports describe each section with a list of columns and then push rows one
+at a time, so a sink never needs to hold more than the current row.
+"""
+import csv
+import json
+import os
+import sys
+
+# Supported output formats for the report sinks
+REPORT_FORMATS = ['table', 'csv', 'jsonl']
+
+class ReportColumn:
+    """
+    A single column of a report section.
+
+    Args:
+        key (str): Key of the value in the row dictionary
+        label (str): Column heading
+        width (int): Column width used by the console table
+        fmt (str): Optional format spec for numeric values (e.g. '.2f')
+        console (bool): False for export-only columns hidden from the console
+    """
+    def __init__(self, key, label, width, fmt='', console=True):
+        self.key = key
+        self.label = label
+        self.width = width
+        self.fmt = fmt
+        self.console = console
+
+class ConsoleTableSink:
+    """Print report sections as fixed-width text tables on stdout."""
+
+    def __init__(self, stream=None):
+        self.stream = stream or sys.stdout
+        self.columns = None
+        self.skip_section = False
+
+    def begin_section(self, name, title, columns, rule_width=None, detail=False):
+        """
+        Start a new report section.
+
+        Args:
+            name (str): Machine-readable section name
+            title (str): Heading printed above the table
+            columns (list): List of ReportColumn objects
+            rule_width (int): Width of the separator lines
+            detail (bool): True for row-level export sections that are too
+                verbose for the console and only go to file sinks
+        """
+        self.skip_section = detail
+        if detail:
+            return
+        self.columns = [col for col in columns if col.console]
+        columns = self.columns
+        rule_width = rule_width or sum(col.width + 1 for col in columns)
+        self.stream.write(f"\n{title}:\n")
+        self.stream.write("-" * rule_width + "\n")
+        self.stream.write(" ".join(f"{col.label:<{col.width}}" for col in columns) + "\n")
+        self.stream.write("-" * rule_width + "\n")
+
+    def write_row(self, row):
+        """Print a single row of the current section."""
+        if self.skip_section:
+            return
+        cells = []
+        for col in self.columns:
+            value = row.get(col.key)
+            if value is None:
+                value = ''
+            spec = f"<{col.width}{col.fmt}" if col.fmt and isinstance(value, (int, float)) else f"<{col.width}"
+            cells.append(format(value if col.fmt else str(value), spec))
+        self.stream.write(" ".join(cells) + "\n")
+
+    def write_note(self, text):
+        """Print a free-text line that is not part of the table data."""
+        if not self.skip_section:
+            self.stream.write(f"{text}\n")
+
+    def end_section(self):
+        """Finish the current section."""
+        self.flush()
+
+    def flush(self):
+        """Flush written rows to the terminal."""
+        self.stream.flush()
+
+    def close(self):
+        """Nothing to release for the console."""
+        self.flush()
+
+class CsvSink:
+    """
+    Write each report section to its own CSV file.
+
+    Files are named <base>_<section>.csv next to the given path, so a report
+    with several sections produces several well-formed CSV files.
+    """
+
+    def __init__(self, path):
+        base, _ = os.path.splitext(path)
+        self.base = base
+        self.handle = None
+        self.writer = None
+        self.columns = None
+        self.paths = []
+
+    def begin_section(self, name, title, columns, rule_width=None, detail=False):
+        """Open the CSV file for a section and write its header row."""
+        self.end_section()
+        path = f"{self.base}_{name}.csv"
+        self.handle = open(path, 'w', newline='', encoding='utf-8')
+        self.writer = csv.writer(self.handle)
+        self.columns = columns
+        self.writer.writerow([col.key for col in columns])
+        self.paths.append(path)
+
+    def write_row(self, row):
+        """Append a row to the current CSV file."""
+        self.writer.writerow([row.get(col.key, '') for col in self.columns])
+
+    def write_note(self, text):
+        """Notes are console-only and are not written to CSV."""
+
+    def end_section(self):
+        """Close the CSV file of the current section."""
+        if self.handle:
+            self.handle.close()
+            print(f"Wrote {self.handle.name}")
+        self.handle = None
+        self.writer = None
+
+    def flush(self):
+        """Flush buffered rows so readers see them straight away."""
+        if self.handle:
+            self.handle.flush()
+
+    def close(self):
+        """Close any open section file."""
+        self.end_section()
+
+class JsonLinesSink:
+    """
+    Write every report row as one JSON object per line.
+
+    Each object carries a 'section' key so all sections of a report can share
+    a single file.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.handle = open(path, 'w', encoding='utf-8')
+        self.section = None
+        self.columns = None
+
+    def begin_section(self, name, title, columns, rule_width=None, detail=False):
+        """Remember the section name and columns for the following rows."""
+        self.section = name
+        self.columns = columns
+
+    def write_row(self, row):
+        """Append a row as a JSON object."""
+        record = {'section': self.section}
+        record.update({col.key: row.get(col.key) for col in self.columns})
+        self.handle.write(json.dumps(record, default=str) + "\n")
+
+    def write_note(self, text):
+        """Notes are console-only and are not written to JSON Lines."""
+
+    def end_section(self):
+        """Flush rows written for the section."""
+        self.flush()
+
+    def flush(self):
+        """Flush buffered rows so readers see them straight away."""
+        self.handle.flush()
+
+    def close(self):
+        """Close the output file."""
+        if not self.handle.closed:
+            self.handle.close()
+            print(f"Wrote {self.path}")
+
+class MemorySink:
+    """
+    Collect report rows in memory, grouped by section.
+
+    Used where a report is returned to a caller instead of being shown or
+    saved, such as the JSON API of the service mode.
+    """
+
+    def __init__(self):
+        self.sections = {}
+        self.columns = None
+        self.rows = None
+
+    def begin_section(self, name, title, columns, rule_width=None, detail=False):
+        """Start collecting rows for a section."""
+        self.columns = columns
+        self.rows = self.sections.setdefault(name, [])
+
+    def write_row(self, row):
+        """Keep a row of the current section."""
+        self.rows.append({col.key: row.get(col.key) for col in self.columns})
+
+    def write_note(self, text):
+        """Notes are console-only and are not collected."""
+
+    def end_section(self):
+        """Nothing to finish for in-memory sections."""
+
+    def flush(self):
+        """Nothing to flush for in-memory sections."""
+
+    def close(self):
+        """Nothing to release for in-memory sections."""
+
+def open_report_sink(output_format='table', path=None):
+    """
+    Create a report sink for the requested output format.
+
+    Args:
+        output_format (str): One of 'table', 'csv' or 'jsonl'
+        path (str): Output file path, required for 'csv' and 'jsonl'
+
+    Returns:
+        object: A sink with begin_section/write_row/end_section/close methods
+    """
+    output_format = (output_format or 'table').lower()
+    if output_format not in REPORT_FORMATS:
+        raise ValueError(f"Unknown report format '{output_format}'. Use one of: {', '.join(REPORT_FORMATS)}")
+    if output_format == 'table':
+        return ConsoleTableSink()
+    if not path:
+        raise ValueError(f"An output path is required for the '{output_format}' format")
+    if output_format == 'csv':
+        return CsvSink(path)
+    return JsonLinesSink(path)
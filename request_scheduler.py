@@ -0,0 +1,274 @@
+"""
+Scheduling of XML-RPC requests to Odoo.
+
+Every execute_kw call passes through a RequestScheduler, which limits how many
+requests are in flight (an AIMD limit driven by latency and throttling
+responses), how many start per second (a token bucket), and in which order
+waiting requests go out (priority lanes, so interactive menu actions are not
+stuck behind bulk jobs or background cache warming).
+"""
+import contextlib
+import heapq
+import itertools
+import threading
+import time
+import xmlrpc.client
+from config import SCHEDULER_CONFIG
+from deadlines import DeadlineExceeded, current_deadline, remaining_time
+
+# Priority lanes, lower numbers go first
+PRIORITY_INTERACTIVE = 0
+PRIORITY_NORMAL = 1
+PRIORITY_BULK = 2
+PRIORITY_BACKGROUND = 3  # Cache warming; only runs when nothing else is waiting
+
+# HTTP status codes Odoo (or the odoo.com proxy) uses to ask clients to slow down
+THROTTLE_STATUS_CODES = (429, 503)
+
+_local = threading.local()
+_schedulers = {}
+_schedulers_lock = threading.Lock()
+
+def current_priority():
+    """Return the priority lane of the calling thread."""
+    return getattr(_local, 'priority', PRIORITY_NORMAL)
+
+@contextlib.contextmanager
+def request_priority(priority):
+    """
+    Send the requests made inside the block on the given priority lane.
+
+    Args:
+        priority (int): One of the PRIORITY_* constants
+    """
+    previous = current_priority()
+    _local.priority = priority
+    try:
+        yield
+    finally:
+        _local.priority = previous
+
+def is_throttle_error(error):
+    """
+    Check whether an error means the server asked us to slow down.
+
+    Args:
+        error (Exception): Error raised by an XML-RPC call
+
+    Returns:
+        bool: True for 429/503 responses
+    """
+    return isinstance(error, xmlrpc.client.ProtocolError) and error.errcode in THROTTLE_STATUS_CODES
+
+def _retry_after(error, default):
+    """Read the Retry-After header of a throttling response, in seconds."""
+    try:
+        return float(error.headers.get('Retry-After', default))
+    except (AttributeError, TypeError, ValueError):
+        return default
+
+class TokenBucket:
+    """
+    Token bucket limiting the rate at which requests start.
+
+    Args:
+        rate (float): Tokens added per second (0 disables the limit)
+        burst (int): Maximum number of tokens that can be saved up
+    """
+
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.updated = time.monotonic()
+        self.lock = threading.Lock()
+
+    def try_acquire(self):
+        """
+        Take one token if one is available.
+
+        Returns:
+            float: 0 if a token was taken, otherwise the seconds until one is available
+        """
+        if not self.rate:
+            return 0.0
+        with self.lock:
+            now = time.monotonic()
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+            self.updated = now
+            if self.tokens >= 1:
+                self.tokens -= 1
+                return 0.0
+            return (1 - self.tokens) / self.rate
+
+
+class AIMDLimiter:
+    """
+    Additive-increase / multiplicative-decrease limit on concurrent requests.
+
+    Each fast, successful request raises the limit by 1/limit, so it grows by
+    about one per round of requests. A slow request lowers it slightly and a
+    throttling response halves it.
+
+    Args:
+        initial (int): Starting limit
+        minimum (int): Lowest limit
+        maximum (int): Highest limit
+        latency_target (float): Requests slower than this count as slow
+    """
+
+    def __init__(self, initial, minimum, maximum, latency_target):
+        self.limit = float(initial)
+        self.minimum = minimum
+        self.maximum = maximum
+        self.latency_target = latency_target
+
+    def on_success(self, latency):
+        """Adjust the limit after a successful request."""
+        if latency > self.latency_target:
+            self.limit = max(self.minimum, self.limit * 0.9)
+        else:
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+
+    def on_throttle(self):
+        """Halve the limit after a throttling response."""
+        self.limit = max(self.minimum, self.limit * 0.5)
+
+    @property
+    def slots(self):
+        """Number of requests allowed in flight right now."""
+        return max(self.minimum, int(self.limit))
+
+class RequestScheduler:
+    """
+    Gate for all requests to one Odoo server.
+
+    Waiting requests are admitted in priority order (then first come, first
+    served) whenever the AIMD limit has a free slot and the rate limiter has a
+    token. The request at the head of the queue waits for the token before it
+    takes a slot, so rate limiting never holds a slot. Throttled requests are
+    retried after the server's Retry-After delay.
+
+    Args:
+        settings (dict): Scheduler settings, see SCHEDULER_CONFIG
+    """
+
+    def __init__(self, settings=None):
+        settings = dict(SCHEDULER_CONFIG, **(settings or {}))
+        self.settings = settings
+        self.limiter = AIMDLimiter(
+            settings['initial_concurrency'],
+            settings['min_concurrency'],
+            settings['max_concurrency'],
+            settings['latency_target']
+        )
+        self.bucket = TokenBucket(settings['requests_per_second'], settings['burst'])
+        self.condition = threading.Condition()
+        self.waiting = []
+        self.sequence = itertools.count()
+        self.in_flight = 0
+        self.completed = 0
+        self.throttled = 0
+
+    def _acquire(self, priority, absolute_deadline=None):
+        """Wait for a free slot and a rate token, letting higher-priority requests go first."""
+        ticket = (priority, next(self.sequence))
+        with self.condition:
+            heapq.heappush(self.waiting, ticket)
+            while True:
+                wait = None
+                if self.waiting[0] == ticket and self.in_flight < self.limiter.slots:
+                    wait = self.bucket.try_acquire()
+                    if not wait:
+                        break
+                remaining = remaining_time(absolute_deadline)
+                if remaining is not None and (remaining <= 0 or (wait and wait > remaining)):
+                    self.waiting.remove(ticket)
+                    heapq.heapify(self.waiting)
+                    self.condition.notify_all()
+                    reason = "a request slot" if wait is None else "the request rate limit"
+                    raise DeadlineExceeded(f"Deadline exceeded while waiting for {reason}")
+                # Wait for a slot to be freed, or at the head of the queue for the next token
+                self.condition.wait(wait if remaining is None else min(wait or remaining, remaining))
+            heapq.heappop(self.waiting)
+            self.in_flight += 1
+            self.condition.notify_all()
+
+    def _release(self, latency=None, throttled=False):
+        """Free a slot and feed the outcome back into the limiter."""
+        with self.condition:
+            self.in_flight -= 1
+            if throttled:
+                self.throttled += 1
+                self.limiter.on_throttle()
+            elif latency is not None:
+                self.completed += 1
+                self.limiter.on_success(latency)
+            self.condition.notify_all()
+
+    def run(self, call, priority=None, absolute_deadline=None):
+        """
+        Run a request once the scheduler admits it.
+
+        Args:
+            call (callable): Function without arguments that performs the request
+            priority (int): Priority lane (defaults to the calling thread's lane)
+            absolute_deadline (float): Give up waiting for a slot after this
+                time.monotonic() value (defaults to the calling thread's deadline)
+
+        Returns:
+            object: The result of the call
+        """
+        priority = current_priority() if priority is None else priority
+        absolute_deadline = current_deadline() if absolute_deadline is None else absolute_deadline
+        retries = self.settings['max_throttle_retries']
+
+        for attempt in itertools.count():
+            self._acquire(priority, absolute_deadline)
+            started = time.monotonic()
+            try:
+                result = call()
+            except Exception as e:
+                if is_throttle_error(e):
+                    self._release(throttled=True)
+                    delay = _retry_after(e, self.settings['throttle_backoff'] * (2 ** attempt))
+                    remaining = remaining_time(absolute_deadline)
+                    if attempt >= retries or (remaining is not None and remaining <= delay):
+                        raise
+                    time.sleep(delay)
+                    continue
+                self._release()
+                raise
+            self._release(latency=time.monotonic() - started)
+            return result
+
+    def stats(self):
+        """
+        Current state of the scheduler.
+
+        Returns:
+            dict: Concurrency limit, requests in flight and waiting, counters
+        """
+        with self.condition:
+            return {
+                'concurrency_limit': round(self.limiter.limit, 2),
+                'in_flight': self.in_flight,
+                'waiting': len(self.waiting),
+                'completed': self.completed,
+                'throttled': self.throttled,
+            }
+
+def get_scheduler(url):
+    """
+    Return the shared scheduler for an Odoo server, creating it on first use.
+
+    Args:
+        url (str): The Odoo server URL
+
+    Returns:
+        RequestScheduler: The scheduler gating requests to that server
+    """
+    with _schedulers_lock:
+        if url not in _schedulers:
+            _schedulers[url] = RequestScheduler()
+        return _schedulers[url]
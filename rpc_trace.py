@@ -0,0 +1,430 @@
+"""
+Recording and replay of execute_kw traffic for load tests.
+
+Recording: with `python main.py --trace calls.jsonl` (or start_recording()),
+every execute_kw call made through the connection layer is written to a JSON
+Lines trace. The trace holds the time of the call, thread, priority lane,
+model, method, arguments, duration, outcome, and the shape of the response:
+types, list lengths, string lengths and field names, but not the data
+itself. The password and the values of keys matching
+TRACE_CONFIG['scrub_pattern'] are replaced by "***".
+
+Replay: `python rpc_trace.py replay calls.jsonl --speed 10 --concurrency 8`
+sends the calls again through the same client stack (scheduler, hedging,
+single-flight, XML-RPC marshalling) to a local server, keeping the recorded
+spacing divided by the speed factor. The default server answers each call
+with a synthetic response of the recorded shape after the recorded
+duration, so the client handles payloads of production size; with
+--server standin the calls go to the stateful stand-in of odoo_standin.py
+instead. The report gives throughput, latency percentiles overall and per
+model and method, errors, and how far calls started behind schedule.
+"""
+import argparse
+import atexit
+import collections
+import datetime
+import json
+import math
+import re
+import sys
+import threading
+import time
+import xmlrpc.client
+from concurrent.futures import ThreadPoolExecutor
+from config import SCHEDULER_CONFIG, TRACE_CONFIG
+from connection import get_model_connection, set_call_recorder
+from request_scheduler import request_priority
+
+SCRUBBED = '***'
+
+def _scrub(value, pattern):
+    """Copy of a value with the values of secret-looking keys replaced."""
+    if isinstance(value, dict):
+        return {key: SCRUBBED if pattern.search(str(key)) else _scrub(item, pattern)
+                for key, item in value.items()}
+    if isinstance(value, (list, tuple)):
+        return [_scrub(item, pattern) for item in value]
+    return value
+
+def response_shape(value, depth=None):
+    """
+    Describe the structure of a response without its data.
+
+    Lists record their length and the shape of their first item (of every
+    item for short lists such as many2one pairs), dicts their keys, strings
+    their length.
+
+    Args:
+        value (object): Unmarshalled XML-RPC response
+        depth (int): Levels of nesting to describe (defaults to TRACE_CONFIG['shape_depth'])
+
+    Returns:
+        dict: The shape, e.g. {'t': 'list', 'n': 120, 'item': {...}}
+    """
+    depth = TRACE_CONFIG['shape_depth'] if depth is None else depth
+    if value is None:
+        return {'t': 'none'}
+    if isinstance(value, bool):
+        return {'t': 'bool'}
+    if isinstance(value, int):
+        return {'t': 'int'}
+    if isinstance(value, float):
+        return {'t': 'float'}
+    if isinstance(value, str):
+        return {'t': 'str', 'n': len(value)}
+    if isinstance(value, (list, tuple)):
+        shape = {'t': 'list', 'n': len(value)}
+        if value and depth > 0:
+            if len(value) <= 8:
+                shape['items'] = [response_shape(item, depth - 1) for item in value]
+            else:
+                shape['item'] = response_shape(value[0], depth - 1)
+        return shape
+    if isinstance(value, dict):
+        shape = {'t': 'dict', 'n': len(value)}
+        if depth > 0:
+            shape['fields'] = {str(key): response_shape(item, depth - 1)
+                               for key, item in list(value.items())[:TRACE_CONFIG['shape_max_fields']]}
+        return shape
+    return {'t': 'str', 'n': len(str(value))}
+
+def synthesize(shape, sequence=None):
+    """
+    Build a value with a recorded response shape.
+
+    Args:
+        shape (dict): Shape as returned by response_shape
+        sequence (itertools.count): Source of values for 'id' fields
+
+    Returns:
+        object: XML-RPC serializable value of that shape
+    """
+    sequence = sequence if sequence is not None else iter(range(1, 1 << 30))
+    kind = shape.get('t')
+    if kind == 'bool':
+        return True
+    if kind == 'int':
+        return 1
+    if kind == 'float':
+        return 1.5
+    if kind == 'str':
+        return 'x' * shape.get('n', 0)
+    if kind == 'list':
+        if 'items' in shape:
+            return [synthesize(item, sequence) for item in shape['items']]
+        if 'item' in shape:
+            return [synthesize(shape['item'], sequence) for _ in range(shape['n'])]
+        return [1] * shape.get('n', 0)
+    if kind == 'dict':
+        return {key: next(sequence) if key == 'id' and item.get('t') == 'int' else synthesize(item, sequence)
+                for key, item in shape.get('fields', {}).items()}
+    return None
+
+class TraceRecorder:
+    """
+    Writer of execute_kw calls to a JSON Lines trace file.
+
+    Args:
+        path (str): Trace file, overwritten
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.pattern = re.compile(TRACE_CONFIG['scrub_pattern'], re.IGNORECASE)
+        self.lock = threading.Lock()
+        self.origin = time.time()
+        self.count = 0
+        self.file = open(path, 'w', encoding='utf-8')
+        self._write({'trace': 1, 'started': datetime.datetime.now(datetime.timezone.utc).isoformat()})
+
+    def _write(self, entry):
+        line = json.dumps(entry, default=str)
+        with self.lock:
+            if self.file:
+                self.file.write(line + '\n')
+                self.file.flush()
+
+    def record(self, args, priority, started, seconds, result, error):
+        """Write one call; args are the execute_kw arguments (db, uid, password, model, method, ...)."""
+        entry = {
+            't': round(started - self.origin, 6),
+            'thread': threading.current_thread().name,
+            'lane': priority,
+            'model': args[3],
+            'method': args[4],
+            'args': _scrub(list(args[5]) if len(args) > 5 else [], self.pattern),
+            'kwargs': _scrub(args[6] if len(args) > 6 else {}, self.pattern),
+            'duration': round(seconds, 6),
+        }
+        if error is None:
+            entry['status'] = 'ok'
+            entry['shape'] = response_shape(result)
+        else:
+            entry['status'] = 'fault' if isinstance(error, xmlrpc.client.Fault) else 'error'
+            entry['error'] = type(error).__name__
+        self._write(entry)
+        self.count += 1
+
+    def close(self):
+        with self.lock:
+            if self.file:
+                self.file.close()
+                self.file = None
+
+_recorder = None
+
+def start_recording(path):
+    """
+    Record every execute_kw call of this process to a trace file.
+
+    Args:
+        path (str): Trace file, overwritten
+
+    Returns:
+        TraceRecorder or None: The recorder, or None if the file cannot be opened
+    """
+    global _recorder
+    try:
+        _recorder = TraceRecorder(path)
+    except OSError as e:
+        print(f"Could not open trace file {path}: {str(e)}")
+        return None
+    set_call_recorder(_recorder)
+    atexit.register(stop_recording)
+    print(f"Recording Odoo calls to {path}")
+    return _recorder
+
+def stop_recording():
+    """Stop recording and close the trace file."""
+    global _recorder
+    set_call_recorder(None)
+    if _recorder:
+        print(f"Recorded {_recorder.count} Odoo calls to {_recorder.path}")
+        _recorder.close()
+        _recorder = None
+
+def load_trace(path):
+    """
+    Read the calls of a trace file, in recorded order.
+
+    Returns:
+        list: Call entries
+    """
+    calls = []
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if line:
+                entry = json.loads(line)
+                if 'method' in entry:
+                    calls.append(entry)
+    calls.sort(key=lambda entry: entry['t'])
+    return calls
+
+def _call_key(model, method, args, kwargs):
+    """Identity of a call by model, method, arguments and options, as JSON."""
+    return json.dumps([model, method, args, kwargs or {}], sort_keys=True, default=str)
+
+class ShapeReplayServer:
+    """
+    Answers of a replay server built from the recorded response shapes.
+
+    Calls are matched to recorded calls with the same model, method,
+    arguments and options, in recorded order. Hedged duplicates and reads
+    shared by single-flight change how often a call arrives. Each answer is
+    therefore put back at the end of its queue instead of being used up.
+    Each answer waits for the recorded duration (or a fixed latency) and is a
+    synthetic value of the recorded shape, or a fault if the recorded call
+    failed.
+
+    Args:
+        calls (list): Call entries of the trace
+        latency (float): Fixed server latency in seconds, or None to use the
+            recorded durations
+    """
+
+    def __init__(self, calls, latency=None):
+        self.latency = latency
+        self.lock = threading.Lock()
+        self.answers = collections.defaultdict(collections.deque)
+        for entry in calls:
+            self.answers[_call_key(entry['model'], entry['method'], entry['args'], entry.get('kwargs'))].append(entry)
+
+    def execute_kw(self, db_name, uid, password, model, method, *rest):
+        key = _call_key(model, method, rest[0] if rest else [], rest[1] if len(rest) > 1 else {})
+        with self.lock:
+            queue = self.answers.get(key)
+            entry = None
+            if queue:
+                entry = queue.popleft()
+                queue.append(entry)
+        if entry is None:
+            raise xmlrpc.client.Fault(1, f"No recorded answer for {model}.{method}")
+        time.sleep(entry['duration'] if self.latency is None else self.latency)
+        if entry['status'] != 'ok':
+            raise xmlrpc.client.Fault(1, f"Recorded {entry.get('error', 'error')} for {model}.{method}")
+        return synthesize(entry['shape'])
+
+def serve_replay(calls, server='shapes', port=0, latency=None, uid=2):
+    """
+    Start a local XML-RPC server for a replay in a background thread.
+
+    Args:
+        calls (list): Call entries of the trace
+        server (str): 'shapes' for synthetic answers of the recorded shapes,
+            'standin' for the stateful stand-in of odoo_standin.py
+        port (int): Port to listen on (0 picks a free one)
+        latency (float): Fixed server latency in seconds (for 'shapes', None
+            uses the recorded durations)
+        uid (int): User ID answered to authenticate
+
+    Returns:
+        tuple: (url, server) of the running server
+    """
+    from odoo_standin import SERVER_VERSION, StandinDatabase, StandinRequestHandler, StandinServer
+
+    handler = ShapeReplayServer(calls, latency) if server == 'shapes' else StandinDatabase(latency or 0.0)
+    httpd = StandinServer(('127.0.0.1', port), requestHandler=StandinRequestHandler,
+                          allow_none=True, logRequests=False)
+    httpd.register_function(lambda: {'server_version': SERVER_VERSION}, 'version')
+    httpd.register_function(lambda db_name, username, password, user_agent_env: uid, 'authenticate')
+    httpd.register_function(handler.execute_kw, 'execute_kw')
+    threading.Thread(target=httpd.serve_forever, name='replay-server', daemon=True).start()
+    return f"http://127.0.0.1:{httpd.server_address[1]}", httpd
+
+def _percentile(values, percent):
+    """Nearest-rank percentile of sorted values."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(percent * len(values) / 100.0) - 1))]
+
+def replay(calls, url, speed=1.0, concurrency=8, db_name='replay', uid=2, password='replay'):
+    """
+    Send the calls of a trace to a server through the client stack.
+
+    Each call starts at its recorded offset divided by speed, on its recorded
+    priority lane, as soon as one of the concurrency workers is free.
+
+    Args:
+        calls (list): Call entries of the trace
+        url (str): Server URL
+        speed (float): Time compression, e.g. 10 for ten times as fast
+        concurrency (int): Calls in flight at most
+        db_name (str): Database name sent with the calls
+        uid (int): User ID sent with the calls
+        password (str): Password sent with the calls
+
+    Returns:
+        dict: Summary with calls, errors, seconds, throughput, latency and lag
+            percentiles, per model and method latencies, and the number of
+            hedged duplicates and of calls served by single-flight
+    """
+    models = get_model_connection(url)
+    hedges, shared = models.hedges, models.single_flight.shared
+    results = []
+    results_lock = threading.Lock()
+    origin = time.monotonic()
+
+    def send(entry, scheduled):
+        started = time.monotonic()
+        error = None
+        try:
+            with request_priority(entry.get('lane', 1)):
+                args = [db_name, uid, password, entry['model'], entry['method'], entry['args']]
+                if entry.get('kwargs'):
+                    args.append(entry['kwargs'])
+                models.execute_kw(*args)
+        except Exception as e:
+            error = type(e).__name__
+        finished = time.monotonic()
+        with results_lock:
+            results.append((entry['model'], entry['method'], finished - started, started - scheduled, error))
+
+    with ThreadPoolExecutor(max_workers=concurrency, thread_name_prefix='replay') as executor:
+        first = calls[0]['t'] if calls else 0.0
+        for entry in calls:
+            scheduled = origin + (entry['t'] - first) / speed
+            delay = scheduled - time.monotonic()
+            if delay > 0:
+                time.sleep(delay)
+            executor.submit(send, entry, scheduled)
+
+    seconds = time.monotonic() - origin
+    latencies = sorted(result[2] for result in results)
+    lags = sorted(result[3] for result in results)
+    by_method = collections.defaultdict(list)
+    for model, method, latency, _, _ in results:
+        by_method[f"{model}.{method}"].append(latency)
+
+    return {
+        'calls': len(results),
+        'errors': collections.Counter(result[4] for result in results if result[4]),
+        'seconds': seconds,
+        'throughput': len(results) / seconds if seconds else 0.0,
+        'hedges': models.hedges - hedges,
+        'shared': models.single_flight.shared - shared,
+        'latency': {p: _percentile(latencies, p) for p in (50, 90, 99, 100)},
+        'lag': {p: _percentile(lags, p) for p in (50, 99, 100)},
+        'methods': {name: {'calls': len(values), 'p50': _percentile(sorted(values), 50),
+                           'p99': _percentile(sorted(values), 99)}
+                    for name, values in by_method.items()},
+    }
+
+def print_replay_report(summary, speed, concurrency):
+    """Print the summary of a replay."""
+    ms = lambda seconds: f"{seconds * 1000:.1f} ms"
+    print(f"\n--- REPLAY AT {speed:g}x, CONCURRENCY {concurrency} ---")
+    print(f"Calls: {summary['calls']} in {summary['seconds']:.2f} s ({summary['throughput']:.1f} calls/s)")
+    print(f"Hedged duplicates: {summary['hedges']}, calls served by single-flight: {summary['shared']}")
+    if summary['errors']:
+        print("Errors: " + ", ".join(f"{name} x{count}" for name, count in summary['errors'].most_common()))
+    print("Latency: " + ", ".join(f"{'max' if p == 100 else f'p{p}'} {ms(value)}"
+                                  for p, value in summary['latency'].items()))
+    print("Start lag behind schedule: " + ", ".join(f"{'max' if p == 100 else f'p{p}'} {ms(value)}"
+                                                    for p, value in summary['lag'].items()))
+    print(f"\n{'Model.method':<45} {'Calls':>7} {'p50':>10} {'p99':>10}")
+    print("-" * 75)
+    for name, stats in sorted(summary['methods'].items(), key=lambda item: -item[1]['calls']):
+        print(f"{name:<45} {stats['calls']:>7} {ms(stats['p50']):>10} {ms(stats['p99']):>10}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Replay a trace of Odoo calls against a local server.")
+    commands = parser.add_subparsers(dest='command', required=True)
+    replay_parser = commands.add_parser('replay', help="Replay a trace file")
+    replay_parser.add_argument('trace', help="Trace file recorded with main.py --trace")
+    replay_parser.add_argument('--speed', type=float, action='append',
+                               help="Time compression, repeat for several runs (default 1)")
+    replay_parser.add_argument('--concurrency', type=int, default=8, help="Calls in flight at most")
+    replay_parser.add_argument('--server', choices=['shapes', 'standin'], default='shapes',
+                               help="Synthetic answers of the recorded shapes, or the stateful stand-in")
+    replay_parser.add_argument('--latency', type=float,
+                               help="Fixed server latency in seconds (default: recorded durations)")
+    replay_parser.add_argument('--url', help="Replay against a server already running at this URL")
+    replay_parser.add_argument('--rate', type=float,
+                               help="Scheduler requests per second (0 disables the client rate limit)")
+    options = parser.parse_args(argv)
+
+    if options.rate is not None:
+        SCHEDULER_CONFIG['requests_per_second'] = options.rate
+    calls = load_trace(options.trace)
+    if not calls:
+        print(f"No calls in {options.trace}")
+        return 1
+    print(f"Loaded {len(calls)} calls spanning {calls[-1]['t'] - calls[0]['t']:.1f} s from {options.trace}")
+
+    for speed in options.speed or [1.0]:
+        if options.url:
+            url, httpd = options.url, None
+        else:
+            url, httpd = serve_replay(calls, options.server, latency=options.latency)
+        try:
+            summary = replay(calls, url, speed=speed, concurrency=options.concurrency)
+        finally:
+            if httpd:
+                httpd.shutdown()
+                httpd.server_close()
+        print_replay_report(summary, speed, options.concurrency)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -2,12 +2,28 @@
 Functions for managing sales operations in Odoo.
 """
 import datetime
-from connection import get_model_connection
+import uuid
+import xmlrpc.client
+from cache import get_cached
+from config import JOURNAL_CONFIG, MACRO_CONFIG, REPORT_CONFIG
+from connection import get_model_connection, is_connection_error, iter_search_read
+from shared_cache import modules_validator
+from inventory_operations import check_basket_availability, invalidate_product_availability, load_warehouses
+from pricelist_engine import quote_basket
+from partner_resolver import resolve_partners
+from report_output import ConsoleTableSink, ReportColumn
+from server_macros import MacroOutcomeUnknown, sale_order_macro
+from write_journal import queue_sale_order
 
 def check_sales_module_available(uid, config):
     """
     Check if the sales module is available in the Odoo instance.
     
+    The result is cached per Odoo instance, so repeated checks before each
+    customer or order do not cost a request. Only an answer from Odoo is
+    cached: when it cannot be reached the check returns False for this call
+    and is made again next time.
+    
     Args:
         uid (int): User ID for authentication
         config (dict): Configuration dictionary with Odoo connection parameters
@@ -18,10 +34,11 @@ def check_sales_module_available(uid, config):
     if not uid:
         return False
     
-    try:
+    def probe():
         models = get_model_connection(config['url'])
         
-        # Try to access the sale.order model
+        # Try to access the sale.order model; only a fault means it is missing,
+        # other errors leave the question open and are not cached
         try:
             models.execute_kw(
                 config['db_name'], uid, config['password'],
@@ -29,7 +46,7 @@ def check_sales_module_available(uid, config):
                 [[]], {'limit': 1}
             )
             return True
-        except Exception:
+        except xmlrpc.client.Fault:
             # Try alternative models that might exist
             try:
                 models.execute_kw(
@@ -39,22 +56,31 @@ def check_sales_module_available(uid, config):
                 )
                 print("Note: Traditional Sales module is not available, but Point of Sale module is available.")
                 return False
-            except Exception:
+            except xmlrpc.client.Fault:
                 print("Note: Sales module is not available in this Odoo instance.")
                 print("This is common in free/trial accounts where not all apps are installed.")
                 print("You can still use the inventory management features.")
                 return False
+    
+    try:
+        return get_cached(config, 'sales.module.available', probe, shared=True,
+                          validator=modules_validator(uid, config))
     except Exception as e:
-        print(f"Error checking sales module: {str(e)}")
+        if is_connection_error(e):
+            print(f"Could not check the sales module, Odoo is not reachable: {str(e)}")
+        else:
+            print(f"Error checking sales module: {str(e)}")
         return False
 
-def create_customer(uid, config):
+def create_customer(uid, config, customer=None):
     """
     Create a sample customer if needed or return an existing one.
     
     Args:
         uid (int): User ID for authentication
         config (dict): Configuration dictionary with Odoo connection parameters
+        customer (dict): Customer to match by ref, email or phone (and create
+            if missing) instead of using the first existing customer
         
     Returns:
         int or None: Customer ID if successful, None otherwise
@@ -66,6 +92,10 @@ def create_customer(uid, config):
         print("Cannot create customer because sales module is not available.")
         return None
     
+    if customer:
+        partner_ids = resolve_partners(uid, config, [customer])
+        return partner_ids[0] if partner_ids else None
+    
     try:
         models = get_model_connection(config['url'])
         
@@ -140,7 +170,7 @@ def create_customer(uid, config):
         print(f"Error in create_customer: {str(e)}")
         return None
 
-def create_sale_order(uid, config, product_id, customer_id, warehouse_id, quantity=1):
+def create_sale_order(uid, config, product_id, customer_id, warehouse_id, quantity=1, check_stock=True):
     """
     Create a sales order for a product.
     
@@ -151,6 +181,7 @@ def create_sale_order(uid, config, product_id, customer_id, warehouse_id, quanti
         customer_id (int): Customer ID for the sale
         warehouse_id (int): Warehouse ID for the sale
         quantity (float): Quantity to sell
+        check_stock (bool): Warn when the warehouse does not have enough stock
         
     Returns:
         int or None: Sales order ID if successful, None otherwise
@@ -168,24 +199,38 @@ def create_sale_order(uid, config, product_id, customer_id, warehouse_id, quanti
         print(f"\n--- CREATING SALE ORDER FOR PRODUCT (ID: {product_id}) ---")
         models = get_model_connection(config['url'])
         
-        # Get product info
-        product = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'product.product', 'read',
-            [product_id],
-            {'fields': ['name', 'list_price']}
-        )
+        # Price the line locally with the customer's pricelist
+        quote = quote_basket(uid, config, [(product_id, quantity)], partner_id=customer_id)
         
-        if not product:
-            print(f"Product with ID {product_id} not found")
+        if not quote:
+            print(f"Could not price product with ID {product_id}")
             return None
         
-        product_name = product[0]['name']
-        price = product[0]['list_price']
+        product_name = quote['lines'][0]['name']
+        price = quote['lines'][0]['price_unit']
+        
+        if check_stock:
+            for shortage in check_basket_availability(uid, config, [(product_id, quantity)], warehouse_id):
+                print(f"Warning: only {shortage['available']} units of '{product_name}' available, "
+                      f"ordering {shortage['requested']}")
         
         # Create sale order
         print(f"Creating sale order for {quantity} units of '{product_name}' at {price} per unit")
         
+        if MACRO_CONFIG['enabled']:
+            try:
+                order = sale_order_macro(uid, config, [(product_id, quantity, price)], customer_id=customer_id,
+                                         warehouse_id=warehouse_id, pricelist_id=quote['pricelist_id'])
+            except MacroOutcomeUnknown as e:
+                print(f"{str(e)}. Not creating the order again; check the sales orders in Odoo")
+                return None
+            if order:
+                invalidate_product_availability(config, [product_id])
+                print(f"Sale order created with ID: {order['id']}")
+                print(f"Order: {order['name']}, State: {order['state']}, Total: {order['amount_total']}")
+                return order['id']
+            print("Creating the order step by step instead")
+        
         sale_order_vals = {
             'partner_id': customer_id,
             'date_order': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
@@ -194,30 +239,44 @@ def create_sale_order(uid, config, product_id, customer_id, warehouse_id, quanti
         if warehouse_id:
             sale_order_vals['warehouse_id'] = warehouse_id
         
-        # Create the sale order
-        order_id = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'sale.order', 'create',
-            [sale_order_vals]
-        )
+        if quote['pricelist_id']:
+            sale_order_vals['pricelist_id'] = quote['pricelist_id']
         
-        if not order_id:
-            print("Failed to create sale order")
-            return None
-        
-        # Create order line
+        # Create the order line together with the order
         order_line_vals = {
-            'order_id': order_id,
             'product_id': product_id,
             'product_uom_qty': quantity,
             'price_unit': price
         }
+        sale_order_vals['order_line'] = [(0, 0, order_line_vals)]
         
-        line_id = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'sale.order.line', 'create',
-            [order_line_vals]
-        )
+        # The journal key lets a queued copy of the order find it if the create reached Odoo after all
+        journal_key = None
+        if JOURNAL_CONFIG['enabled']:
+            journal_key = uuid.uuid4().hex
+            sale_order_vals['client_order_ref'] = journal_key
+        
+        def queue_order(error):
+            queue_sale_order(config, customer_id, [(product_id, quantity, price)], warehouse_id,
+                             quote['pricelist_id'], key=journal_key)
+            print(f"Odoo could not be reached ({str(error)}); sale queued in the write journal as {journal_key}")
+        
+        # Create the sale order
+        try:
+            order_id = models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'sale.order', 'create',
+                [sale_order_vals]
+            )
+        except Exception as e:
+            if journal_key and is_connection_error(e):
+                queue_order(e)
+                return None
+            raise
+        
+        if not order_id:
+            print("Failed to create sale order")
+            return None
         
         print(f"Sale order created with ID: {order_id}")
         
@@ -230,7 +289,13 @@ def create_sale_order(uid, config, product_id, customer_id, warehouse_id, quanti
             )
             
             print("Sale order confirmed")
+            # Confirmed orders reserve stock, changing the forecast quantity
+            invalidate_product_availability(config, [product_id])
         except Exception as e:
+            if journal_key and is_connection_error(e):
+                # The queued copy finds the order by its key and confirms it
+                queue_order(e)
+                return order_id
             print(f"Warning: Could not confirm sale order: {str(e)}")
         
         # Get the details of the created order
@@ -250,16 +315,144 @@ def create_sale_order(uid, config, product_id, customer_id, warehouse_id, quanti
         print(f"Error in create_sale_order: {str(e)}")
         return None
 
-def generate_sales_report(uid, config):
+def create_order_from_basket(uid, config, customer_id, basket, warehouse_id=None, confirm=True):
+    """
+    Create a sales order with several lines in one request.
+    
+    Lines are priced locally with the customer's pricelist and created
+    together with the order as one2many commands. With server macros enabled
+    the order is created, confirmed and read back in a single request.
+    
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        customer_id (int): Customer ID for the sale
+        basket (list): List of (product_id, quantity) tuples
+        warehouse_id (int): Warehouse ID for the sale
+        confirm (bool): Confirm the order after creating it
+        
+    Returns:
+        dict or None: Order id, name, state, amount_total and the priced lines,
+            or None if the order could not be created; an order queued in the
+            write journal has state 'queued' and its journal key under 'queued'
+    """
+    if not uid or not customer_id or not basket:
+        print("Missing required parameters for creating sale order")
+        return None
+    
+    if not check_sales_module_available(uid, config):
+        return None
+    
+    try:
+        models = get_model_connection(config['url'])
+        
+        quote = quote_basket(uid, config, basket, partner_id=customer_id)
+        if not quote:
+            return None
+        
+        if MACRO_CONFIG['enabled']:
+            try:
+                order = sale_order_macro(uid, config,
+                                         [(line['product_id'], line['quantity'], line['price_unit']) for line in quote['lines']],
+                                         customer_id=customer_id, warehouse_id=warehouse_id,
+                                         pricelist_id=quote['pricelist_id'], confirm=confirm)
+            except MacroOutcomeUnknown as e:
+                print(f"{str(e)}. Not creating the order again; check the sales orders in Odoo")
+                return None
+            if order:
+                if confirm:
+                    invalidate_product_availability(config, [line['product_id'] for line in quote['lines']])
+                result = {key: order[key] for key in ('id', 'name', 'state', 'amount_total')}
+                result['lines'] = quote['lines']
+                return result
+        
+        sale_order_vals = {
+            'partner_id': customer_id,
+            'date_order': datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S'),
+            'order_line': [(0, 0, {
+                'product_id': line['product_id'],
+                'product_uom_qty': line['quantity'],
+                'price_unit': line['price_unit'],
+            }) for line in quote['lines']],
+        }
+        if warehouse_id:
+            sale_order_vals['warehouse_id'] = warehouse_id
+        if quote['pricelist_id']:
+            sale_order_vals['pricelist_id'] = quote['pricelist_id']
+        
+        journal_key = None
+        if JOURNAL_CONFIG['enabled']:
+            journal_key = uuid.uuid4().hex
+            sale_order_vals['client_order_ref'] = journal_key
+        
+        try:
+            order_id = models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'sale.order', 'create',
+                [sale_order_vals]
+            )
+            
+            if confirm:
+                models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    'sale.order', 'action_confirm',
+                    [[order_id]]
+                )
+                invalidate_product_availability(config, [line['product_id'] for line in quote['lines']])
+        except Exception as e:
+            if not (journal_key and is_connection_error(e)):
+                raise
+            queue_sale_order(config, customer_id,
+                             [(line['product_id'], line['quantity'], line['price_unit']) for line in quote['lines']],
+                             warehouse_id, quote['pricelist_id'], confirm, key=journal_key)
+            print(f"Odoo could not be reached ({str(e)}); sale queued in the write journal as {journal_key}")
+            return {'id': None, 'name': None, 'state': 'queued', 'amount_total': quote['total'],
+                    'queued': journal_key, 'lines': quote['lines']}
+        
+        order = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'sale.order', 'read',
+            [order_id],
+            {'fields': ['name', 'state', 'amount_total']}
+        )
+        result = dict(order[0]) if order else {'id': order_id}
+        result['lines'] = quote['lines']
+        return result
+        
+    except Exception as e:
+        print(f"Error in create_order_from_basket: {str(e)}")
+        return None
+
+def _many2one_id(value):
+    """Return the id of a many2one value read over XML-RPC ([id, name] or False)."""
+    if isinstance(value, (list, tuple)) and value:
+        return value[0]
+    return value or 0
+
+def _many2one_name(value, default="Unknown"):
+    """Return the display name of a many2one value read over XML-RPC."""
+    if isinstance(value, (list, tuple)) and len(value) > 1:
+        return value[1]
+    return default
+
+def generate_sales_report(uid, config, sink=None):
     """
     Generate sales report by location.
     
+    Orders and order lines are streamed page by page straight into the sink,
+    so exporting every order line does not load them all into memory.
+    
     Args:
         uid (int): User ID for authentication
         config (dict): Configuration dictionary with Odoo connection parameters
+        sink (object): Report sink from report_output (defaults to console table)
+        
+    Returns:
+        bool: True if the sales report was written, False if it failed or an
+            inventory report was written instead
     """
     if not uid:
-        return
+        return False
     
     if not check_sales_module_available(uid, config):
         print("Cannot generate sales report because sales module is not available.")
@@ -268,116 +461,144 @@ def generate_sales_report(uid, config):
         try:
             print("\nGenerating inventory report as an alternative...")
             from inventory_operations import generate_inventory_report
-            generate_inventory_report(uid, config)
+            generate_inventory_report(uid, config, sink)
         except Exception as e:
             print(f"Could not generate alternative report: {str(e)}")
-        return
+        return False
+    
+    sink = sink or ConsoleTableSink()
     
     try:
         print("\n--- GENERATING SALES REPORT ---")
         models = get_model_connection(config['url'])
+        page_size = REPORT_CONFIG['page_size']
         
-        # Get warehouses
-        warehouses = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'stock.warehouse', 'search_read',
-            [[]],
-            {'fields': ['id', 'name']}
-        )
-        
-        # Create warehouse lookup dictionary
-        warehouse_dict = {wh['id']: wh['name'] for wh in warehouses}
-        
-        # Get confirmed sales orders
-        sales = models.execute_kw(
-            config['db_name'], uid, config['password'],
-            'sale.order', 'search_read',
-            [[['state', 'in', ['sale', 'done']]]],
-            {'fields': ['name', 'warehouse_id', 'amount_total', 'date_order', 'partner_id']}
-        )
-        
-        if not sales:
-            print("No confirmed sales orders found")
-            return
+        # Names of active warehouses; orders of archived ones fall back to the name read with the order
+        warehouse_names = {wh['id']: wh['name'] for wh in load_warehouses(uid, config, models)}
         
-        # Organize sales by warehouse
-        sales_by_warehouse = {}
-        
-        for sale in sales:
-            warehouse_id = sale.get('warehouse_id', (0, 'Unknown'))[0] if isinstance(sale.get('warehouse_id'), tuple) else sale.get('warehouse_id', 0)
-            
-            if warehouse_id not in sales_by_warehouse:
-                sales_by_warehouse[warehouse_id] = []
-            
-            sales_by_warehouse[warehouse_id].append(sale)
-        
-        # Print location-wise sales report
-        print("\nLocation-wise Sales Report:")
-        print("-" * 100)
-        print(f"{'Warehouse':<20} {'Order':<15} {'Customer':<25} {'Date':<20} {'Total':<10}")
-        print("-" * 100)
+        # Stream all confirmed sales orders once
+        sink.begin_section('orders', "Location-wise Sales Report", [
+            ReportColumn('warehouse', 'Warehouse', 20),
+            ReportColumn('order', 'Order', 15),
+            ReportColumn('customer', 'Customer', 25),
+            ReportColumn('date', 'Date', 20),
+            ReportColumn('total', 'Total', 10, '.2f'),
+        ], rule_width=100)
         
+        order_count = 0
         total_sales = 0
         
-        for wh_id, orders in sales_by_warehouse.items():
-            warehouse_name = warehouse_dict.get(wh_id, "Unknown")
-            
+        pages = iter_search_read(
+            models, config, uid, 'sale.order',
+            [['state', 'in', ['sale', 'done']]],
+            ['name', 'warehouse_id', 'amount_total', 'date_order', 'partner_id'],
+            page_size=page_size
+        )
+        
+        for orders in pages:
             for order in orders:
-                order_name = order['name']
-                customer_name = order['partner_id'][1] if isinstance(order.get('partner_id'), tuple) else "Unknown"
-                date_order = order.get('date_order', 'Unknown')
                 amount = order.get('amount_total', 0)
-                
-                print(f"{warehouse_name:<20} {order_name:<15} {customer_name:<25} {date_order:<20} {amount:<10.2f}")
+                warehouse = order.get('warehouse_id')
+                sink.write_row({
+                    'warehouse': warehouse_names.get(_many2one_id(warehouse)) or _many2one_name(warehouse),
+                    'order': order['name'],
+                    'customer': _many2one_name(order.get('partner_id')),
+                    'date': order.get('date_order', 'Unknown'),
+                    'total': amount
+                })
+                order_count += 1
                 total_sales += amount
+            sink.flush()
         
-        # Print consolidated sales report
-        print("\nConsolidated Sales Report:")
-        print("-" * 50)
-        print(f"Total number of orders: {len(sales)}")
-        print(f"Total sales amount: {total_sales:.2f}")
+        sink.end_section()
         
-        # Get sales breakdown by product
-        print("\nSales Breakdown by Product:")
-        print("-" * 70)
-        print(f"{'Product':<30} {'Quantity':<10} {'Revenue':<15} {'Profit':<15}")
-        print("-" * 70)
+        if not order_count:
+            print("No confirmed sales orders found")
+            return True
         
-        # Get all order lines
-        order_ids = [sale['id'] for sale in sales]
+        # Write consolidated sales report
+        sink.begin_section('summary', "Consolidated Sales Report", [
+            ReportColumn('metric', 'Metric', 30),
+            ReportColumn('value', 'Value', 15),
+        ], rule_width=50)
+        sink.write_row({'metric': 'Total number of orders', 'value': order_count})
+        sink.write_row({'metric': 'Total sales amount', 'value': f"{total_sales:.2f}"})
+        sink.end_section()
         
-        if order_ids:
-            try:
-                order_lines = models.execute_kw(
-                    config['db_name'], uid, config['password'],
-                    'sale.order.line', 'search_read',
-                    [[['order_id', 'in', order_ids]]],
-                    {'fields': ['product_id', 'product_uom_qty', 'price_subtotal', 'margin']}
-                )
-                
-                product_sales = {}
-                
+        # Stream order lines once: exported row by row and summed per product
+        try:
+            sink.begin_section('order_lines', "Order Lines", [
+                ReportColumn('order_id', 'Order ID', 10),
+                ReportColumn('product_id', 'Product ID', 10),
+                ReportColumn('product', 'Product', 30),
+                ReportColumn('quantity', 'Quantity', 10, '.2f'),
+                ReportColumn('revenue', 'Revenue', 15, '.2f'),
+                ReportColumn('profit', 'Profit', 15, '.2f'),
+            ], detail=True)
+            
+            pages = iter_search_read(
+                models, config, uid, 'sale.order.line',
+                [['order_id.state', 'in', ['sale', 'done']]],
+                ['order_id', 'product_id', 'product_uom_qty', 'price_subtotal', 'margin'],
+                page_size=page_size
+            )
+            
+            product_sales = {}
+            
+            for order_lines in pages:
                 for line in order_lines:
-                    product_id = line['product_id'][0] if isinstance(line.get('product_id'), tuple) else line.get('product_id', 0)
+                    product_id = _many2one_id(line.get('product_id'))
+                    product_name = _many2one_name(line.get('product_id'), f"Product {product_id}")
+                    quantity = line.get('product_uom_qty', 0)
+                    revenue = line.get('price_subtotal', 0)
+                    profit = line.get('margin', 0) or 0
+                    
+                    sink.write_row({
+                        'order_id': _many2one_id(line.get('order_id')),
+                        'product_id': product_id,
+                        'product': product_name,
+                        'quantity': quantity,
+                        'revenue': revenue,
+                        'profit': profit
+                    })
                     
                     if product_id not in product_sales:
                         product_sales[product_id] = {
-                            'name': line['product_id'][1] if isinstance(line.get('product_id'), tuple) else f"Product {product_id}",
+                            'name': product_name,
                             'quantity': 0,
                             'revenue': 0,
                             'profit': 0
                         }
                     
-                    product_sales[product_id]['quantity'] += line.get('product_uom_qty', 0)
-                    product_sales[product_id]['revenue'] += line.get('price_subtotal', 0)
-                    product_sales[product_id]['profit'] += line.get('margin', 0)
-                
-                # Print product breakdown
-                for product_id, data in product_sales.items():
-                    print(f"{data['name']:<30} {data['quantity']:<10.2f} {data['revenue']:<15.2f} {data['profit']:<15.2f}")
+                    product_sales[product_id]['quantity'] += quantity
+                    product_sales[product_id]['revenue'] += revenue
+                    product_sales[product_id]['profit'] += profit
+                sink.flush()
+            
+            sink.end_section()
+            
+            # Write product breakdown
+            sink.begin_section('products', "Sales Breakdown by Product", [
+                ReportColumn('product', 'Product', 30),
+                ReportColumn('quantity', 'Quantity', 10, '.2f'),
+                ReportColumn('revenue', 'Revenue', 15, '.2f'),
+                ReportColumn('profit', 'Profit', 15, '.2f'),
+            ], rule_width=70)
+            
+            for product_id, data in product_sales.items():
+                sink.write_row({
+                    'product': data['name'],
+                    'quantity': data['quantity'],
+                    'revenue': data['revenue'],
+                    'profit': data['profit']
+                })
             
-            except Exception as e:
-                print(f"Could not generate product breakdown: {str(e)}")
+            sink.end_section()
+        
+        except Exception as e:
+            print(f"Could not generate product breakdown: {str(e)}")
+            return False
+        return True
         
     except Exception as e:
         print(f"Error generating sales report: {str(e)}")
@@ -385,6 +606,9 @@ def generate_sales_report(uid, config):
         try:
             print("\nGenerating inventory report as an alternative...")
             from inventory_operations import generate_inventory_report
-            generate_inventory_report(uid, config)
+            generate_inventory_report(uid, config, sink)
         except Exception as e2:
-            print(f"Could not generate alternative report: {str(e2)}")
\ No newline at end of file
+            print(f"Could not generate alternative report: {str(e2)}")
+        return False
+    finally:
+        sink.close()
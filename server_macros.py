@@ -0,0 +1,312 @@
+"""
+Server-side macros: multi-step workflows run by Odoo in a single request.
+
+A macro is the Python code of an ir.actions.server record. It is installed
+on first use, receives its parameters in the context of the call and returns
+the IDs it created, so a workflow such as adding stock, creating an order
+with its lines and confirming it costs one round trip instead of one per
+step. The whole macro runs in one server transaction: if any step fails
+nothing is saved.
+
+A macro that fails with a Fault, or whose request never reached Odoo, can be
+replaced by the step-by-step requests. Any other error (a timeout or a lost
+connection after sending) leaves it unknown whether the work was saved, so it
+raises MacroOutcomeUnknown instead. Sale order macros carry a random
+client_order_ref, which lets them find an order saved despite the error.
+
+Installing a macro needs the rights to create server actions (Settings
+access). The action name carries a digest of its code, so changed macros are
+reinstalled and the old versions removed.
+"""
+import hashlib
+import socket
+import uuid
+import xmlrpc.client
+from cache import get_cached, invalidate
+from connection import get_model_connection, is_unsent_error
+from partner_resolver import resolve_partners
+
+MACRO_PREFIX = 'odoo-integration macro'
+
+# Shared first lines: the parameters of the run and the result dict
+_HEADER = """
+params = env.context.get('macro_params') or {}
+result = {}
+"""
+
+# Add stock: params['stock'] is a list of [product_id, location_id, quantity]
+_ADD_STOCK = """
+quant_ids = []
+for product_id, location_id, quantity in params.get('stock') or []:
+    product = env['product.product'].browse(product_id)
+    location = env['stock.location'].browse(location_id)
+    env['stock.quant']._update_available_quantity(product, location, quantity)
+    quant = env['stock.quant'].search([('product_id', '=', product_id), ('location_id', '=', location_id)], limit=1)
+    quant_ids.append(quant.id)
+result['quant_ids'] = quant_ids
+"""
+
+# Sale order: customer_id, lines as [product_id, quantity, price_unit or False]
+_SALE_ORDER = """
+partner_id = params['customer_id']
+order_vals = {'partner_id': partner_id, 'order_line': []}
+for key in ('warehouse_id', 'pricelist_id', 'client_order_ref'):
+    if params.get(key):
+        order_vals[key] = params[key]
+for product_id, quantity, price_unit in params['lines']:
+    line_vals = {'product_id': product_id, 'product_uom_qty': quantity}
+    if price_unit is not False:
+        line_vals['price_unit'] = price_unit
+    order_vals['order_line'].append((0, 0, line_vals))
+
+order = env['sale.order'].create(order_vals)
+if params.get('confirm', True):
+    order.action_confirm()
+result.update({
+    'partner_id': partner_id,
+    'id': order.id,
+    'name': order.name,
+    'state': order.state,
+    'amount_total': order.amount_total,
+    'line_ids': order.order_line.ids,
+    'picking_ids': order.picking_ids.ids,
+})
+"""
+
+_FOOTER = """
+action = result
+"""
+
+class MacroOutcomeUnknown(Exception):
+    """
+    A macro request failed after it was sent, so Odoo may have saved its work.
+
+    Running the steps again could apply them twice, so the caller must not
+    fall back to the step-by-step requests.
+
+    Args:
+        name (str): Macro name
+        error (Exception): The error raised by the request
+    """
+
+    def __init__(self, name, error):
+        super().__init__(f"Unknown whether server macro '{name}' was applied: {str(error)}")
+        self.name = name
+        self.error = error
+
+# Macro name: (model the action is bound to, code)
+MACROS = {
+    'sale_order': ('sale.order', _HEADER + _SALE_ORDER + _FOOTER),
+    'stock_and_sale': ('sale.order', _HEADER + _ADD_STOCK + _SALE_ORDER + _FOOTER),
+}
+
+def _action_name(name):
+    """Name of the server action of a macro, including a digest of its code."""
+    digest = hashlib.sha1(MACROS[name][1].encode('utf-8')).hexdigest()[:10]
+    return f"{MACRO_PREFIX} {name} {digest}"
+
+def _install_macro(uid, config, models, name):
+    """
+    Find or create the server action of a macro and remove outdated versions.
+
+    Returns:
+        int: ID of the ir.actions.server record
+    """
+    model, code = MACROS[name]
+    action_name = _action_name(name)
+
+    actions = models.execute_kw(
+        config['db_name'], uid, config['password'],
+        'ir.actions.server', 'search_read',
+        [[['name', '=like', f"{MACRO_PREFIX} {name} %"]]],
+        {'fields': ['id', 'name']}
+    )
+    current = [action['id'] for action in actions if action['name'] == action_name]
+    outdated = [action['id'] for action in actions if action['name'] != action_name]
+    if outdated:
+        models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'ir.actions.server', 'unlink',
+            [outdated]
+        )
+    if current:
+        return current[0]
+
+    model_ids = models.execute_kw(
+        config['db_name'], uid, config['password'],
+        'ir.model', 'search',
+        [[['model', '=', model]]], {'limit': 1}
+    )
+    if not model_ids:
+        raise ValueError(f"Model {model} is not installed")
+
+    action_id = models.execute_kw(
+        config['db_name'], uid, config['password'],
+        'ir.actions.server', 'create',
+        [{'name': action_name, 'model_id': model_ids[0], 'state': 'code', 'code': code.strip() + '\n'}]
+    )
+    print(f"Installed server macro '{name}' (action ID: {action_id})")
+    return action_id
+
+def run_macro(uid, config, name, params):
+    """
+    Run a macro on the server with one request, installing it first if needed.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        name (str): Macro name, a key of MACROS
+        params (dict): Parameters of the macro (XML-RPC serializable)
+
+    Returns:
+        dict or None: Values returned by the macro, or None if it failed
+            without saving anything
+
+    Raises:
+        MacroOutcomeUnknown: The request failed after it was sent, other than
+            with a Fault
+    """
+    if not uid:
+        return None
+
+    models = get_model_connection(config['url'])
+    cache_key = f"server.macro.{name}"
+    sent = False
+
+    try:
+        for attempt in range(2):
+            action_id = get_cached(config, cache_key, lambda: _install_macro(uid, config, models, name),
+                                   ttl=float('inf'), shared=True)
+            try:
+                sent = True
+                return models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    'ir.actions.server', 'run',
+                    [[action_id]], {'context': {'macro_params': params}}
+                ) or {}
+            except xmlrpc.client.Fault:
+                # The macro's transaction was rolled back
+                sent = False
+                invalidate(config, cache_key)
+                # Reinstall once if the action was deleted since it was cached
+                exists = models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    'ir.actions.server', 'search_count',
+                    [[['id', '=', action_id]]]
+                )
+                if exists or attempt:
+                    raise
+    except xmlrpc.client.Fault as e:
+        print(f"Error running server macro '{name}': {e.faultString.strip().splitlines()[-1]}")
+    except Exception as e:
+        if sent and not is_unsent_error(e):
+            raise MacroOutcomeUnknown(name, e) from e
+        print(f"Error running server macro '{name}': {str(e)}")
+    return None
+
+def _find_macro_order(uid, config, reference, error):
+    """
+    Look up the order of a sale order macro whose outcome is unknown.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        reference (str): client_order_ref the macro gave the order
+        error (MacroOutcomeUnknown): The error of the macro request
+
+    Returns:
+        dict or None: The order as returned by the macro (without quant_ids),
+            or None if the macro saved nothing
+
+    Raises:
+        MacroOutcomeUnknown: The lookup failed as well, or found nothing
+            after a timeout
+    """
+    models = get_model_connection(config['url'])
+    try:
+        orders = models.execute_kw(
+            config['db_name'], uid, config['password'],
+            'sale.order', 'search_read',
+            [[['client_order_ref', '=', reference]]],
+            {'fields': ['id', 'name', 'state', 'amount_total', 'partner_id', 'order_line', 'picking_ids'],
+             'limit': 1}
+        )
+    except Exception as e:
+        print(f"Could not look up order {reference}: {str(e)}")
+        raise error
+    if not orders:
+        if isinstance(error.error, (TimeoutError, socket.timeout)):
+            # A request that timed out may still be running in Odoo
+            print(f"No order {reference} saved yet, but the macro may still be running")
+            raise error
+        print(f"{str(error)}; no order {reference} was saved")
+        return None
+    order = orders[0]
+    print(f"Server macro '{error.name}' failed to answer ({str(error.error)}) but saved order {order['name']}")
+    return {
+        'partner_id': order['partner_id'][0] if order['partner_id'] else False,
+        'id': order['id'],
+        'name': order['name'],
+        'state': order['state'],
+        'amount_total': order['amount_total'],
+        'line_ids': order['order_line'],
+        'picking_ids': order['picking_ids'],
+    }
+
+def sale_order_macro(uid, config, lines, customer_id=None, customer=None, warehouse_id=None,
+                     pricelist_id=None, stock=None, confirm=True):
+    """
+    Create (and confirm) a sales order in one request, optionally adding stock first.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        lines (list): List of (product_id, quantity, price_unit) tuples; a
+            price_unit of None lets Odoo price the line
+        customer_id (int): Customer ID for the sale
+        customer (dict): Customer to match by ref, email or phone (and create
+            if missing) when no customer_id is given, see
+            partner_resolver.resolve_partners
+        warehouse_id (int): Warehouse ID for the sale
+        pricelist_id (int): Pricelist of the order
+        stock (list): List of (product_id, location_id, quantity) tuples to
+            add to stock before the order is created
+        confirm (bool): Confirm the order after creating it
+
+    Returns:
+        dict or None: partner_id, id, name, state, amount_total, line_ids and
+            picking_ids of the order (plus quant_ids when stock was added),
+            or None if the macro failed without saving anything
+
+    Raises:
+        MacroOutcomeUnknown: The request failed after it was sent and the
+            order could not be looked up
+    """
+    params = {
+        'lines': [[int(product_id), float(quantity), False if price_unit is None else float(price_unit)]
+                  for product_id, quantity, price_unit in lines],
+        'confirm': confirm,
+        'client_order_ref': uuid.uuid4().hex,
+    }
+    if not customer_id and customer:
+        # Matched on the client so stored emails and phones compare normalized
+        customer_id = (resolve_partners(uid, config, [customer]) or [None])[0]
+        if not customer_id:
+            print(f"Could not find or create customer {customer.get('name')}")
+            return None
+    if not customer_id:
+        print("Missing customer for the sale order macro")
+        return None
+    params['customer_id'] = int(customer_id)
+    if warehouse_id:
+        params['warehouse_id'] = int(warehouse_id)
+    if pricelist_id:
+        params['pricelist_id'] = int(pricelist_id)
+    if stock:
+        params['stock'] = [[int(product_id), int(location_id), float(quantity)]
+                           for product_id, location_id, quantity in stock]
+
+    try:
+        return run_macro(uid, config, 'stock_and_sale' if stock else 'sale_order', params)
+    except MacroOutcomeUnknown as e:
+        return _find_macro_order(uid, config, params['client_order_ref'], e)
@@ -0,0 +1,353 @@
+"""
+Long-running service mode with a local JSON API.
+
+The service authenticates once, keeps the shared connections, scheduler and
+master-data caches warm, and serves requests from other local programs on a
+thread per request, so each call only pays for the Odoo requests it needs.
+
+Endpoints (JSON in, JSON out):
+    GET  /health                        Service and scheduler status
+    GET  /warehouses                    Warehouses with their stock locations
+    GET  /availability?product_ids=1,2  On-hand and forecast stock per warehouse
+    POST /quote                         Price a basket
+    POST /orders                        Create (and confirm) a sales order, or queue it
+    GET  /journal                       Writes waiting in the write journal
+    POST /stock/adjust                  Add stock of a product to a location
+    POST /reports/inventory             Inventory report rows per section
+    POST /reports/sales                 Sales report rows per section
+    POST /cache/invalidate              Drop cached master data
+
+Write endpoints (orders, stock adjustments, cache invalidation) are only
+served when SERVICE_CONFIG['token'] is set, and then need it in the
+X-Api-Token header. POST bodies must be sent as application/json and the Host
+header must name the service, so web pages open in a browser on the same
+machine cannot call the API through cross-site requests or DNS rebinding.
+"""
+import hmac
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+from cache import invalidate
+from config import SERVICE_CONFIG
+from connection import get_model_connection
+from deadlines import DeadlineExceeded, deadline
+from inventory_operations import (
+    load_warehouses,
+    add_product_to_warehouse,
+    generate_inventory_report,
+    get_product_availability
+)
+from location_index import get_location_index
+from partner_resolver import resolve_partners
+from pricelist_engine import get_pricelist_engine, quote_basket
+from product_operations import get_product_schema
+from report_output import MemorySink
+from request_scheduler import PRIORITY_INTERACTIVE, get_scheduler, request_priority
+from sales_operations import check_sales_module_available, create_order_from_basket, generate_sales_report
+from write_journal import FAILED, REVIEW, get_write_journal, queue_sale_order
+
+class ServiceError(Exception):
+    """Error returned to the API caller with an HTTP status."""
+
+    def __init__(self, message, status=400):
+        super().__init__(message)
+        self.status = status
+
+def _require(payload, *keys):
+    """Return the given keys of a request body, failing when one is missing."""
+    missing = [key for key in keys if payload.get(key) in (None, '', [])]
+    if missing:
+        raise ServiceError(f"Missing field(s): {', '.join(missing)}")
+    return [payload[key] for key in keys]
+
+def _number(value, name, kind=int):
+    """Convert a request value to an int or float, failing with a 400 when it is not a number."""
+    if value in (None, ''):
+        return None
+    try:
+        return kind(value)
+    except (TypeError, ValueError):
+        raise ServiceError(f"{name} must be a number")
+
+def _basket(payload):
+    """Read the order lines of a request body as (product_id, quantity) tuples."""
+    lines, = _require(payload, 'lines')
+    try:
+        return [(int(line['product_id']), float(line.get('quantity', 1))) for line in lines]
+    except (AttributeError, KeyError, TypeError, ValueError):
+        raise ServiceError("Each line needs a product_id and a numeric quantity")
+
+class OdooService:
+    """
+    Operations exposed by the service, bound to one authenticated session.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+    """
+
+    def __init__(self, uid, config):
+        self.uid = uid
+        self.config = config
+        self.started = time.time()
+        self.requests = 0
+        self.lock = threading.Lock()
+        self.routes = {
+            ('GET', '/health'): self.health,
+            ('GET', '/warehouses'): self.warehouses,
+            ('GET', '/availability'): self.availability,
+            ('GET', '/journal'): self.journal,
+            ('POST', '/quote'): self.quote,
+            ('POST', '/orders'): self.create_order,
+            ('POST', '/stock/adjust'): self.adjust_stock,
+            ('POST', '/reports/inventory'): self.inventory_report,
+            ('POST', '/reports/sales'): self.sales_report,
+            ('POST', '/cache/invalidate'): self.invalidate_cache,
+        }
+        # Endpoints that change data in Odoo or in the service
+        self.write_routes = {('POST', '/orders'), ('POST', '/stock/adjust'), ('POST', '/cache/invalidate')}
+
+    def warm_up(self):
+        """Load the master data most requests need before the first request arrives."""
+        print("Warming caches...")
+        models = get_model_connection(self.config['url'])
+        for name, load in [
+            ('warehouses', lambda: load_warehouses(self.uid, self.config, models)),
+            ('location index', lambda: get_location_index(self.uid, self.config)),
+            ('product schema', lambda: get_product_schema(self.uid, self.config)),
+            ('sales module check', lambda: check_sales_module_available(self.uid, self.config)),
+            ('pricelists', lambda: get_pricelist_engine(self.uid, self.config)),
+        ]:
+            try:
+                load()
+            except Exception as e:
+                print(f"Could not preload {name}: {str(e)}")
+
+    def dispatch(self, method, path, query, payload):
+        """
+        Run the operation for a request.
+
+        Returns:
+            tuple: (HTTP status, JSON-serializable body)
+        """
+        handler = self.routes.get((method, path))
+        if not handler:
+            return 404, {'error': f"No endpoint {method} {path}"}
+
+        with self.lock:
+            self.requests += 1
+        try:
+            with request_priority(PRIORITY_INTERACTIVE), deadline(SERVICE_CONFIG['request_deadline']):
+                return 200, handler(query, payload)
+        except ServiceError as e:
+            return e.status, {'error': str(e)}
+        except DeadlineExceeded as e:
+            return 504, {'error': str(e)}
+        except Exception as e:
+            print(f"Error handling {method} {path}: {str(e)}")
+            return 500, {'error': str(e)}
+
+    def health(self, query, payload):
+        """Service status, request count and scheduler state."""
+        return {
+            'status': 'ok',
+            'uid': self.uid,
+            'uptime': round(time.time() - self.started, 1),
+            'requests': self.requests,
+            'scheduler': get_scheduler(self.config['url']).stats(),
+        }
+
+    def warehouses(self, query, payload):
+        """Warehouses with their stock locations."""
+        models = get_model_connection(self.config['url'])
+        return load_warehouses(self.uid, self.config, models)
+
+    def availability(self, query, payload):
+        """On-hand and forecast stock of the products in product_ids."""
+        try:
+            product_ids = [int(value) for value in query.get('product_ids', [''])[0].split(',') if value]
+        except ValueError:
+            raise ServiceError("product_ids must be a comma-separated list of IDs")
+        if not product_ids:
+            raise ServiceError("Missing product_ids")
+        availability = get_product_availability(self.uid, self.config, product_ids)
+        # JSON object keys are strings
+        return {str(product_id): entry for product_id, entry in availability.items()}
+
+    def _customer_id(self, payload):
+        """Customer of an order: customer_id, or a customer dict matched by ref/email/phone."""
+        if payload.get('customer_id'):
+            return _number(payload['customer_id'], 'customer_id')
+        if isinstance(payload.get('customer'), dict):
+            partner_ids = resolve_partners(self.uid, self.config, [payload['customer']])
+            if partner_ids and partner_ids[0]:
+                return partner_ids[0]
+            raise ServiceError("Could not resolve the customer", 422)
+        raise ServiceError("Missing field(s): customer_id or customer")
+
+    def quote(self, query, payload):
+        """Price the lines of a basket with the customer's or a given pricelist."""
+        quote = quote_basket(self.uid, self.config, _basket(payload),
+                             partner_id=_number(payload.get('customer_id'), 'customer_id'),
+                             pricelist_id=_number(payload.get('pricelist_id'), 'pricelist_id'))
+        if quote is None:
+            raise ServiceError("Could not price the basket", 422)
+        return quote
+
+    def create_order(self, query, payload):
+        """Create a sales order from customer_id (or customer) and lines, or queue it with queue=true."""
+        basket = _basket(payload)
+        warehouse_id = _number(payload.get('warehouse_id'), 'warehouse_id')
+        if payload.get('queue'):
+            customer_id, = _require(payload, 'customer_id')
+            key = queue_sale_order(self.config, _number(customer_id, 'customer_id'), basket,
+                                   warehouse_id=warehouse_id, confirm=payload.get('confirm', True),
+                                   key=payload.get('key'))
+            return {'state': 'queued', 'queued': key}
+        order = create_order_from_basket(self.uid, self.config, self._customer_id(payload), basket,
+                                         warehouse_id=warehouse_id,
+                                         confirm=payload.get('confirm', True))
+        if order is None:
+            raise ServiceError("Could not create the order", 422)
+        return order
+
+    def journal(self, query, payload):
+        """Operations per state in the write journal, with the failed and flagged ones."""
+        journal = get_write_journal(self.config)
+        return {'counts': journal.counts(), 'attention': journal.operations([REVIEW, FAILED])}
+
+    def adjust_stock(self, query, payload):
+        """Add a quantity of a product to a location."""
+        product_id, location_id, quantity = _require(payload, 'product_id', 'location_id', 'quantity')
+        product_id = _number(product_id, 'product_id')
+        location_id = _number(location_id, 'location_id')
+        quantity = _number(quantity, 'quantity', float)
+        if not add_product_to_warehouse(self.uid, self.config, product_id, location_id, quantity):
+            raise ServiceError("Could not add the stock", 422)
+        return {'product_id': product_id, 'location_id': location_id, 'added': quantity}
+
+    def inventory_report(self, query, payload):
+        """Rows of the inventory report, grouped by section."""
+        sink = MemorySink()
+        generate_inventory_report(self.uid, self.config, sink)
+        return sink.sections
+
+    def sales_report(self, query, payload):
+        """Rows of the sales report, grouped by section."""
+        sink = MemorySink()
+        generate_sales_report(self.uid, self.config, sink)
+        return sink.sections
+
+    def invalidate_cache(self, query, payload):
+        """Drop one cached value (key) or all cached master data."""
+        invalidate(self.config, payload.get('key'))
+        return {'invalidated': payload.get('key') or 'all'}
+
+# Host header values accepted besides the address the service listens on
+LOCAL_HOST_NAMES = {'localhost', '127.0.0.1', '::1'}
+
+def _host_name(host):
+    """Host name of a Host header value, without the port."""
+    if host.startswith('['):
+        return host[1:].split(']', 1)[0]
+    return host.rsplit(':', 1)[0] if host.count(':') == 1 else host
+
+def _make_handler(service):
+    """Build the request handler class bound to a service."""
+
+    class ServiceRequestHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def _respond(self, status, body, close=False):
+            data = json.dumps(body, default=str).encode('utf-8')
+            self.send_response(status)
+            self.send_header('Content-Type', 'application/json')
+            self.send_header('Content-Length', str(len(data)))
+            if close:
+                # The request body was not read, so the rest of the stream cannot be parsed as a request
+                self.send_header('Connection', 'close')
+                self.close_connection = True
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _handle(self, method):
+            allowed_hosts = LOCAL_HOST_NAMES | {self.server.server_address[0]} | set(SERVICE_CONFIG['allowed_hosts'])
+            if _host_name(self.headers.get('Host', '')).lower() not in allowed_hosts:
+                self._respond(403, {'error': "Host not allowed; add it to SERVICE_CONFIG['allowed_hosts']"}, close=True)
+                return
+
+            token = SERVICE_CONFIG['token']
+            if token and not hmac.compare_digest(self.headers.get('X-Api-Token', '').encode('utf-8'),
+                                                 token.encode('utf-8')):
+                self._respond(401, {'error': "Invalid or missing X-Api-Token"}, close=True)
+                return
+
+            url = urlparse(self.path)
+            path = url.path.rstrip('/') or '/'
+            if not token and (method, path) in service.write_routes:
+                self._respond(403, {'error': "Write endpoints are disabled until SERVICE_CONFIG['token'] is set"},
+                              close=True)
+                return
+
+            if method == 'POST' and self.headers.get_content_type() != 'application/json':
+                self._respond(415, {'error': "Send the request body as application/json"}, close=True)
+                return
+
+            payload = {}
+            try:
+                length = int(self.headers.get('Content-Length') or 0)
+            except ValueError:
+                length = -1
+            if length < 0:
+                self._respond(400, {'error': "Invalid Content-Length"}, close=True)
+                return
+            if length:
+                try:
+                    payload = json.loads(self.rfile.read(length))
+                except ValueError:
+                    self._respond(400, {'error': "Request body is not valid JSON"})
+                    return
+                if not isinstance(payload, dict):
+                    self._respond(400, {'error': "Request body must be a JSON object"})
+                    return
+
+            status, body = service.dispatch(method, path, parse_qs(url.query), payload)
+            self._respond(status, body)
+
+        def do_GET(self):
+            self._handle('GET')
+
+        def do_POST(self):
+            self._handle('POST')
+
+        def log_message(self, format, *args):
+            if SERVICE_CONFIG['log_requests']:
+                super().log_message(format, *args)
+
+    return ServiceRequestHandler
+
+def run_service(uid, config, host=None, port=None):
+    """
+    Serve the JSON API until interrupted.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        host (str): Address to listen on (defaults to SERVICE_CONFIG['host'])
+        port (int): Port to listen on (defaults to SERVICE_CONFIG['port'])
+    """
+    service = OdooService(uid, config)
+    service.warm_up()
+
+    server = ThreadingHTTPServer((host or SERVICE_CONFIG['host'], port or SERVICE_CONFIG['port']),
+                                 _make_handler(service))
+    server.daemon_threads = True
+    print(f"Serving on http://{server.server_address[0]}:{server.server_address[1]} (Ctrl+C to stop)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\nStopping service.")
+    finally:
+        server.server_close()
@@ -0,0 +1,331 @@
+"""
+Cache of master data shared by all processes on a host.
+
+Entries live in a SQLite file in WAL mode, so any number of CLI runs, jobs
+and service processes read them concurrently while one of them writes. Each
+entry records a version, when it was last known to be current, and a
+validator: a cheap fingerprint of the data in Odoo, usually the record count
+plus the newest write_date. A new process starts from the stored entries
+instead of reading the data again; an entry past its time-to-live is
+revalidated with the fingerprint and only reloaded when it changed.
+
+When an entry has to be reloaded, the first process takes a short lease on
+it and the others wait for its result instead of sending the same reads.
+Values are stored as JSON, so only plain data (lists, dicts, strings and
+numbers) is shared.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from config import BULK_CONFIG, CACHE_CONFIG
+
+# Stored in PRAGMA user_version; files written with another format are reset
+FORMAT_VERSION = 1
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    instance TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version INTEGER NOT NULL DEFAULT 0,
+    value TEXT,
+    validator TEXT,
+    checked_at REAL NOT NULL DEFAULT 0,
+    loading_until REAL NOT NULL DEFAULT 0,
+    PRIMARY KEY (instance, key)
+);
+"""
+
+def _instance(config):
+    """Name of an Odoo instance in the shared file."""
+    return hashlib.sha1(f"{config['url']}:{config['db_name']}".encode('utf-8')).hexdigest()[:12]
+
+class SharedCache:
+    """
+    SQLite store of cache entries for all Odoo instances used on this host.
+
+    Args:
+        path (str): Cache file
+    """
+
+    def __init__(self, path):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.db = sqlite3.connect(path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        # Entries can always be read again from Odoo, so a lost write after a crash is harmless
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        with self._transaction():
+            if self.db.execute('PRAGMA user_version').fetchone()[0] != FORMAT_VERSION:
+                self.db.execute('DROP TABLE IF EXISTS entries')
+                self.db.execute(f'PRAGMA user_version = {FORMAT_VERSION}')
+            self.db.execute(SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Run statements as one write transaction."""
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+
+    def read(self, instance, key):
+        """
+        Read an entry.
+
+        Returns:
+            dict or None: version, value, validator, checked_at and
+                loading_until of the entry, or None if it was never stored
+        """
+        with self.lock:
+            row = self.db.execute(
+                "SELECT version, value, validator, checked_at, loading_until FROM entries "
+                "WHERE instance = ? AND key = ?", (instance, key)
+            ).fetchone()
+        if not row or not row[0]:
+            return None
+        return {'version': row[0], 'value': json.loads(row[1]),
+                'validator': json.loads(row[2]) if row[2] is not None else None,
+                'checked_at': row[3], 'loading_until': row[4]}
+
+    def write(self, instance, key, value, validator=None):
+        """
+        Store a new version of an entry and release its lease.
+
+        Returns:
+            int: The version stored
+        """
+        value_json = json.dumps(value)
+        validator_json = json.dumps(validator) if validator is not None else None
+        with self._transaction():
+            self.db.execute(
+                "INSERT INTO entries (instance, key) VALUES (?, ?) ON CONFLICT DO NOTHING", (instance, key)
+            )
+            self.db.execute(
+                "UPDATE entries SET version = version + 1, value = ?, validator = ?, checked_at = ?, "
+                "loading_until = 0 WHERE instance = ? AND key = ?",
+                (value_json, validator_json, time.time(), instance, key)
+            )
+            return self.db.execute("SELECT version FROM entries WHERE instance = ? AND key = ?",
+                                   (instance, key)).fetchone()[0]
+
+    def touch(self, instance, key):
+        """Record that an entry was found current."""
+        with self.lock:
+            self.db.execute("UPDATE entries SET checked_at = ? WHERE instance = ? AND key = ?",
+                            (time.time(), instance, key))
+
+    def expire(self, instance, key=None):
+        """Make entries be revalidated on their next read, one key or all of an instance."""
+        with self.lock:
+            if key is None:
+                self.db.execute("UPDATE entries SET checked_at = 0 WHERE instance = ?", (instance,))
+            else:
+                self.db.execute("UPDATE entries SET checked_at = 0 WHERE instance = ? AND key = ?",
+                                (instance, key))
+
+    def claim(self, instance, key, lease):
+        """
+        Take the lease for reloading an entry.
+
+        Returns:
+            bool: True if this process should reload it, False if another
+                process is reloading it already
+        """
+        now = time.time()
+        with self._transaction():
+            row = self.db.execute("SELECT loading_until FROM entries WHERE instance = ? AND key = ?",
+                                  (instance, key)).fetchone()
+            if row and row[0] > now:
+                return False
+            self.db.execute(
+                "INSERT INTO entries (instance, key, loading_until) VALUES (?, ?, ?) "
+                "ON CONFLICT (instance, key) DO UPDATE SET loading_until = excluded.loading_until",
+                (instance, key, now + lease)
+            )
+            return True
+
+    def release(self, instance, key):
+        """Give up the lease of an entry after a failed reload."""
+        with self.lock:
+            self.db.execute("UPDATE entries SET loading_until = 0 WHERE instance = ? AND key = ?",
+                            (instance, key))
+
+_store = None
+_store_failed = False
+_store_lock = threading.Lock()
+
+def get_shared_cache():
+    """
+    Return the shared store of this host, opening it on first use.
+
+    Returns:
+        SharedCache or None: The store, or None if it is disabled or cannot be opened
+    """
+    global _store, _store_failed
+    if not CACHE_CONFIG['shared'] or _store_failed:
+        return None
+    with _store_lock:
+        if _store is None and not _store_failed:
+            path = CACHE_CONFIG['shared_path'] or os.path.join(BULK_CONFIG['checkpoint_dir'], 'shared_cache.db')
+            try:
+                _store = SharedCache(path)
+            except (OSError, sqlite3.Error) as e:
+                print(f"Shared cache disabled, could not open {path}: {str(e)}")
+                _store_failed = True
+        return _store
+
+_NOT_READ = object()
+
+def _read_fingerprint(validator):
+    """Run a validator; None if it failed, which makes the entry count as changed."""
+    try:
+        return validator()
+    except Exception:
+        return None
+
+def load_shared(config, key, loader, ttl, validator=None):
+    """
+    Return a value from the shared store, reloading it only when it changed.
+
+    An entry checked less than ttl seconds ago is returned as is. An older one
+    is returned when the validator still gives the stored fingerprint.
+    Otherwise one process reloads it while the others wait for its result, up
+    to CACHE_CONFIG['shared_lease'] seconds.
+
+    Args:
+        config (dict): Configuration dictionary with Odoo connection parameters
+        key (str): Name of the value, e.g. 'stock.warehouse'
+        loader (callable): Function without arguments that reads the value from Odoo
+        ttl (float): Seconds an entry is used without revalidating it
+        validator (callable): Function without arguments returning a JSON
+            serializable fingerprint of the data in Odoo
+
+    Returns:
+        tuple: (value, age) where age is the number of seconds since the
+            value was last known to be current
+    """
+    store = get_shared_cache()
+    if store is None:
+        return loader(), 0.0
+
+    instance = _instance(config)
+    lease = CACHE_CONFIG['shared_lease']
+    give_up = time.time() + lease
+    fingerprint = _NOT_READ
+    validated_version = None
+
+    try:
+        while True:
+            entry = store.read(instance, key)
+            if entry:
+                age = time.time() - entry['checked_at']
+                if age < ttl:
+                    return entry['value'], age
+                if validator and entry['validator'] is not None and entry['version'] != validated_version:
+                    if fingerprint is _NOT_READ:
+                        fingerprint = _read_fingerprint(validator)
+                    validated_version = entry['version']
+                    if fingerprint is not None and fingerprint == entry['validator']:
+                        store.touch(instance, key)
+                        return entry['value'], 0.0
+            if time.time() >= give_up or store.claim(instance, key, lease):
+                break
+            time.sleep(0.1)
+    except sqlite3.Error as e:
+        print(f"Shared cache read failed for {key}: {str(e)}")
+        return loader(), 0.0
+
+    try:
+        # Fingerprint before loading, so changes made during the load are caught next time
+        if validator and fingerprint is _NOT_READ:
+            fingerprint = _read_fingerprint(validator)
+        value = loader()
+    except BaseException:
+        with contextlib.suppress(sqlite3.Error):
+            store.release(instance, key)
+        raise
+
+    try:
+        store.write(instance, key, value, None if fingerprint is _NOT_READ else fingerprint)
+    except (TypeError, ValueError):
+        # Not plain data; keep it in this process only
+        with contextlib.suppress(sqlite3.Error):
+            store.release(instance, key)
+    except sqlite3.Error as e:
+        print(f"Shared cache write failed for {key}: {str(e)}")
+    return value, 0.0
+
+def read_shared(config, key):
+    """
+    Read a value from the shared store without loading it.
+
+    Returns:
+        tuple: (value, age) where age is the number of seconds since the value
+            was last known to be current, or (None, None) if it is not stored
+    """
+    store = get_shared_cache()
+    if store is not None:
+        try:
+            entry = store.read(_instance(config), key)
+        except sqlite3.Error as e:
+            print(f"Shared cache read failed for {key}: {str(e)}")
+            entry = None
+        if entry:
+            return entry['value'], time.time() - entry['checked_at']
+    return None, None
+
+def store_shared(config, key, value, validator=None):
+    """Store a value in the shared store, replacing the current version."""
+    store = get_shared_cache()
+    if store is not None:
+        try:
+            store.write(_instance(config), key, value, validator)
+        except (TypeError, ValueError, sqlite3.Error) as e:
+            print(f"Shared cache write failed for {key}: {str(e)}")
+
+def expire_shared(config, key=None):
+    """Make shared entries of an Odoo instance be revalidated on their next read."""
+    store = get_shared_cache()
+    if store is not None:
+        with contextlib.suppress(sqlite3.Error):
+            store.expire(_instance(config), key)
+
+def model_validator(uid, config, model, domain=None):
+    """
+    Fingerprint of the records of a model: their count and newest write_date.
+
+    Creating, archiving or deleting a record changes the count, and editing
+    one moves the newest write_date, so one small read tells whether data
+    read from the model is still current (see cache_validation.probe_model).
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        model (str): Model name, e.g. 'stock.warehouse'
+        domain (list): Search domain of the data (defaults to all records)
+
+    Returns:
+        callable: Function without arguments returning [count, newest write_date]
+    """
+    def fingerprint():
+        from cache_validation import probe_model
+        return probe_model(uid, config, model, domain)
+
+    return fingerprint
+
+def schema_validator(uid, config, model):
+    """Fingerprint of the fields of a model, for values derived from fields_get."""
+    return model_validator(uid, config, 'ir.model.fields', [['model', '=', model]])
+
+def modules_validator(uid, config):
+    """Fingerprint of the installed modules, for values that depend on which apps are installed."""
+    return model_validator(uid, config, 'ir.module.module', [['state', '=', 'installed']])
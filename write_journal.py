@@ -0,0 +1,461 @@
+"""
+Local journal of writes waiting to be sent to Odoo.
+
+Sales orders and stock additions can be written to a SQLite journal (in WAL
+mode, so a write is one short local transaction) and are sent to Odoo later
+by a background flusher. The flusher replays queued operations in bulk:
+orders with one multi-record create and one confirm call per batch, stock
+additions summed per product and location with grouped quant writes.
+
+Every operation has an idempotency key. For orders it is stored as the
+order's client_order_ref, so an order whose create may or may not have
+reached Odoo is looked up before it is sent again. Stock additions have no
+such field: a batch that failed after one of its writes went out is flagged
+for review instead of being replayed, so stock is never added twice.
+
+Any number of processes may queue operations, but only the holder of the
+journal's flush lease sends them, so two processes never replay the same
+order. Operations left half sent are settled only by the lease holder, once
+they are older than the lease, so a process starting up does not take over
+the batch another process is sending.
+"""
+import contextlib
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+import xmlrpc.client
+from bulk_operations import chunked, create_records
+from config import BULK_CONFIG, JOURNAL_CONFIG
+from connection import get_model_connection, is_connection_error, track_writes
+from inventory_operations import add_stock_batch, invalidate_product_availability
+from request_scheduler import PRIORITY_BULK, request_priority
+
+# Operation states
+QUEUED = 'queued'
+SENDING = 'sending'
+DONE = 'done'
+FAILED = 'failed'
+REVIEW = 'review'
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS operations (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    key TEXT NOT NULL UNIQUE,
+    kind TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    result TEXT,
+    error TEXT,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS operations_state ON operations (state, id);
+CREATE TABLE IF NOT EXISTS flush_lease (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    owner TEXT NOT NULL,
+    lease_until REAL NOT NULL
+);
+"""
+
+def _order_line_vals(line):
+    """Order line values of a journaled [product_id, quantity, optional price_unit] line."""
+    vals = {'product_id': line[0], 'product_uom_qty': line[1]}
+    if len(line) > 2:
+        vals['price_unit'] = line[2]
+    return vals
+
+class WriteJournal:
+    """
+    SQLite journal of operations for one Odoo instance.
+
+    Args:
+        config (dict): Configuration dictionary with Odoo connection parameters
+        path (str): Journal file (defaults to a file under BULK_CONFIG['checkpoint_dir'])
+    """
+
+    def __init__(self, config, path=None):
+        instance = hashlib.sha1(f"{config['url']}:{config['db_name']}".encode('utf-8')).hexdigest()[:12]
+        self.path = path or os.path.join(BULK_CONFIG['checkpoint_dir'], 'write_journal', f"{instance}.db")
+        os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.db = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=10)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=FULL')
+        self.db.executescript(SCHEMA)
+
+    @contextlib.contextmanager
+    def _transaction(self):
+        """Run statements as one transaction, so a batch costs a single sync to disk."""
+        with self.lock:
+            self.db.execute('BEGIN IMMEDIATE')
+            try:
+                yield self.db
+            except BaseException:
+                self.db.execute('ROLLBACK')
+                raise
+            self.db.execute('COMMIT')
+
+    def acquire_flush_lease(self):
+        """
+        Take or renew the lease for sending this journal's operations.
+
+        The lease lasts JOURNAL_CONFIG['flush_lease'] seconds and is renewed
+        before every batch. Whoever holds it also settles operations left
+        half sent for longer than the lease, by a process that died or lost
+        its lease.
+
+        Returns:
+            bool: True if this process may flush, False if another one holds the lease
+        """
+        lease = JOURNAL_CONFIG['flush_lease']
+        with self._transaction():
+            now = time.time()
+            row = self.db.execute("SELECT owner, lease_until FROM flush_lease WHERE id = 1").fetchone()
+            if row and row[0] != self.owner and row[1] > now:
+                return False
+            self.db.execute(
+                "INSERT INTO flush_lease (id, owner, lease_until) VALUES (1, ?, ?) "
+                "ON CONFLICT (id) DO UPDATE SET owner = excluded.owner, lease_until = excluded.lease_until",
+                (self.owner, now + lease)
+            )
+            self._recover(now - lease)
+        return True
+
+    def release_flush_lease(self):
+        """Give up the flush lease, if held, so another process can take over at once."""
+        with self.lock:
+            self.db.execute("DELETE FROM flush_lease WHERE id = 1 AND owner = ?", (self.owner,))
+
+    def _recover(self, abandoned_before):
+        """Settle operations left half sent since before the given time; runs inside the lease transaction."""
+        now = time.time()
+        # Orders are looked up by their key before being created again
+        self.db.execute("UPDATE operations SET state = ?, updated_at = ? "
+                        "WHERE state = ? AND kind = 'sale_order' AND updated_at < ?",
+                        (QUEUED, now, SENDING, abandoned_before))
+        self.db.execute("UPDATE operations SET state = ?, error = ?, updated_at = ? WHERE state = ? AND updated_at < ?",
+                        (REVIEW, "Interrupted while sending; check Odoo before requeuing", now, SENDING,
+                         abandoned_before))
+
+    def enqueue(self, kind, payload, key=None):
+        """
+        Record an operation to send to Odoo.
+
+        Args:
+            kind (str): 'sale_order' or 'stock_add'
+            payload (dict): Values of the operation (JSON serializable)
+            key (str): Idempotency key; an operation with a key already in the
+                journal is not recorded again
+
+        Returns:
+            str: The idempotency key of the operation
+        """
+        key = key or uuid.uuid4().hex
+        now = time.time()
+        with self.lock:
+            self.db.execute(
+                "INSERT OR IGNORE INTO operations (key, kind, payload, state, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (key, kind, json.dumps(payload), QUEUED, now, now)
+            )
+        self.wake.set()
+        return key
+
+    def counts(self):
+        """Number of operations per state."""
+        with self.lock:
+            return dict(self.db.execute("SELECT state, COUNT(*) FROM operations GROUP BY state").fetchall())
+
+    def operations(self, states, limit=100):
+        """
+        List operations in the given states, oldest first.
+
+        Returns:
+            list: Dicts with key, kind, payload, state, attempts, result and error
+        """
+        placeholders = ', '.join('?' * len(states))
+        with self.lock:
+            rows = self.db.execute(
+                f"SELECT key, kind, payload, state, attempts, result, error FROM operations "
+                f"WHERE state IN ({placeholders}) ORDER BY id LIMIT ?",
+                list(states) + [limit]
+            ).fetchall()
+        return [{'key': key, 'kind': kind, 'payload': json.loads(payload), 'state': state, 'attempts': attempts,
+                 'result': json.loads(result) if result else None, 'error': error}
+                for key, kind, payload, state, attempts, result, error in rows]
+
+    def requeue(self, keys):
+        """Queue operations again, e.g. flagged ones checked in Odoo."""
+        with self._transaction():
+            self.db.executemany("UPDATE operations SET state = ?, error = NULL, updated_at = ? WHERE key = ?",
+                                [(QUEUED, time.time(), key) for key in keys])
+        self.wake.set()
+
+    def _claim(self, kind, limit):
+        """Mark the oldest queued operations of a kind as being sent and return them."""
+        with self._transaction():
+            rows = self.db.execute(
+                "SELECT key, payload FROM operations WHERE state = ? AND kind = ? ORDER BY id LIMIT ?",
+                (QUEUED, kind, limit)
+            ).fetchall()
+            self.db.executemany("UPDATE operations SET state = ?, attempts = attempts + 1, updated_at = ? WHERE key = ?",
+                                [(SENDING, time.time(), key) for key, _ in rows])
+        return [(key, json.loads(payload)) for key, payload in rows]
+
+    def _settle(self, outcomes):
+        """Record the outcome of sent operations: {key: (state, result, error)}."""
+        now = time.time()
+        with self._transaction():
+            self.db.executemany(
+                "UPDATE operations SET state = ?, result = ?, error = ?, updated_at = ? WHERE key = ?",
+                [(state, json.dumps(result) if result is not None else None, error, now, key)
+                 for key, (state, result, error) in outcomes.items()]
+            )
+
+    def flush(self, uid, config):
+        """
+        Send all queued operations to Odoo in batches, if this process holds the flush lease.
+
+        Returns:
+            dict or None: Number of operations per outcome ('done', 'failed',
+                'review', 'queued'), or None if another process is flushing the journal
+
+        Raises:
+            Exception: The connection error that stopped the flush; operations
+                not yet sent stay queued
+        """
+        summary = {DONE: 0, FAILED: 0, REVIEW: 0, QUEUED: 0}
+        batch_size = JOURNAL_CONFIG['batch_size']
+        if not self.acquire_flush_lease():
+            return None
+        with request_priority(PRIORITY_BULK):
+            for kind, replay in (('sale_order', self._replay_orders), ('stock_add', self._replay_stock)):
+                while True:
+                    if not self.acquire_flush_lease():
+                        return summary
+                    batch = self._claim(kind, batch_size)
+                    if not batch:
+                        break
+                    try:
+                        with track_writes() as writes:
+                            outcomes = replay(uid, config, batch)
+                    except Exception as e:
+                        self._settle(self._unsent_outcomes(kind, batch, e, writes.sent))
+                        raise
+                    self._settle(outcomes)
+                    for state, _, _ in outcomes.values():
+                        summary[state] += 1
+        return summary
+
+    def _unsent_outcomes(self, kind, batch, error, writes_sent):
+        """Outcomes of a batch whose replay failed part way, after writes_sent write requests."""
+        # Orders are looked up by key next time, so they can always be queued again.
+        # Stock additions are only safe to resend if the server never got a write of the batch.
+        if kind == 'sale_order' or (not writes_sent and is_connection_error(error)):
+            return {key: (QUEUED, None, str(error)) for key, _ in batch}
+        if writes_sent:
+            return {key: (REVIEW, None, f"Unknown whether it was applied: {error}") for key, _ in batch}
+        return {key: (FAILED, None, str(error)) for key, _ in batch}
+
+    def _replay_orders(self, uid, config, batch):
+        """Create the orders of a batch that are not in Odoo yet, then confirm them."""
+        models = get_model_connection(config['url'])
+        outcomes = {}
+
+        existing = {
+            order['client_order_ref']: order
+            for order in models.execute_kw(
+                config['db_name'], uid, config['password'],
+                'sale.order', 'search_read',
+                [[['client_order_ref', 'in', [key for key, _ in batch]]]],
+                {'fields': ['id', 'name', 'state', 'client_order_ref']}
+            )
+        }
+
+        to_create = []
+        to_confirm = []
+        for key, payload in batch:
+            order = existing.get(key)
+            if order:
+                if payload.get('confirm', True) and order['state'] in ('draft', 'sent'):
+                    to_confirm.append((key, order['id']))
+                outcomes[key] = (DONE, {'id': order['id']}, None)
+                continue
+            vals = {
+                'partner_id': payload['customer_id'],
+                'client_order_ref': key,
+                'date_order': payload['date_order'],
+                'order_line': [(0, 0, _order_line_vals(line)) for line in payload['lines']],
+            }
+            for field in ('warehouse_id', 'pricelist_id'):
+                if payload.get(field):
+                    vals[field] = payload[field]
+            to_create.append((key, payload, vals))
+
+        for chunk in chunked(to_create, JOURNAL_CONFIG['batch_size']):
+            created = create_records(models, config, uid, 'sale.order', [vals for _, _, vals in chunk])
+            for (key, payload, _), (order_id, error) in zip(chunk, created):
+                if error:
+                    outcomes[key] = (FAILED, None, error)
+                    continue
+                outcomes[key] = (DONE, {'id': order_id}, None)
+                if payload.get('confirm', True):
+                    to_confirm.append((key, order_id))
+
+        if to_confirm:
+            try:
+                models.execute_kw(
+                    config['db_name'], uid, config['password'],
+                    'sale.order', 'action_confirm',
+                    [[order_id for _, order_id in to_confirm]]
+                )
+            except xmlrpc.client.Fault:
+                # One order that cannot be confirmed fails the call; confirm the others one by one
+                for key, order_id in to_confirm:
+                    try:
+                        models.execute_kw(
+                            config['db_name'], uid, config['password'],
+                            'sale.order', 'action_confirm',
+                            [[order_id]]
+                        )
+                    except xmlrpc.client.Fault as e:
+                        outcomes[key] = (DONE, {'id': order_id}, f"Created but not confirmed: {e.faultString.strip().splitlines()[-1]}")
+
+        invalidate_product_availability(config, list({line[0] for _, payload in batch for line in payload['lines']}))
+        return outcomes
+
+    def _replay_stock(self, uid, config, batch):
+        """Add the stock of a batch, summed per product and location."""
+        results = add_stock_batch(uid, config, [(key, payload['product_id'], payload['location_id'], payload['quantity'])
+                                                for key, payload in batch])
+        return {key: (FAILED, None, error) if error else (DONE, {'quant_id': quant_id}, None)
+                for key, (quant_id, error) in results.items()}
+
+class JournalFlusher(threading.Thread):
+    """
+    Background thread sending queued journal operations to Odoo.
+
+    It flushes when operations are added and every JOURNAL_CONFIG['flush_interval']
+    seconds, and backs off while Odoo cannot be reached.
+
+    Args:
+        uid (int): User ID for authentication
+        config (dict): Configuration dictionary with Odoo connection parameters
+        journal (WriteJournal): Journal to flush
+    """
+
+    def __init__(self, uid, config, journal):
+        super().__init__(name='write-journal-flusher', daemon=True)
+        self.uid = uid
+        self.config = config
+        self.journal = journal
+        self.stopping = threading.Event()
+
+    def run(self):
+        delay = JOURNAL_CONFIG['flush_interval']
+        while not self.stopping.is_set():
+            self.journal.wake.clear()
+            try:
+                summary = self.journal.flush(self.uid, self.config)
+                if summary and any(summary[state] for state in (DONE, FAILED, REVIEW)):
+                    print(f"\n[journal] Sent {summary[DONE]} queued writes to Odoo"
+                          f"{f', {summary[FAILED]} failed' if summary[FAILED] else ''}"
+                          f"{f', {summary[REVIEW]} need review' if summary[REVIEW] else ''}")
+                delay = JOURNAL_CONFIG['flush_interval']
+            except Exception as e:
+                delay = min(delay * 2, JOURNAL_CONFIG['max_backoff'])
+                if not is_connection_error(e):
+                    print(f"\n[journal] Error sending queued writes: {str(e)}")
+                self.journal.wake.clear()
+            self.journal.wake.wait(delay)
+
+    def stop(self, timeout=10):
+        """Stop the thread after its current flush and hand the flush lease on."""
+        self.stopping.set()
+        self.journal.wake.set()
+        self.join(timeout)
+        if not self.is_alive():
+            self.journal.release_flush_lease()
+
+_journals = {}
+_flushers = {}
+_journals_lock = threading.Lock()
+
+def get_write_journal(config):
+    """Return the shared journal of an Odoo instance, opening it on first use."""
+    instance = (config['url'], config['db_name'])
+    with _journals_lock:
+        if instance not in _journals:
+            _journals[instance] = WriteJournal(config)
+        return _journals[instance]
+
+def start_journal_flusher(uid, config):
+    """
+    Start the background flusher of an Odoo instance's journal (once).
+
+    Returns:
+        JournalFlusher: The running flusher
+    """
+    journal = get_write_journal(config)
+    counts = journal.counts()
+    if counts.get(QUEUED) or counts.get(REVIEW):
+        print(f"Write journal: {counts.get(QUEUED, 0)} queued, {counts.get(REVIEW, 0)} need review")
+    instance = (config['url'], config['db_name'])
+    with _journals_lock:
+        flusher = _flushers.get(instance)
+        if flusher is None or not flusher.is_alive():
+            flusher = _flushers[instance] = JournalFlusher(uid, config, journal)
+            flusher.start()
+    return flusher
+
+def stop_journal_flusher(config):
+    """Stop the background flusher of an Odoo instance, if running."""
+    with _journals_lock:
+        flusher = _flushers.pop((config['url'], config['db_name']), None)
+    if flusher:
+        flusher.stop()
+
+def queue_sale_order(config, customer_id, basket, warehouse_id=None, pricelist_id=None, confirm=True, key=None):
+    """
+    Record a sales order in the journal without waiting for Odoo.
+
+    Args:
+        config (dict): Configuration dictionary with Odoo connection parameters
+        customer_id (int): Customer ID for the sale
+        basket (list): List of (product_id, quantity) or (product_id, quantity,
+            price_unit) tuples; lines without a price are priced by Odoo
+        warehouse_id (int): Warehouse ID for the sale
+        pricelist_id (int): Pricelist of the order
+        confirm (bool): Confirm the order once it is created
+        key (str): Idempotency key, stored as the order's customer reference
+
+    Returns:
+        str: The idempotency key of the queued order
+    """
+    payload = {
+        'customer_id': int(customer_id),
+        'lines': [[int(line[0]), float(line[1])] + ([float(line[2])] if len(line) > 2 and line[2] is not None else [])
+                  for line in basket],
+        'warehouse_id': int(warehouse_id) if warehouse_id else None,
+        'pricelist_id': int(pricelist_id) if pricelist_id else None,
+        'confirm': confirm,
+        'date_order': time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime()),
+    }
+    return get_write_journal(config).enqueue('sale_order', payload, key)
+
+def queue_stock_addition(config, product_id, location_id, quantity, key=None):
+    """
+    Record a stock addition in the journal without waiting for Odoo.
+
+    Returns:
+        str: The idempotency key of the queued addition
+    """
+    payload = {'product_id': int(product_id), 'location_id': int(location_id), 'quantity': float(quantity)}
+    return get_write_journal(config).enqueue('stock_add', payload, key)